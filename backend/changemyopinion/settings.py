@@ -46,13 +46,16 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'opinions_app.middleware.MetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
+    'opinions_app.middleware.GZipMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'opinions_app.middleware.ProfilingMiddleware',
 ]
 
 ROOT_URLCONF = 'changemyopinion.urls'
@@ -91,6 +94,259 @@ DATABASES = {
 }
 
 
+# Database connections
+# DB_CONNECTIONS is 'per-request' to open and close a connection for every
+# request, 'persistent' to keep each thread's connection open across requests,
+# or 'pool' to share a pool of connections between the threads of a process
+# (requires psycopg 3: pip install "psycopg[pool]"). Persistent and pooled
+# connections are checked before reuse and replaced after DB_CONN_MAX_AGE
+# seconds, so a server restart or failover costs no failed requests and
+# server-side memory does not grow without bound.
+
+DB_CONNECTIONS = os.getenv('DB_CONNECTIONS', 'persistent')
+DB_CONN_MAX_AGE = int(os.getenv('DB_CONN_MAX_AGE', '300'))
+
+DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+if DB_CONNECTIONS == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = DB_CONN_MAX_AGE
+elif DB_CONNECTIONS == 'pool':
+    DATABASES['default']['OPTIONS'] = {
+        'pool': {
+            'min_size': int(os.getenv('DB_POOL_MIN_SIZE', '2')),
+            # Enough for the async query threads plus the request threads
+            'max_size': int(os.getenv('DB_POOL_MAX_SIZE', '32')),
+            'max_lifetime': DB_CONN_MAX_AGE,
+            'timeout': float(os.getenv('DB_POOL_TIMEOUT', '10')),  # Seconds a request waits for a free connection
+        },
+    }
+
+# With DB_REPLICA_HOST set, read-only views read from that replica of the
+# database; the other connection settings default to the primary's. See
+# opinions_app/routers.py.
+
+if os.getenv('DB_REPLICA_HOST'):
+    DATABASES['replica'] = {
+        **DATABASES['default'],
+        'NAME': os.getenv('DB_REPLICA_NAME', DATABASES['default']['NAME']),
+        'USER': os.getenv('DB_REPLICA_USER', DATABASES['default']['USER']),
+        'PASSWORD': os.getenv('DB_REPLICA_PASSWORD', DATABASES['default']['PASSWORD']),
+        'HOST': os.getenv('DB_REPLICA_HOST'),
+        'PORT': os.getenv('DB_REPLICA_PORT', DATABASES['default']['PORT']),
+        'TEST': {'MIRROR': 'default'},
+    }
+
+DATABASE_ROUTERS = ['opinions_app.routers.ReplicaRouter']
+
+
+# Caches
+# https://docs.djangoproject.com/en/5.1/topics/cache/
+# Cached responses are invalidated from model signals, so with more than one
+# server process the cache must be shared: set REDIS_URL in production.
+
+if os.getenv('REDIS_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('REDIS_URL'),
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
+    }
+
+RESPONSE_CACHE_ENABLED = os.getenv('RESPONSE_CACHE_ENABLED', 'true').lower() == 'true'
+
+
+# Votes
+# With VOTE_WRITE_BEHIND on, vote counts of hot posts (more than VOTE_HOT_THRESHOLD
+# votes within VOTE_FLUSH_INTERVAL seconds) are buffered in memory and flushed in
+# batches instead of locking the post row on every vote. See opinions_app/votes.py.
+
+VOTE_WRITE_BEHIND = os.getenv('VOTE_WRITE_BEHIND', 'false').lower() == 'true'
+VOTE_HOT_THRESHOLD = int(os.getenv('VOTE_HOT_THRESHOLD', '20'))
+VOTE_FLUSH_INTERVAL = float(os.getenv('VOTE_FLUSH_INTERVAL', '1.0'))
+VOTE_FLUSH_MAX_PENDING = int(os.getenv('VOTE_FLUSH_MAX_PENDING', '1000'))
+
+
+# Home timelines
+# Posts are pushed into follower timelines after the write commits, on
+# TIMELINE_FANOUT_THREADS background threads per process, except for authors with
+# more than TIMELINE_FANOUT_LIMIT followers, whose posts are merged in at read time.
+# See opinions_app/timeline.py.
+
+TIMELINE_FANOUT_LIMIT = int(os.getenv('TIMELINE_FANOUT_LIMIT', '5000'))
+TIMELINE_MAX_LENGTH = int(os.getenv('TIMELINE_MAX_LENGTH', '800'))  # Enforced by `manage.py trim_timelines`
+TIMELINE_BACKFILL = int(os.getenv('TIMELINE_BACKFILL', '20'))  # Recent posts copied in on follow
+TIMELINE_FANOUT_THREADS = int(os.getenv('TIMELINE_FANOUT_THREADS', '2'))
+
+
+# Async views
+# Served by asgi.py under /api/async/. Independent queries of one request run
+# in parallel on this many threads per process, each with its own connection.
+# See opinions_app/async_views.py.
+
+ASYNC_QUERY_THREADS = int(os.getenv('ASYNC_QUERY_THREADS', '16'))
+
+
+# Live events
+# Clients subscribe to a post or prompt with Server-Sent Events (ASGI only) and
+# are pushed new replies, posts and vote counts. EVENT_BROKER is 'local' for a
+# single server process or 'postgres' to fan out across processes with
+# LISTEN/NOTIFY. See opinions_app/events.py.
+
+EVENT_BROKER = os.getenv('EVENT_BROKER', 'local')
+EVENT_QUEUE_SIZE = int(os.getenv('EVENT_QUEUE_SIZE', '100'))  # Per client; a client that falls further behind must resync
+EVENT_HEARTBEAT = float(os.getenv('EVENT_HEARTBEAT', '15'))  # Seconds between keep-alive comments on an idle stream
+
+
+# Search
+# Ranked searches expected to match more than SEARCH_RANK_EXACT rows score only
+# the SEARCH_RANK_WINDOW most recent matches, so a search for a very common word
+# stays fast. See opinions_app/search.py.
+
+SEARCH_RANK_EXACT = int(os.getenv('SEARCH_RANK_EXACT', '20000'))
+SEARCH_RANK_WINDOW = int(os.getenv('SEARCH_RANK_WINDOW', '300'))
+
+
+# Daily prompt
+# /api/daily/ is served from the response cache for up to DAILY_CACHE_TTL seconds
+# without being invalidated by votes or new posts, which would otherwise empty it
+# many times a second. Clients get live counts from the prompt's event stream.
+# See opinions_app/daily.py.
+
+DAILY_CACHE_TTL = int(os.getenv('DAILY_CACHE_TTL', '10'))
+
+
+# Batch writes
+# Most votes, replies and follow changes one POST /api/batch/ may carry. They are
+# applied in a single transaction. See opinions_app/batch.py.
+
+BATCH_MAX_ITEMS = int(os.getenv('BATCH_MAX_ITEMS', '500'))
+
+
+# Response formats
+# Besides JSON, DRF views render columnar JSON (the keys of a list of objects
+# once, then an array of values per object) for clients that send
+# `Accept: application/vnd.flare.columnar+json` or `?format=columnar`, and
+# responses are gzipped for clients that accept it. See opinions_app/renderers.py.
+
+REST_FRAMEWORK = {
+    'DEFAULT_RENDERER_CLASSES': [
+        'rest_framework.renderers.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+        'opinions_app.renderers.ColumnarJSONRenderer',
+    ],
+    # See "Rate limits" below
+    'DEFAULT_THROTTLE_CLASSES': [
+        'opinions_app.throttling.IPThrottle',
+        'opinions_app.throttling.UserThrottle',
+    ],
+}
+
+
+# Rate limits
+# Writes to views with a `throttle_scope` are limited per client IP and per
+# acting user with token buckets. A rate of "N/period" lets a client send N
+# requests at once, then N per period; None means no limit. Throttled requests
+# get a 429 with Retry-After. THROTTLE_BACKEND is 'local' to keep the buckets in
+# each server process's memory (fastest; the limits then apply per process) or
+# 'cache' to share them through the cache (see Caches above). See
+# opinions_app/throttling.py.
+
+THROTTLE_ENABLED = os.getenv('THROTTLE_ENABLED', 'true').lower() == 'true'
+THROTTLE_BACKEND = os.getenv('THROTTLE_BACKEND', 'local')
+THROTTLE_RATES = {
+    # Scope: (per client IP, per user)
+    'vote': ('300/min', '60/min'),
+    'write': ('120/min', '30/min'),  # Posts, replies, prompts and follows
+    'batch': ('30/min', None),  # Per request; each item is also charged to 'vote' or 'write'
+    'login': ('30/min', '10/min'),  # Per username
+    'register': ('10/hour', None),
+    'avatar': ('20/hour', None),
+}
+
+
+# Metrics
+# Every request's latency, query count and time, render time and response size
+# are recorded per URL name and served in Prometheus' format at /api/metrics/.
+# Queries slower than METRICS_SLOW_QUERY seconds are logged, and so are
+# statements one request runs METRICS_REPEATED_QUERY times or more, which is
+# usually a query per row of a list (N+1). See opinions_app/metrics.py.
+
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+METRICS_SLOW_QUERY = float(os.getenv('METRICS_SLOW_QUERY', '0.1'))
+METRICS_REPEATED_QUERY = int(os.getenv('METRICS_REPEATED_QUERY', '10'))
+
+
+# Profiling
+# Requests with `X-Profile: <PROFILE_SECRET>` (any value from a staff user
+# signed in to the admin), and a random PROFILE_SAMPLE_RATE fraction of all
+# requests, are profiled into PROFILE_DIR/<URL name>/, which keeps the newest
+# PROFILE_KEEP profiles of each view. PROFILE_FORMAT is 'collapsed' (sampled
+# stacks for flame graphs, every PROFILE_INTERVAL seconds) or 'pstats'
+# (cProfile); `X-Profile-Format` overrides it per request. With no secret and
+# a rate of 0 only staff can profile. See opinions_app/profiling.py.
+
+PROFILE_SECRET = os.getenv('PROFILE_SECRET', '')
+PROFILE_SAMPLE_RATE = float(os.getenv('PROFILE_SAMPLE_RATE', '0'))
+PROFILE_FORMAT = os.getenv('PROFILE_FORMAT', 'collapsed')
+PROFILE_INTERVAL = float(os.getenv('PROFILE_INTERVAL', '0.005'))
+PROFILE_DIR = os.getenv('PROFILE_DIR', BASE_DIR / 'profiles')
+PROFILE_KEEP = int(os.getenv('PROFILE_KEEP', '50'))
+
+
+# Avatars
+# Profile pictures uploaded to /api/user/<id>/avatar/ are stored once per
+# content under MEDIA_ROOT/avatars/, as square WebP thumbnails of each of
+# AVATAR_SIZES pixels made by AVATAR_WORKERS processes. Embedded authors get
+# the first size and user payloads the second, with every size in
+# ProfilePictureSizes. The files never change: serve MEDIA_ROOT with a
+# far-future Cache-Control. See opinions_app/avatars.py.
+
+MEDIA_ROOT = os.getenv('MEDIA_ROOT', BASE_DIR / 'media')
+MEDIA_URL = os.getenv('MEDIA_URL', '/media/')
+AVATAR_SIZES = (96, 256, 512)  # Pictures uploaded before a change have only the old sizes
+AVATAR_MAX_BYTES = int(os.getenv('AVATAR_MAX_BYTES', str(10 * 1024 * 1024)))
+AVATAR_MAX_PIXELS = int(os.getenv('AVATAR_MAX_PIXELS', str(40_000_000)))
+AVATAR_WORKERS = int(os.getenv('AVATAR_WORKERS', '2'))
+
+
+# Recommendations
+# /api/user/<id>/recommendations/ serves lists of prompts and posts precomputed
+# by `manage.py refresh_recommendations`, run nightly from cron. Each run
+# updates the users with new activity and rescores those whose lists are older
+# than RECOMMEND_MAX_AGE_DAYS. Posts are picked from the RECOMMEND_CANDIDATES
+# best-trending posts of the last RECOMMEND_POST_DAYS days, and older activity
+# counts half as much every RECOMMEND_HALF_LIFE_DAYS days.
+# See opinions_app/recommendations.py.
+
+RECOMMEND_POSTS = int(os.getenv('RECOMMEND_POSTS', '100'))  # Stored per user
+RECOMMEND_PROMPTS = int(os.getenv('RECOMMEND_PROMPTS', '20'))
+RECOMMEND_CATEGORIES = int(os.getenv('RECOMMEND_CATEGORIES', '3'))
+RECOMMEND_POST_DAYS = int(os.getenv('RECOMMEND_POST_DAYS', '7'))
+RECOMMEND_CANDIDATES = int(os.getenv('RECOMMEND_CANDIDATES', '20000'))
+RECOMMEND_HALF_LIFE_DAYS = float(os.getenv('RECOMMEND_HALF_LIFE_DAYS', '30'))
+RECOMMEND_MAX_AGE_DAYS = int(os.getenv('RECOMMEND_MAX_AGE_DAYS', '7'))
+RECOMMEND_BATCH_SIZE = int(os.getenv('RECOMMEND_BATCH_SIZE', '500'))  # Users scored at once; memory is about 80 bytes per user per candidate
+
+
+# Analytics
+# /api/posts/<id>/stance/, /api/prompt/<id>/stance/ and
+# /api/prompts/category/<name>/stance/ serve hourly or daily trends of posts,
+# agree/disagree replies and votes, read from rollups that writes keep up to
+# date. Hourly buckets are kept for ANALYTICS_HOURLY_DAYS days, and a trend
+# covers at most ANALYTICS_MAX_BUCKETS buckets. Backfill the rollups with
+# `manage.py rebuild_analytics`, and drop expired hourly buckets nightly with
+# `manage.py rebuild_analytics --prune`. See opinions_app/analytics.py.
+
+ANALYTICS_HOURLY_DAYS = int(os.getenv('ANALYTICS_HOURLY_DAYS', '14'))
+ANALYTICS_MAX_BUCKETS = int(os.getenv('ANALYTICS_MAX_BUCKETS', '366'))
+ANALYTICS_CACHE_TTL = int(os.getenv('ANALYTICS_CACHE_TTL', '60'))  # Writes invalidate cached trends; expiry moves them on to new buckets
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
 
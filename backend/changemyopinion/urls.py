@@ -1,8 +1,11 @@
 # project_name/urls.py
+from django.conf import settings
+from django.conf.urls.static import static
 from django.contrib import admin
 from django.urls import path, include
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('api/async/', include('opinions_app.async_urls')),  # Async read endpoints, for ASGI deployments
     path('api/', include('opinions_app.urls')),  # Include the posts API URLs
-]
+] + static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)  # Uploaded avatars, served by Django only with DEBUG on
@@ -18,14 +18,23 @@ DROP TABLE IF EXISTS users CASCADE;
 DROP TABLE IF EXISTS posts CASCADE;
 DROP TABLE IF EXISTS replies CASCADE;
 DROP TABLE IF EXISTS prompts CASCADE;
+DROP TABLE IF EXISTS votes CASCADE;
+DROP TABLE IF EXISTS follows CASCADE;
+DROP TABLE IF EXISTS timelines CASCADE;
+DROP TABLE IF EXISTS user_stats CASCADE;
+DROP TABLE IF EXISTS daily_prompts CASCADE;
+DROP TABLE IF EXISTS daily_responses CASCADE;
 """
 
 CREATE_PROMPTS_TABLE = """
 CREATE TABLE IF NOT EXISTS prompts (
     promptid SERIAL PRIMARY KEY,
     prompt_text TEXT,
-    Category TEXT
+    Category TEXT,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', COALESCE(prompt_text, ''))) STORED
 );
+CREATE INDEX IF NOT EXISTS prompts_search_idx ON prompts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS prompts_category_idx ON prompts (category, promptid);
 """
 
 CREATE_USERS_TABLE = """
@@ -38,7 +47,8 @@ CREATE TABLE IF NOT EXISTS users (
     join_date TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
     bio TEXT,
     reply_points INTEGER DEFAULT 0,
-    followers INTEGER[] DEFAULT '{}'  -- Array of follower IDs
+    follower_count INTEGER DEFAULT 0,  -- Maintained alongside the follows table
+    following_count INTEGER DEFAULT 0
 );
 """
 
@@ -50,8 +60,17 @@ CREATE TABLE IF NOT EXISTS posts (
     upvote_count INTEGER DEFAULT 0,
     downvote_count INTEGER DEFAULT 0,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    posttext TEXT 
+    posttext TEXT,
+    trending_score DOUBLE PRECISION DEFAULT 0,
+    pulled BOOLEAN NOT NULL DEFAULT false,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', COALESCE(posttext, ''))) STORED
 );
+CREATE INDEX IF NOT EXISTS posts_search_idx ON posts USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS posts_trending_idx ON posts (trending_score DESC, postid DESC);
+CREATE INDEX IF NOT EXISTS posts_recent_idx ON posts (created_at DESC, postid DESC);
+CREATE INDEX IF NOT EXISTS posts_user_recent_idx ON posts (user_id, created_at DESC, postid DESC);
+CREATE INDEX IF NOT EXISTS posts_user_pulled_idx ON posts (user_id, created_at DESC, postid DESC) WHERE pulled;
+CREATE INDEX IF NOT EXISTS posts_prompt_trending_idx ON posts (prompt_id, trending_score DESC, postid DESC) WHERE prompt_id IS NOT NULL;
 """
 
 CREATE_REPLIES_TABLE = """
@@ -61,14 +80,87 @@ CREATE TABLE IF NOT EXISTS replies (
     user_id INTEGER NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
     reply_text TEXT,
     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
-    isAgree BOOLEAN DEFAULT NULL
+    isAgree BOOLEAN DEFAULT NULL,
+    search_vector tsvector GENERATED ALWAYS AS (to_tsvector('english', COALESCE(reply_text, ''))) STORED
 );
+CREATE INDEX IF NOT EXISTS replies_search_idx ON replies USING GIN (search_vector);
+CREATE INDEX IF NOT EXISTS replies_post_created_idx ON replies (post_id, created_at, id);
+CREATE INDEX IF NOT EXISTS replies_post_stance_idx ON replies (post_id, isagree);
+CREATE INDEX IF NOT EXISTS replies_user_id_idx ON replies (user_id);
+"""
+
+CREATE_VOTES_TABLE = """
+CREATE TABLE IF NOT EXISTS votes (
+    voteid SERIAL PRIMARY KEY,
+    post_id INTEGER NOT NULL REFERENCES posts (postid) ON DELETE CASCADE,
+    user_id INTEGER NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    vote_type VARCHAR(8) NOT NULL,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT votes_user_post_uniq UNIQUE (user_id, post_id)
+);
+CREATE INDEX IF NOT EXISTS votes_post_id_idx ON votes (post_id);
+"""
+
+CREATE_FOLLOWS_TABLE = """
+CREATE TABLE IF NOT EXISTS follows (
+    followid SERIAL PRIMARY KEY,
+    follower_id INTEGER NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    followee_id INTEGER NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP,
+    CONSTRAINT follows_follower_followee_uniq UNIQUE (follower_id, followee_id),
+    CONSTRAINT follows_no_self_follow CHECK (follower_id <> followee_id)
+);
+CREATE INDEX IF NOT EXISTS follows_followee_idx ON follows (followee_id, follower_id);
+"""
+
+CREATE_TIMELINES_TABLE = """
+CREATE TABLE IF NOT EXISTS timelines (
+    entryid BIGSERIAL PRIMARY KEY,
+    owner_id INTEGER NOT NULL REFERENCES users (userid) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL REFERENCES posts (postid) ON DELETE CASCADE,
+    created_at TIMESTAMP NOT NULL,
+    CONSTRAINT timelines_owner_post_uniq UNIQUE (owner_id, post_id)
+);
+CREATE INDEX IF NOT EXISTS timelines_owner_recent_idx ON timelines (owner_id, created_at DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS timelines_post_id_idx ON timelines (post_id);
+"""
+
+CREATE_USER_STATS_TABLE = """
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id INTEGER PRIMARY KEY REFERENCES users (userid) ON DELETE CASCADE,
+    total_upvotes INTEGER DEFAULT 0,
+    total_downvotes INTEGER DEFAULT 0,
+    post_count INTEGER DEFAULT 0,
+    reply_count INTEGER DEFAULT 0,
+    agree_received INTEGER DEFAULT 0,
+    disagree_received INTEGER DEFAULT 0
+);
+"""
+
+CREATE_DAILY_PROMPTS_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_prompts (
+    date DATE PRIMARY KEY,
+    prompt_id INTEGER NOT NULL REFERENCES prompts (promptid) ON DELETE CASCADE
+);
+CREATE INDEX IF NOT EXISTS daily_prompts_prompt_id_idx ON daily_prompts (prompt_id);
+"""
+
+CREATE_DAILY_RESPONSES_TABLE = """
+CREATE TABLE IF NOT EXISTS daily_responses (
+    responseid BIGSERIAL PRIMARY KEY,
+    date DATE NOT NULL REFERENCES daily_prompts (date) ON DELETE CASCADE,
+    post_id INTEGER NOT NULL REFERENCES posts (postid) ON DELETE CASCADE,
+    score INTEGER NOT NULL DEFAULT 0,  -- upvote_count - downvote_count of the post
+    CONSTRAINT daily_responses_date_post_uniq UNIQUE (date, post_id)
+);
+CREATE INDEX IF NOT EXISTS daily_responses_top_idx ON daily_responses (date, score DESC, post_id DESC);
+CREATE INDEX IF NOT EXISTS daily_responses_post_id_idx ON daily_responses (post_id);
 """
 
 # Sample data insertion queries
 INSERT_SAMPLE_USER = """
-INSERT INTO users (username, email, password, bio, reply_points, followers)
-VALUES (%s, %s, %s, %s, %s, %s)
+INSERT INTO users (username, email, password, bio, reply_points)
+VALUES (%s, %s, %s, %s, %s)
 RETURNING userid;
 """
 
@@ -84,6 +176,22 @@ VALUES (%s, %s, %s)
 RETURNING id;
 """
 
+# Same as `manage.py rebuild_user_stats`, for the sample rows
+BUILD_USER_STATS = """
+INSERT INTO user_stats (user_id, total_upvotes, total_downvotes, post_count, reply_count, agree_received, disagree_received)
+SELECT users.userid,
+       COALESCE((SELECT SUM(upvote_count) FROM posts WHERE posts.user_id = users.userid), 0),
+       COALESCE((SELECT SUM(downvote_count) FROM posts WHERE posts.user_id = users.userid), 0),
+       (SELECT COUNT(*) FROM posts WHERE posts.user_id = users.userid),
+       (SELECT COUNT(*) FROM replies WHERE replies.user_id = users.userid),
+       (SELECT COUNT(*) FROM replies JOIN posts ON posts.postid = replies.post_id
+        WHERE posts.user_id = users.userid AND replies.isagree),
+       (SELECT COUNT(*) FROM replies JOIN posts ON posts.postid = replies.post_id
+        WHERE posts.user_id = users.userid AND NOT replies.isagree)
+FROM users;
+UPDATE users SET reply_points = (SELECT COUNT(*) FROM replies WHERE replies.user_id = users.userid);
+"""
+
 # Function to connect to the database
 def connect_to_db():
     return psycopg2.connect(
@@ -111,6 +219,12 @@ def main():
         cursor.execute(CREATE_USERS_TABLE)
         cursor.execute(CREATE_POSTS_TABLE)
         cursor.execute(CREATE_REPLIES_TABLE)
+        cursor.execute(CREATE_VOTES_TABLE)
+        cursor.execute(CREATE_FOLLOWS_TABLE)
+        cursor.execute(CREATE_TIMELINES_TABLE)
+        cursor.execute(CREATE_USER_STATS_TABLE)
+        cursor.execute(CREATE_DAILY_PROMPTS_TABLE)
+        cursor.execute(CREATE_DAILY_RESPONSES_TABLE)
 
         # Insert sample user
         print("Inserting sample user...")
@@ -120,7 +234,6 @@ def main():
             "securepassword",  # password
             "I love sharing opinions!",  # bio
             100,  # reply_points
-            '{}'  # Empty array for followers
         ))
         user_id = cursor.fetchone()[0]  # Get the new user's ID
 
@@ -142,17 +255,21 @@ def main():
             "securepassword2",  # password
             "I like replying to posts!",  # bio
             50,  # reply_points
-            '{}'  # Empty array for followers
         ))
         follower_id = cursor.fetchone()[0]  # Get the follower's ID
 
-        # Update the user to add the follower to the followers array
-        print("Adding follower to user's followers array...")
+        # Add the follow edge and update both users' counters
+        print("Adding follow relation...")
         cursor.execute("""
-        UPDATE users
-        SET followers = array_append(followers, %s)
-        WHERE userid = %s;
+        INSERT INTO follows (follower_id, followee_id)
+        VALUES (%s, %s);
         """, (follower_id, user_id))
+        cursor.execute("""
+        UPDATE users
+        SET follower_count = follower_count + (userid = %s)::int,
+            following_count = following_count + (userid = %s)::int
+        WHERE userid IN (%s, %s);
+        """, (user_id, follower_id, user_id, follower_id))
 
         # Insert sample reply
         print("Inserting sample reply...")
@@ -163,6 +280,10 @@ def main():
         ))
         reply_id = cursor.fetchone()[0]  # Get the reply's ID
 
+        # Compute the users' stats from the sample rows
+        print("Building user stats...")
+        cursor.execute(BUILD_USER_STATS)
+
         # Commit changes
         conn.commit()
 
@@ -0,0 +1,312 @@
+import hashlib
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import StanceRollup
+from .response_cache import invalidate
+
+# Stance-shift analytics. Each post, prompt and category has a row per hour
+# and per day in which something happened to it, counting the posts written
+# (for prompts and categories), the agreeing and disagreeing replies, and the
+# changes to the posts' vote counters. Writes add to the rows of their post,
+# its prompt and the prompt's category once they commit, so a trend is read
+# from at most one row per bucket however many replies and votes are behind
+# it. Buckets are in UTC. Hourly rows are kept for ANALYTICS_HOURLY_DAYS days.
+# `manage.py rebuild_analytics` backfills the rows from the posts, replies
+# and votes tables.
+PERIODS = {'hour': timedelta(hours=1), 'day': timedelta(days=1)}
+
+# Tags invalidated per cache round trip after a rebuild
+INVALIDATE_BATCH = 1000
+
+# Model field -> stance_rollups column, in VALUES order
+ROLLUP_COLUMNS = {
+    'Posts': 'posts',
+    'Agree': 'agree',
+    'Disagree': 'disagree',
+    'Upvotes': 'upvotes',
+    'Downvotes': 'downvotes',
+}
+
+# Spreads events (post_id, prompt_id, at, posts, agree, ...) over the buckets
+# of every scope and period, one row per bucket. Events before a period's
+# `since` are left out of it.
+ROLLUP_DELTAS = """
+SELECT scopes.scope, scopes.key, periods.period,
+       date_trunc(periods.period, events.at) AS bucket_start,
+       {sums}
+FROM ({events}) AS events (post_id, prompt_id, at, {columns})
+LEFT JOIN prompts ON prompts.promptid = events.prompt_id
+CROSS JOIN LATERAL (
+    VALUES ('post', events.post_id::text), ('prompt', events.prompt_id::text), ('category', prompts.category)
+) AS scopes (scope, key)
+CROSS JOIN (VALUES ('hour', %s::timestamptz), ('day', %s::timestamptz)) AS periods (period, since)
+WHERE scopes.key IS NOT NULL AND events.at >= periods.since
+GROUP BY 1, 2, 3, 4
+"""
+
+# Creates a bucket's row on its first event, otherwise increments it in place.
+# No semicolon: rebuilds run it inside REBUILT_SCOPES.
+ADJUST_ROLLUPS = """
+INSERT INTO stance_rollups (scope, key, period, bucket_start, {columns})
+{deltas}
+ORDER BY 1, 2, 3, 4
+ON CONFLICT (scope, key, period, bucket_start) DO UPDATE SET
+{increments}
+{returning}
+"""
+
+# For deletes, which must not create rows for buckets already dropped
+UPDATE_ROLLUPS = """
+UPDATE stance_rollups SET
+{increments}
+FROM ({deltas}) AS deltas
+WHERE stance_rollups.scope = deltas.scope
+  AND stance_rollups.key = deltas.key
+  AND stance_rollups.period = deltas.period
+  AND stance_rollups.bucket_start = deltas.bucket_start
+RETURNING stance_rollups.scope, stance_rollups.key;
+"""
+
+# Every post, reply and vote since %s, as events. Votes are counted when
+# first cast and as what they are now.
+ACTIVITY_EVENTS = """
+SELECT postid, prompt_id, created_at, 1, 0, 0, 0, 0
+FROM posts WHERE created_at >= %s
+UNION ALL
+SELECT replies.post_id, posts.prompt_id, replies.created_at, 0, replies.isagree::int, (NOT replies.isagree)::int, 0, 0
+FROM replies JOIN posts ON posts.postid = replies.post_id
+WHERE replies.created_at >= %s
+UNION ALL
+SELECT votes.post_id, posts.prompt_id, votes.created_at, 0, 0, 0, (votes.vote_type = 'upvote')::int, (votes.vote_type = 'downvote')::int
+FROM votes JOIN posts ON posts.postid = votes.post_id
+WHERE votes.created_at >= %s
+"""
+
+PRUNE_HOURLY_ROLLUPS = """
+DELETE FROM stance_rollups WHERE period = 'hour' AND bucket_start < %s;
+"""
+
+# A rebuild's rows are dropped and written back with the trends they belong
+# to returned, so that those can be invalidated without another pass
+DROP_ROLLUPS_SINCE = """
+WITH dropped AS (
+    DELETE FROM stance_rollups WHERE bucket_start >= %s RETURNING scope, key
+)
+SELECT DISTINCT scope, key FROM dropped;
+"""
+
+REBUILT_SCOPES = """
+WITH written AS (
+{upsert}
+)
+SELECT scope, key, COUNT(*) FROM written GROUP BY scope, key;
+"""
+
+
+def hourly_since():
+    # Start of the oldest hour whose rows are kept
+    return (timezone.now() - timedelta(days=settings.ANALYTICS_HOURLY_DAYS)).replace(minute=0, second=0, microsecond=0)
+
+
+def stance_tag(scope, key):
+    # The response cache tag of a trend. Category names may hold characters
+    # that are not valid in cache keys.
+    return f'stance:{scope}:{hashlib.md5(str(key).encode()).hexdigest()}'
+
+
+def rollup_deltas(events):
+    """
+    ROLLUP_DELTAS over the `events` subquery; its parameters go before those
+    of the periods.
+    """
+    columns = list(ROLLUP_COLUMNS.values())
+    return ROLLUP_DELTAS.format(
+        events=events,
+        columns=', '.join(columns),
+        sums=', '.join(f'SUM(events.{column}) AS {column}' for column in columns),
+    )
+
+
+def adjust_rollups(events, create=True):
+    """
+    Add [(post_id, prompt_id or None, at, {'Agree': 1, ...}), ...] to the
+    hourly and daily rollups of each post, its prompt and the prompt's
+    category, once the current transaction commits (immediately in autocommit
+    mode). Missing fields count as 0. Rows are created on demand unless
+    `create` is False, in which case buckets without a row are skipped.
+    """
+    rows = [
+        (post_id, prompt_id, at, *[fields.get(field, 0) for field in ROLLUP_COLUMNS])
+        for post_id, prompt_id, at, fields in events
+        if any(fields.values())
+    ]
+    if rows:
+        # Written after the commit, in a statement of its own: the buckets of
+        # a busy category are shared by every writer, and must not stay
+        # locked for the rest of their transactions. Rollups a crash loses
+        # in between come back with the next rebuild.
+        transaction.on_commit(lambda: write_rollups(rows, create), robust=True)
+
+
+def write_rollups(rows, create):
+    columns = list(ROLLUP_COLUMNS.values())
+    events = 'VALUES ' + ', '.join(['(%s, %s::integer, %s::timestamptz' + ', %s' * len(columns) + ')'] * len(rows))
+    source = 'EXCLUDED' if create else 'deltas'
+    query = (ADJUST_ROLLUPS if create else UPDATE_ROLLUPS).format(
+        columns=', '.join(columns),
+        deltas=rollup_deltas(events),
+        increments=',\n'.join(f'    {column} = stance_rollups.{column} + {source}.{column}' for column in columns),
+        returning='RETURNING stance_rollups.scope, stance_rollups.key',
+    )
+    # Inserted in key order, so that concurrent writers lock rows in the same order
+    params = [value for row in rows for value in row] + [hourly_since(), '-infinity']
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        changed = {stance_tag(scope, key) for scope, key in cursor.fetchall()}
+    # Already committed: the cached trends are stale from here on
+    invalidate(*changed)
+
+
+def post_rollup_events(post, sign):
+    return [(post.PostID, post.PromptID_id, post.CreatedAt, {'Posts': sign})]
+
+
+def reply_rollup_events(replies, prompt_ids, sign):
+    """
+    Rollup events of replies, given the {post_id: prompt_id} of their posts.
+    """
+    return [
+        (reply.PostID_id, prompt_ids.get(reply.PostID_id), reply.CreatedAt, {'Agree' if reply.isAgree else 'Disagree': sign})
+        for reply in replies
+    ]
+
+
+def vote_rollup_events(updated, at):
+    """
+    Rollup events of vote counter changes [(post_id, prompt_id, upvotes, downvotes), ...].
+    """
+    return [(post_id, prompt_id, at, {'Upvotes': up, 'Downvotes': down}) for post_id, prompt_id, up, down in updated]
+
+
+def delete_rollups(scope, key):
+    """
+    Drop the rollups of a deleted post or prompt once the transaction commits.
+    """
+    transaction.on_commit(lambda: StanceRollup.objects.filter(Scope=scope, Key=str(key)).delete(), robust=True)
+
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups of the buckets from the day of `since` (a date;
+    default: all of them) from the posts, replies and votes tables, and drop
+    the expired hourly rows. The cached trends of every post, prompt and
+    category with a bucket dropped or rebuilt are invalidated once the
+    rebuild commits. Votes can only be counted as the votes table has them:
+    anonymous votes, switched votes and votes on posts deleted since, which
+    the incremental rollups keep, are lost from the rebuilt buckets.
+    Returns the number of rows written.
+    """
+    start = datetime.combine(since, datetime.min.time(), dt_timezone.utc) if since else '-infinity'
+    query = REBUILT_SCOPES.format(upsert=ADJUST_ROLLUPS.format(
+        columns=', '.join(ROLLUP_COLUMNS.values()),
+        deltas=rollup_deltas(ACTIVITY_EVENTS),
+        increments=',\n'.join(f'    {column} = EXCLUDED.{column}' for column in ROLLUP_COLUMNS.values()),
+        returning='RETURNING stance_rollups.scope, stance_rollups.key',
+    ))
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Writers queue on the lock instead of adding to rows about to be replaced
+        cursor.execute('LOCK TABLE stance_rollups IN EXCLUSIVE MODE;')
+        cursor.execute(DROP_ROLLUPS_SINCE, [start])
+        changed = set(cursor.fetchall())
+        cursor.execute(query, [start, start, start, hourly_since(), '-infinity'])
+        rebuilt = 0
+        for scope, key, rows in cursor.fetchall():
+            changed.add((scope, key))
+            rebuilt += rows
+        cursor.execute(PRUNE_HOURLY_ROLLUPS, [hourly_since()])
+    # Committed; a full rebuild can cover every post, so in batches
+    tags = sorted(stance_tag(scope, key) for scope, key in changed)
+    for i in range(0, len(tags), INVALIDATE_BATCH):
+        invalidate(*tags[i:i + INVALIDATE_BATCH])
+    return rebuilt
+
+
+def prune_rollups():
+    """
+    Drop the hourly rows older than ANALYTICS_HOURLY_DAYS. Returns the number of rows dropped.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(PRUNE_HOURLY_ROLLUPS, [hourly_since()])
+        return cursor.rowcount
+
+
+def ratio(part, whole):
+    return round(part / whole, 4) if whole else None
+
+
+def stance_trend(scope, key, period, buckets, now=None):
+    """
+    The last `buckets` hours or days of a post, prompt or category, oldest
+    first and ending with the current one, from at most `buckets` rollup
+    rows. Buckets without activity are zeros. `shift` is the agree ratio of
+    the later half of the buckets minus that of the earlier half.
+    """
+    step = PERIODS[period]
+    now = now or timezone.now()
+    current = now.astimezone(dt_timezone.utc).replace(minute=0, second=0, microsecond=0)
+    if period == 'day':
+        current = current.replace(hour=0)
+    first = current - step * (buckets - 1)
+
+    fields = list(ROLLUP_COLUMNS)
+    rows = StanceRollup.objects.filter(
+        Scope=scope, Key=str(key), Period=period, BucketStart__gte=first, BucketStart__lte=current,
+    ).values_list('BucketStart', *fields)
+    found = {row[0]: row[1:] for row in rows}
+
+    hours = step.total_seconds() / 3600
+    series = []
+    for index in range(buckets):
+        bucket_start = first + step * index
+        posts, agree, disagree, upvotes, downvotes = found.get(bucket_start, (0,) * len(fields))
+        series.append({
+            "start": bucket_start.isoformat(),
+            "posts": posts,
+            "replies": agree + disagree,
+            "agree": agree,
+            "disagree": disagree,
+            "agree_ratio": ratio(agree, agree + disagree),
+            "upvotes": upvotes,
+            "downvotes": downvotes,
+            "votes_per_hour": round((upvotes + downvotes) / hours, 2),
+        })
+
+    def totals(buckets):
+        agree = sum(bucket["agree"] for bucket in buckets)
+        disagree = sum(bucket["disagree"] for bucket in buckets)
+        return {
+            "posts": sum(bucket["posts"] for bucket in buckets),
+            "replies": agree + disagree,
+            "agree": agree,
+            "disagree": disagree,
+            "agree_ratio": ratio(agree, agree + disagree),
+            "upvotes": sum(bucket["upvotes"] for bucket in buckets),
+            "downvotes": sum(bucket["downvotes"] for bucket in buckets),
+        }
+
+    earlier, later = totals(series[:buckets // 2]), totals(series[buckets // 2:])
+    shift = None
+    if earlier["agree_ratio"] is not None and later["agree_ratio"] is not None:
+        shift = round(later["agree_ratio"] - earlier["agree_ratio"], 4)
+    return {
+        "scope": scope,
+        "key": str(key),
+        "period": period,
+        "totals": totals(series),
+        "shift": shift,
+        "series": series,
+    }
@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class OpinionsAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'opinions_app'
+
+    def ready(self):
+        from . import metrics, signals  # noqa: F401  Connects the signal receivers
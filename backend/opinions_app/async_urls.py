@@ -0,0 +1,15 @@
+# opinions_app/async_urls.py
+from django.urls import path
+from . import async_views
+
+# Same paths as urls.py, mounted under /api/async/, plus the event streams
+urlpatterns = [
+    path('posts/trending/', async_views.get_trending_posts, name='async-trending-posts'),
+    path('posts/<int:post_id>/', async_views.get_post, name='async-get-post'),
+    path('posts/<int:post_id>/replies/', async_views.get_replies, name='async-get-replies'),
+    path('prompt/<int:prompt_id>/', async_views.get_prompt, name='async-get-prompt'),
+    path('prompts/category/<str:category>/', async_views.get_prompts_by_category, name='async-get-prompts-by-category'),
+    path('user/<int:user_id>/', async_views.get_user, name='async-get-user'),
+    path('posts/<int:post_id>/events/', async_views.post_events, name='post-events'),
+    path('prompt/<int:prompt_id>/events/', async_views.prompt_events, name='prompt-events'),
+]
@@ -0,0 +1,218 @@
+import asyncio
+import contextvars
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from django.http import JsonResponse, StreamingHttpResponse
+from rest_framework import status
+from rest_framework.request import Request
+from rest_framework.utils.encoders import JSONEncoder
+
+from .events import get_broker
+from .expand import POST_EXPANSIONS, REPLY_EXPANSIONS, parse_expand, expand_posts, expand_replies
+from .fast_serializers import row_serializer
+from .metrics import record_render
+from .models import Post, Prompt, Reply, User
+from .pagination import InvalidCursor
+from .renderers import COLUMNAR_MEDIA_TYPE, columnar, wants_columnar
+from .routers import replica_reads
+from .serializers import PostSerializer, PromptSerializer, ReplySerializer, UserSerializer
+from .views import prompt_paginator, reply_paginator, trending_paginator
+
+# Async versions of the hot read endpoints, served under ASGI at /api/async/.
+# They return the same JSON and pagination headers as the APIViews in views.py
+# without holding a worker thread while Postgres works. They bypass the
+# response cache; the sync views keep serving WSGI deployments.
+#
+# The Server-Sent Events streams of events.py are served here too, since only
+# ASGI can hold many idle connections open without a thread each.
+
+# Rendered like DRF's JSONRenderer
+JSON_DUMPS_PARAMS = {'separators': (',', ':'), 'ensure_ascii': False}
+PAGINATION_HEADERS = ('X-Next-Cursor', 'Link')
+
+# Independent queries of one request run at the same time on these threads,
+# each with its own database connection. The async ORM would run them one
+# after another on the request's single sync thread.
+query_executor = ThreadPoolExecutor(max_workers=settings.ASYNC_QUERY_THREADS, thread_name_prefix='async-query')
+
+
+def run_query(func):
+    # Each call is handled like a request, so pool threads honour CONN_MAX_AGE
+    # instead of holding a connection open between requests
+    close_old_connections()
+    try:
+        return func()
+    finally:
+        close_old_connections()
+
+
+async def gather_queries(*funcs):
+    """
+    Run blocking ORM callables concurrently and return their results in order.
+    """
+    loop = asyncio.get_running_loop()
+    # Each in a copy of the request's context, so that they read from the same database
+    return await asyncio.gather(*[
+        loop.run_in_executor(query_executor, contextvars.copy_context().run, run_query, func) for func in funcs
+    ])
+
+
+def json_response(data, status_code=status.HTTP_200_OK, headers=None, content_type='application/json'):
+    started = time.perf_counter()
+    response = JsonResponse(data, status=status_code, headers=headers, content_type=content_type, safe=False, json_dumps_params=JSON_DUMPS_PARAMS)
+    record_render(time.perf_counter() - started)
+    return response
+
+
+def error_response(message, status_code):
+    return json_response({"error": message}, status_code)
+
+
+def paginated_response(paginator, data, next_cursor, request, key=None):
+    response = paginator.get_paginated_response(data, next_cursor, request, key=key)
+    headers = {header: response[header] for header in PAGINATION_HEADERS if header in response}
+    if wants_columnar(request):
+        return json_response(columnar(response.data), headers=headers, content_type=COLUMNAR_MEDIA_TYPE)
+    return json_response(response.data, headers=headers)
+
+
+async def get_post(request, post_id):
+    """
+    Retrieve a Post by its ID. Supports ?expand=prompt,author,reply_count.
+    """
+    request = Request(request)
+    expand = parse_expand(request, POST_EXPANSIONS)
+    try:
+        post = await expand_posts(Post.objects.all(), expand).aget(pk=post_id)
+    except Post.DoesNotExist:
+        return error_response("Post not found.", status.HTTP_404_NOT_FOUND)
+    return json_response(PostSerializer(post, context={'expand': expand}).data)
+
+
+@replica_reads
+async def get_replies(request, post_id):
+    """
+    Get a page of replies for a specific post, oldest first. The post lookup
+    and the page of replies are fetched concurrently.
+    """
+    request = Request(request)
+    expand = parse_expand(request, REPLY_EXPANSIONS)
+
+    def load_replies():
+        replies = expand_replies(Reply.objects.filter(PostID=post_id), expand)
+        return reply_paginator.paginate_rows(replies, request, row_serializer(ReplySerializer, frozenset(expand)))
+
+    try:
+        post_exists, (data, next_cursor) = await gather_queries(Post.objects.filter(pk=post_id).exists, load_replies)
+    except InvalidCursor:
+        return error_response("Invalid cursor.", status.HTTP_400_BAD_REQUEST)
+    if not post_exists:
+        return error_response("Post not found.", status.HTTP_404_NOT_FOUND)
+    return paginated_response(reply_paginator, data, next_cursor, request, key="replies")
+
+
+async def get_prompt(request, prompt_id):
+    """
+    Retrieve a Prompt by its ID.
+    """
+    try:
+        prompt = await Prompt.objects.aget(pk=prompt_id)
+    except Prompt.DoesNotExist:
+        return error_response("Prompt not found.", status.HTTP_404_NOT_FOUND)
+    return json_response(PromptSerializer(prompt).data)
+
+
+@replica_reads
+async def get_prompts_by_category(request, category):
+    """
+    Retrieve a page of prompts belonging to a specific category.
+    """
+    request = Request(request)
+    try:
+        data, next_cursor = await prompt_paginator.apaginate_rows(Prompt.objects.filter(Category=category), request, row_serializer(PromptSerializer))
+    except InvalidCursor:
+        return error_response("Invalid cursor.", status.HTTP_400_BAD_REQUEST)
+    if not data and 'cursor' not in request.query_params:
+        return error_response("No prompts found for this category.", status.HTTP_404_NOT_FOUND)
+    return paginated_response(prompt_paginator, data, next_cursor, request)
+
+
+async def get_user(request, user_id):
+    """
+    Retrieve a user by their ID.
+    """
+    try:
+        user = await User.objects.aget(pk=user_id)
+    except User.DoesNotExist:
+        return error_response("User not found.", status.HTTP_404_NOT_FOUND)
+    return json_response(UserSerializer(user).data)
+
+
+@replica_reads
+async def get_trending_posts(request):
+    """
+    Get posts ranked by their precomputed trending score, optionally filtered by prompt category.
+    """
+    request = Request(request)
+    expand = parse_expand(request, POST_EXPANSIONS)
+    posts = expand_posts(Post.objects.all(), expand)
+    category = request.query_params.get('category')
+    if category:
+        posts = posts.filter(PromptID__Category=category)
+    try:
+        data, next_cursor = await trending_paginator.apaginate_rows(posts, request, row_serializer(PostSerializer, frozenset(expand)))
+    except InvalidCursor:
+        return error_response("Invalid cursor.", status.HTTP_400_BAD_REQUEST)
+    return paginated_response(trending_paginator, data, next_cursor, request, key="posts")
+
+
+def event_stream(channels):
+    """
+    A Server-Sent Events response carrying the events of `channels` (see
+    events.py) until the client disconnects. A comment line is sent after
+    EVENT_HEARTBEAT idle seconds so proxies keep the connection open.
+    """
+    async def stream():
+        subscription = get_broker().subscribe(channels)
+        try:
+            # Sent at once, so the client knows it is subscribed
+            yield ": subscribed\n\n"
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscription.get(), settings.EVENT_HEARTBEAT)
+                except asyncio.TimeoutError:
+                    yield ": keep-alive\n\n"
+                    continue
+                if event is None:
+                    return  # Overflowed; the client reconnects and resyncs
+                data = json.dumps(event, cls=JSONEncoder, **JSON_DUMPS_PARAMS)
+                yield f"event: {event['type']}\ndata: {data}\n\n"
+        finally:
+            subscription.close()
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'  # Stops nginx from buffering the stream
+    return response
+
+
+async def post_events(request, post_id):
+    """
+    Stream new replies to a post and changes to its vote counts.
+    """
+    if not await Post.objects.filter(pk=post_id).aexists():
+        return error_response("Post not found.", status.HTTP_404_NOT_FOUND)
+    return event_stream([f'post:{post_id}'])
+
+
+async def prompt_events(request, prompt_id):
+    """
+    Stream new posts on a prompt, and new replies and vote count changes on those posts.
+    """
+    if not await Prompt.objects.filter(pk=prompt_id).aexists():
+        return error_response("Prompt not found.", status.HTTP_404_NOT_FOUND)
+    return event_stream([f'prompt:{prompt_id}'])
@@ -0,0 +1,220 @@
+import hashlib
+import logging
+import multiprocessing
+import os
+import re
+import tempfile
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from django.conf import settings
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.core.files.uploadedfile import UploadedFile
+from django.db import close_old_connections
+from PIL import Image, ImageOps
+
+logger = logging.getLogger(__name__)
+
+# Profile pictures. An upload is streamed to a temporary file while it is
+# hashed, then square thumbnails of every AVATAR_SIZES size are made from it
+# in a process pool, off the request path, under
+#
+#   MEDIA_ROOT/avatars/<hash[:2]>/<hash>/<size>.webp
+#
+# where <hash> is the SHA-256 of the uploaded file. Identical uploads share
+# one set of files, and since a file never changes it can be served with a
+# far-future Cache-Control. User.ProfilePicture holds the hash once the
+# thumbnails exist; serializers.AvatarField turns it into the URL of the size
+# a payload needs. The upload itself, which may carry EXIF data such as the
+# location it was taken at, is never kept.
+AVATAR_HASH = re.compile(r'[0-9a-f]{64}')
+THUMBNAIL_FORMAT = 'webp'
+
+
+def avatar_directory(digest):
+    return os.path.join(settings.MEDIA_ROOT, 'avatars', digest[:2], digest)
+
+
+def avatar_url(value, size):
+    """
+    The URL of a ProfilePicture's `size` thumbnail. Values that are not the
+    hash of an upload (URLs set by clients before uploads existed) are
+    returned as they are.
+    """
+    if value is None or not AVATAR_HASH.fullmatch(value):
+        return value
+    return f"{settings.MEDIA_URL}avatars/{value[:2]}/{value}/{size}.{THUMBNAIL_FORMAT}"
+
+
+def avatar_urls(value):
+    if value is None or not AVATAR_HASH.fullmatch(value):
+        return None
+    return {str(size): avatar_url(value, size) for size in settings.AVATAR_SIZES}
+
+
+def has_thumbnails(digest):
+    directory = avatar_directory(digest)
+    return all(os.path.exists(os.path.join(directory, f'{size}.{THUMBNAIL_FORMAT}')) for size in settings.AVATAR_SIZES)
+
+
+class HashedUpload(UploadedFile):
+    """
+    An upload written to a temporary file, with the SHA-256 of its contents.
+    """
+
+    def __init__(self, file, name, content_type, size, charset, digest):
+        super().__init__(file, name, content_type, size, charset)
+        self.digest = digest
+
+    def temporary_file_path(self):
+        return self.file.name
+
+
+class AvatarUploadHandler(FileUploadHandler):
+    """
+    Writes each uploaded chunk straight to a temporary file (in
+    FILE_UPLOAD_TEMP_DIR) and into a SHA-256, so that no upload is held in
+    memory and the file is read once. Only the field `file` is kept, and a
+    file over AVATAR_MAX_BYTES is dropped as soon as it passes it, setting
+    `too_large`.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.too_large = False
+
+    def new_file(self, field_name, *args, **kwargs):
+        if field_name != 'file':
+            raise SkipFile()
+        super().new_file(field_name, *args, **kwargs)
+        self.file = tempfile.NamedTemporaryFile(prefix='avatar-', dir=settings.FILE_UPLOAD_TEMP_DIR, delete=False)
+        self.hash = hashlib.sha256()
+        self.size = 0
+
+    def receive_data_chunk(self, raw_data, start):
+        self.size += len(raw_data)
+        if self.size > settings.AVATAR_MAX_BYTES:
+            self.too_large = True
+            self.discard()
+            raise SkipFile()
+        self.file.write(raw_data)
+        self.hash.update(raw_data)
+
+    def file_complete(self, file_size):
+        self.file.flush()
+        self.file.seek(0)
+        return HashedUpload(self.file, self.file_name, self.content_type, file_size, self.charset, self.hash.hexdigest())
+
+    def upload_interrupted(self):
+        if hasattr(self, 'file'):
+            self.discard()
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.remove(self.file.name)
+        except FileNotFoundError:
+            pass
+
+
+def check_image(path):
+    """
+    The error message for a file that is not an image Pillow can thumbnail,
+    or None. Reads only the header.
+    """
+    try:
+        with Image.open(path) as image:
+            width, height = image.size
+    except (OSError, Image.DecompressionBombError):
+        return "The file is not a supported image."
+    if width * height > settings.AVATAR_MAX_PIXELS:
+        return f"The image is too large; at most {settings.AVATAR_MAX_PIXELS} pixels."
+    return None
+
+
+def make_thumbnails(source, directory, sizes):
+    """
+    Write a square WebP of each size, cropped from the centre, into
+    `directory`. Runs in the thumbnail pool's worker processes.
+    """
+    os.makedirs(directory, exist_ok=True)
+    with Image.open(source) as image:
+        # Decode a JPEG at the smallest scale that still covers the largest size
+        image.draft('RGB', (max(sizes), max(sizes)))
+        image = ImageOps.exif_transpose(image)
+        image = image.convert('RGBA' if image.has_transparency_data else 'RGB')
+        side = min(image.size)
+        left, top = (image.width - side) // 2, (image.height - side) // 2
+        image = image.crop((left, top, left + side, top + side))
+        # Largest first, each resized from the last: every step is a small one
+        for size in sorted(sizes, reverse=True):
+            image = image.resize((size, size), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            # Written whole, then renamed, so a URL never serves half a file
+            path = os.path.join(directory, f'{size}.{THUMBNAIL_FORMAT}')
+            partial = f'{path}.{os.getpid()}.partial'
+            image.save(partial, THUMBNAIL_FORMAT, quality=80, method=4)
+            os.replace(partial, path)
+
+
+thumbnail_pool = None
+thumbnail_pool_lock = threading.Lock()
+
+
+def get_thumbnail_pool():
+    global thumbnail_pool
+    with thumbnail_pool_lock:
+        if thumbnail_pool is None:
+            # Spawned rather than forked: a fork would copy the server's threads' locks and connections
+            thumbnail_pool = ProcessPoolExecutor(max_workers=settings.AVATAR_WORKERS, mp_context=multiprocessing.get_context('spawn'))
+    return thumbnail_pool
+
+
+def process_avatar(user_id, upload):
+    """
+    Make the thumbnails of an upload in the pool, then set it as the user's
+    ProfilePicture. Returns the future of the thumbnails.
+    """
+    global thumbnail_pool
+    path = upload.temporary_file_path()
+    upload.close()
+    pool = get_thumbnail_pool()
+    try:
+        future = pool.submit(make_thumbnails, path, avatar_directory(upload.digest), settings.AVATAR_SIZES)
+    except BrokenProcessPool:
+        # A worker died (killed for its memory, say): start a new pool for the next upload
+        os.remove(path)
+        with thumbnail_pool_lock:
+            if thumbnail_pool is pool:
+                thumbnail_pool = None
+        raise
+    future.add_done_callback(lambda future: thumbnails_done(future, user_id, upload.digest, path))
+    return future
+
+
+def thumbnails_done(future, user_id, digest, path):
+    # Called on the pool's management thread
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+    if future.exception() is not None:
+        logger.error("Could not make the thumbnails of avatar %s for user %s", digest, user_id, exc_info=future.exception())
+        return
+    try:
+        set_profile_picture(user_id, digest)
+    except Exception:
+        logger.exception("Could not set the avatar of user %s", user_id)
+    finally:
+        close_old_connections()
+
+
+def set_profile_picture(user_id, digest):
+    # Imported here: the pool's worker processes import this module without setting Django up
+    from .models import User
+
+    user = User.objects.filter(pk=user_id).first()
+    if user is not None:
+        user.ProfilePicture = digest
+        # Saved rather than updated, so the signals invalidate the user's cached responses
+        user.save(update_fields=['ProfilePicture'])
@@ -0,0 +1,145 @@
+from collections import defaultdict
+
+from rest_framework import serializers, status
+
+from .analytics import adjust_rollups, reply_rollup_events
+from .events import publish_replies
+from .follows import apply_follows
+from .models import Post, Reply, User
+from .response_cache import invalidate_on_commit
+from .serializers import FollowBatchItemSerializer, PostSerializer, ReplyBatchItemSerializer, ReplySerializer, VoteBatchItemSerializer
+from .user_stats import adjust_user_stats
+from .votes import record_votes
+
+# Batch writes: the votes, replies and follow changes a client queued while
+# offline, applied together with a few statements per kind instead of one
+# request and several queries per item. Each item gets the status and body
+# its single-item endpoint would have returned.
+
+
+def validate_items(items, serializer):
+    """
+    The valid items as [(index, validated data), ...], and a result per item:
+    a 400 with the errors of each invalid item and None for the others.
+    """
+    validated, results = [], [None] * len(items)
+    for index, item in enumerate(items):
+        try:
+            validated.append((index, serializer.run_validation(item)))
+        except serializers.ValidationError as error:
+            results[index] = {"status": status.HTTP_400_BAD_REQUEST, "errors": error.detail}
+    return validated, results
+
+
+def not_found(message):
+    return {"status": status.HTTP_404_NOT_FOUND, "error": message}
+
+
+def apply_batch(votes=(), replies=(), follows=()):
+    """
+    Apply lists of vote, reply and follow items (see BatchWriteView) and
+    return {"votes": [...], "replies": [...], "follows": [...]}, a result per
+    item in order. Call it in a transaction. Raises IntegrityError when a post
+    or user is deleted while the batch runs.
+    """
+    votes, vote_results = validate_items(votes, VoteBatchItemSerializer())
+    replies, reply_results = validate_items(replies, ReplyBatchItemSerializer())
+    follows, follow_results = validate_items(follows, FollowBatchItemSerializer())
+
+    # Every post and user the batch refers to, with one query each
+    post_ids = {item['post_id'] for _, item in votes} | {item['PostID_id'] for _, item in replies}
+    posts = {post['PostID']: post for post in Post.objects.filter(pk__in=post_ids).values('PostID', 'UserID', 'PromptID')}
+    user_ids = (
+        {item['user_id'] for _, item in votes if item.get('user_id')}
+        | {item['UserID_id'] for _, item in replies}
+        | {user_id for _, item in follows for user_id in (item['follower_id'], item['followee_id'])}
+    )
+    users = User.objects.only('UserID', 'Username', 'ProfilePicture').in_bulk(user_ids)
+
+    # Every user_stats change of the batch is written by one statement, so
+    # that concurrent batches lock the rows in the same order
+    stats_deltas = create_replies(replies, reply_results, posts, users)
+    apply_votes(votes, vote_results, posts, users, stats_deltas)
+    apply_follow_items(follows, follow_results, users)
+    return {"votes": vote_results, "replies": reply_results, "follows": follow_results}
+
+
+def apply_votes(items, results, posts, users, stats_deltas):
+    applied = []
+    for index, item in items:
+        if item['post_id'] not in posts:
+            results[index] = not_found("Post not found.")
+        elif item.get('user_id') and item['user_id'] not in users:
+            results[index] = not_found("User not found.")
+        else:
+            applied.append((index, item))
+    if not applied:
+        adjust_user_stats(stats_deltas)
+        return
+
+    record_votes([(item['post_id'], item['vote_type'], item.get('user_id')) for _, item in applied], stats_deltas)
+    # Every vote on a post sees its counts after the whole batch
+    updated = Post.objects.in_bulk({item['post_id'] for _, item in applied})
+    data = dict(zip(updated, PostSerializer(list(updated.values()), many=True).data))
+    for index, item in applied:
+        results[index] = {"status": status.HTTP_200_OK, "post": data[item['post_id']]}
+
+
+def create_replies(items, results, posts, users):
+    """
+    Create the valid replies and return the user_stats deltas they cause,
+    for the caller to write.
+    """
+    deltas = defaultdict(lambda: defaultdict(int))
+    applied = []
+    for index, item in items:
+        if item['PostID_id'] not in posts:
+            results[index] = not_found("Post not found.")
+        elif item['UserID_id'] not in users:
+            results[index] = not_found("User not found.")
+        else:
+            applied.append((index, item))
+    if not applied:
+        return deltas
+
+    created = Reply.objects.bulk_create([Reply(**item) for _, item in applied])
+
+    # bulk_create sends no post_save signals: do what signals.py does for a
+    # new reply, once for the whole batch
+    for reply in created:
+        reply.UserID = users[reply.UserID_id]
+        deltas[reply.UserID_id]['ReplyCount'] += 1
+        deltas[posts[reply.PostID_id]['UserID']]['AgreeReceived' if reply.isAgree else 'DisagreeReceived'] += 1
+    invalidate_on_commit(*{f'replies:{reply.PostID_id}' for reply in created})
+    prompt_ids = {post_id: post['PromptID'] for post_id, post in posts.items()}
+    adjust_rollups(reply_rollup_events(created, prompt_ids, 1))
+    publish_replies(created, prompt_ids)
+
+    for (index, _), data in zip(applied, ReplySerializer(created, many=True).data):
+        results[index] = {"status": status.HTTP_201_CREATED, "reply": data}
+    return deltas
+
+
+def apply_follow_items(items, results, users):
+    applied = []
+    for index, item in items:
+        if item['follower_id'] not in users or item['followee_id'] not in users:
+            results[index] = not_found("User not found.")
+        else:
+            applied.append((index, item))
+    if not applied:
+        return
+
+    changed = apply_follows([(item['op'], item['follower_id'], item['followee_id']) for _, item in applied])
+    last = {(item['follower_id'], item['followee_id']): index for index, item in applied}
+    for index, item in applied:
+        pair = (item['follower_id'], item['followee_id'])
+        if last[pair] != index:
+            results[index] = {"status": status.HTTP_200_OK, "message": "Superseded by a later operation in this batch."}
+        elif item['op'] == 'follow':
+            message = "User followed successfully." if changed[pair] else "You are already following this user."
+            results[index] = {"status": status.HTTP_200_OK, "message": message}
+        elif changed[pair]:
+            results[index] = {"status": status.HTTP_200_OK, "message": "User unfollowed successfully."}
+        else:
+            results[index] = {"status": status.HTTP_400_BAD_REQUEST, "message": "You are not following this user."}
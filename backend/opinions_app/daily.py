@@ -0,0 +1,137 @@
+from datetime import datetime, time, timedelta
+
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import DailyPrompt
+from .response_cache import invalidate_on_commit
+
+# The least recently featured prompt; prompts never featured come first
+NEXT_DAILY_PROMPT = """
+SELECT prompts.promptid
+FROM prompts
+LEFT JOIN (
+    SELECT prompt_id, MAX(date) AS last_featured FROM daily_prompts GROUP BY prompt_id
+) AS featured ON featured.prompt_id = prompts.promptid
+ORDER BY featured.last_featured NULLS FIRST, prompts.promptid
+LIMIT 1;
+"""
+
+SCHEDULE_DAILY_PROMPT = """
+INSERT INTO daily_prompts (date, prompt_id)
+VALUES (%s, %s)
+ON CONFLICT (date) DO {conflict}
+RETURNING prompt_id;
+"""
+
+# A date's responses are the posts on its prompt created that day
+REBUILD_DAILY_RESPONSES = """
+DELETE FROM daily_responses WHERE date = %(date)s;
+INSERT INTO daily_responses (date, post_id, score)
+SELECT %(date)s, postid, upvote_count - downvote_count
+FROM posts
+WHERE prompt_id = %(prompt)s AND created_at >= %(start)s AND created_at < %(end)s;
+"""
+
+# Adds the post only if its prompt is featured on the day it was created
+ADD_DAILY_RESPONSE = """
+INSERT INTO daily_responses (date, post_id, score)
+SELECT date, %(post)s, %(score)s
+FROM daily_prompts
+WHERE date = %(date)s AND prompt_id = %(prompt)s
+ON CONFLICT (date, post_id) DO NOTHING;
+"""
+
+APPLY_DAILY_SCORE_DELTAS = """
+UPDATE daily_responses
+SET score = daily_responses.score + deltas.net
+FROM (VALUES {values}) AS deltas (post_id, net)
+WHERE daily_responses.post_id = deltas.post_id;
+"""
+
+
+def get_daily_prompt(date=None):
+    """
+    The DailyPrompt of `date` (default: today) with its prompt, or None when
+    nothing is scheduled. If the rotation has not run yet, today's prompt is
+    scheduled on the spot.
+    """
+    today = timezone.localdate()
+    date = date or today
+    daily = DailyPrompt.objects.select_related('PromptID').filter(pk=date).first()
+    if daily is None and date == today:
+        daily = schedule_daily_prompt(date)
+    return daily
+
+
+def schedule_daily_prompt(date, prompt_id=None):
+    """
+    Feature `prompt_id` on `date` and build the date's responses snapshot.
+    Without a prompt, the least recently featured one is picked and a date
+    that is already scheduled is left alone. Returns the DailyPrompt, or None
+    when there are no prompts.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        if prompt_id is None:
+            cursor.execute(NEXT_DAILY_PROMPT)
+            row = cursor.fetchone()
+            if row is None:
+                return None
+            cursor.execute(SCHEDULE_DAILY_PROMPT.format(conflict='NOTHING'), [date, row[0]])
+        else:
+            cursor.execute(SCHEDULE_DAILY_PROMPT.format(conflict='UPDATE SET prompt_id = EXCLUDED.prompt_id'), [date, prompt_id])
+        if cursor.fetchone():
+            rebuild_daily_responses(date)
+    return DailyPrompt.objects.select_related('PromptID').get(pk=date)
+
+
+def rebuild_daily_responses(date):
+    """
+    Recompute the responses snapshot of `date` from the posts table. Returns
+    the number of responses, or None when nothing is scheduled that day.
+    """
+    start = timezone.make_aware(datetime.combine(date, time.min))
+    with transaction.atomic(), connection.cursor() as cursor:
+        prompt_id = DailyPrompt.objects.filter(pk=date).values_list('PromptID', flat=True).first()
+        if prompt_id is None:
+            return None
+        # Writers queue on the lock instead of adding to rows about to be replaced
+        cursor.execute('LOCK TABLE daily_responses IN EXCLUSIVE MODE;')
+        cursor.execute(REBUILD_DAILY_RESPONSES, {
+            "date": date,
+            "prompt": prompt_id,
+            "start": start,
+            "end": start + timedelta(days=1),
+        })
+        rebuilt = cursor.rowcount
+    invalidate_on_commit('daily')
+    return rebuilt
+
+
+def add_daily_response(post):
+    """
+    Add a new post to the responses snapshot if it answers the daily prompt of the day it was created.
+    """
+    if post.PromptID_id is None:
+        return
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_DAILY_RESPONSE, {
+            "post": post.PostID,
+            "score": post.UpvoteCount - post.DownvoteCount,
+            "date": timezone.localdate(post.CreatedAt),
+            "prompt": post.PromptID_id,
+        })
+
+
+def apply_daily_score_deltas(deltas):
+    """
+    Add {post_id: net votes} to the posts' snapshot scores with a single
+    statement. Posts that are not daily responses are skipped.
+    """
+    # Sorted so that concurrent writers lock rows in the same order
+    rows = sorted((post_id, net) for post_id, net in deltas.items() if net)
+    if not rows:
+        return
+    params = [value for row in rows for value in row]
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_DAILY_SCORE_DELTAS.format(values=', '.join(['(%s, %s)'] * len(rows))), params)
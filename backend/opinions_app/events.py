@@ -0,0 +1,235 @@
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, connections, transaction
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+from django.db.utils import load_backend
+from rest_framework.utils.encoders import JSONEncoder
+
+from .serializers import PostSerializer, ReplySerializer
+
+logger = logging.getLogger(__name__)
+
+# Channel of the Postgres backend. NOTIFY payloads must stay under 8000 bytes.
+NOTIFY_CHANNEL = 'opinion_events'
+MAX_NOTIFY_PAYLOAD = 7900
+
+NOTIFY = "SELECT pg_notify(%s, %s);"
+
+# Sent instead of an event that could not be delivered: the client should
+# refetch what it shows (e.g. /posts/<id>/thread/) and carry on listening
+RESYNC = {"type": "resync"}
+
+
+class Subscription:
+    """
+    The events of some channels, queued for one client. Iterate it from the
+    event loop it was created on.
+    """
+
+    def __init__(self, broker, channels, loop):
+        self.broker = broker
+        self.channels = channels
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=settings.EVENT_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Called from any thread
+        try:
+            self.loop.call_soon_threadsafe(self._put, event)
+        except RuntimeError:
+            pass  # The client's event loop has shut down
+
+    def _put(self, event):
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # A client that cannot keep up is told to resync and dropped, rather
+            # than letting its queue grow without bound
+            self.overflowed = True
+            self.queue.get_nowait()
+            self.queue.put_nowait(RESYNC)
+
+    async def get(self):
+        """
+        The next event, or None once the subscription has overflowed and its
+        last event (a resync) has been taken.
+        """
+        if self.overflowed and self.queue.empty():
+            return None
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """
+    Fans events out to the subscribers of this process. Enough for a single
+    server process, and for tests.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscribers = defaultdict(set)
+
+    def subscribe(self, channels):
+        subscription = Subscription(self, channels, asyncio.get_running_loop())
+        with self.lock:
+            for channel in channels:
+                self.subscribers[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscribers[channel].discard(subscription)
+                if not self.subscribers[channel]:
+                    del self.subscribers[channel]
+
+    def deliver(self, channels, event):
+        with self.lock:
+            # A subscriber of several of the channels gets the event once
+            targets = set().union(*[self.subscribers.get(channel, ()) for channel in channels])
+        for subscription in targets:
+            subscription.deliver(event)
+
+    def publish(self, channels, event):
+        self.deliver(channels, event)
+
+
+class PostgresBroker(LocalBroker):
+    """
+    Fans events out to the subscribers of every server process through
+    Postgres LISTEN/NOTIFY. Each process holds one listening connection,
+    opened on its first subscription.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def publish(self, channels, event):
+        payload = json.dumps({"channels": channels, "event": event}, cls=JSONEncoder, separators=(',', ':'))
+        if len(payload.encode()) > MAX_NOTIFY_PAYLOAD:
+            payload = json.dumps({"channels": channels, "event": RESYNC})
+        with connection.cursor() as cursor:
+            cursor.execute(NOTIFY, [NOTIFY_CHANNEL, payload])
+
+    def subscribe(self, channels):
+        subscription = super().subscribe(channels)
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self._listen, name='event-listener', daemon=True)
+                self.listener.start()
+        return subscription
+
+    def _listen(self):
+        while True:
+            try:
+                self._listen_once()
+            except Exception:
+                logger.exception("Event listener connection failed, reconnecting")
+            # Events published while disconnected are lost; tell everyone to resync
+            with self.lock:
+                channels = list(self.subscribers)
+            if channels:
+                self.deliver(channels, RESYNC)
+            time.sleep(1)
+
+    def _listen_once(self):
+        # A connection of its own, outside the pool with DB_CONNECTIONS=pool:
+        # it is never given back
+        settings_dict = connections.settings['default']
+        options = {key: value for key, value in settings_dict['OPTIONS'].items() if key != 'pool'}
+        listener = load_backend(settings_dict['ENGINE']).DatabaseWrapper({**settings_dict, 'OPTIONS': options}, 'default')
+        try:
+            listener.connect()
+            listener.set_autocommit(True)
+            raw = listener.connection
+            with raw.cursor() as cursor:
+                cursor.execute(f"LISTEN {NOTIFY_CHANNEL};")
+            while True:
+                if is_psycopg3:
+                    for notify in raw.notifies(timeout=60):
+                        self._receive(notify.payload)
+                elif select.select([raw], [], [], 60)[0]:
+                    raw.poll()
+                    while raw.notifies:
+                        self._receive(raw.notifies.pop(0).payload)
+                    continue
+                # Idle: make sure the connection is still alive
+                with raw.cursor() as cursor:
+                    cursor.execute("SELECT 1;")
+        finally:
+            listener.close()
+
+    def _receive(self, payload):
+        message = json.loads(payload)
+        self.deliver(message["channels"], message["event"])
+
+
+BROKERS = {
+    'local': LocalBroker,
+    'postgres': PostgresBroker,
+}
+
+broker = None
+broker_lock = threading.Lock()
+
+
+def get_broker():
+    global broker
+    with broker_lock:
+        if broker is None:
+            broker = BROKERS[settings.EVENT_BROKER]()
+    return broker
+
+
+def publish_on_commit(channels, event):
+    """
+    Publish `event` to the subscribers of `channels` (e.g. ['post:5', 'prompt:2'])
+    once the current transaction commits, so clients never hear of rows that
+    were rolled back. A failure to publish is logged and does not fail the
+    write that already committed.
+    """
+    transaction.on_commit(lambda: get_broker().publish(channels, event), robust=True)
+
+
+def post_channels(post_id, prompt_id):
+    # Events about a post go to its own subscribers and to those of its prompt
+    return [f'post:{post_id}'] + ([f'prompt:{prompt_id}'] if prompt_id else [])
+
+
+def publish_votes(post_id, prompt_id, upvotes, downvotes):
+    publish_on_commit(post_channels(post_id, prompt_id), {
+        "type": "votes",
+        "PostID": post_id,
+        "UpvoteCount": upvotes,
+        "DownvoteCount": downvotes,
+    })
+
+
+def publish_replies(replies, prompt_ids):
+    """
+    Publish new replies, given the {post_id: prompt_id} of their posts. Load
+    the replies' authors first, or each is fetched when serialized.
+    """
+    data = ReplySerializer(replies, many=True, context={'expand': {'author'}}).data
+    for reply, item in zip(replies, data):
+        publish_on_commit(post_channels(reply.PostID_id, prompt_ids.get(reply.PostID_id)), {"type": "reply", "reply": item})
+
+
+def publish_post(post):
+    if post.PromptID_id:
+        data = PostSerializer(post, context={'expand': {'author'}}).data
+        publish_on_commit([f'prompt:{post.PromptID_id}'], {"type": "post", "post": data})
@@ -0,0 +1,48 @@
+from django.db.models import Count, IntegerField, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from .models import Reply
+
+POST_EXPANSIONS = {'prompt', 'author', 'reply_count'}
+REPLY_EXPANSIONS = {'author'}
+
+
+def parse_expand(request, allowed):
+    """
+    The set of relations requested with `?expand=a,b`. Unknown names are ignored.
+    """
+    names = request.query_params.get('expand', '').split(',')
+    return {name.strip() for name in names} & allowed
+
+
+def reply_count(post_ref='pk', **filters):
+    # A correlated subquery is evaluated only for the rows of the page, where
+    # a JOIN + GROUP BY would aggregate every reply before the LIMIT applies.
+    # `filters` narrow the count, e.g. isAgree=True.
+    counts = (
+        Reply.objects.filter(PostID=OuterRef(post_ref), **filters)
+        .order_by()
+        .values('PostID')
+        .annotate(count=Count('*'))
+        .values('count')
+    )
+    return Coalesce(Subquery(counts, output_field=IntegerField()), Value(0))
+
+
+def expand_posts(queryset, expand, prefix=''):
+    """
+    Load the requested relations of a Post queryset in the same query.
+    `prefix` is the path to the post when the queryset is of a related model.
+    """
+    related = [prefix + field for name, field in (('prompt', 'PromptID'), ('author', 'UserID')) if name in expand]
+    if related:
+        queryset = queryset.select_related(*related)
+    if 'reply_count' in expand:
+        queryset = queryset.annotate(ReplyCount=reply_count(prefix + 'pk'))
+    return queryset
+
+
+def expand_replies(queryset, expand):
+    if 'author' in expand:
+        queryset = queryset.select_related('UserID')
+    return queryset
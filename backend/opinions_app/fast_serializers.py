@@ -0,0 +1,121 @@
+import datetime
+from functools import lru_cache
+
+from django.conf import settings
+from django.utils import timezone
+from rest_framework import ISO_8601, serializers
+from rest_framework.settings import api_settings
+
+# Fields whose to_representation() returns the database value unchanged,
+# unless a subclass overrides it
+PASSTHROUGH_FIELDS = (
+    serializers.BooleanField,
+    serializers.CharField,
+    serializers.FloatField,
+    serializers.IntegerField,
+    serializers.PrimaryKeyRelatedField,
+)
+PASSTHROUGH_METHODS = {field_class.to_representation for field_class in PASSTHROUGH_FIELDS}
+
+
+def is_passthrough(field):
+    return isinstance(field, PASSTHROUGH_FIELDS) and type(field).to_representation in PASSTHROUGH_METHODS
+
+
+def is_iso_datetime(field):
+    # A DateTimeField rendered as DRF does by default: ISO 8601 in the current time zone
+    return (
+        isinstance(field, serializers.DateTimeField)
+        and not hasattr(field, 'timezone')
+        and settings.USE_TZ
+        and (getattr(field, 'format', api_settings.DATETIME_FORMAT) or '').lower() == ISO_8601
+    )
+
+
+def format_datetime(value, tz):
+    # DateTimeField.to_representation() for an aware datetime, given the current time zone
+    value = value.astimezone(tz).isoformat()
+    if value.endswith('+00:00'):
+        value = value[:-6] + 'Z'
+    return value
+
+
+class RowSerializer:
+    """
+    A ModelSerializer compiled, once, into a mapping from values_list() rows
+    to the dicts the serializer outputs, for read-only list views. Building a
+    model instance per row and DRF's per-object field lookups then cost
+    nothing; only fields that change the database value run their DRF
+    to_representation(). Dates are formatted here, with the current time zone
+    looked up once per page instead of once per value.
+
+    Supports plain model fields, annotations, primary key relations and
+    nested ModelSerializers over a foreign key, which covers every serializer
+    in serializers.py including their expansions. Use row_serializer() to
+    get a cached instance.
+    """
+
+    def __init__(self, serializer_class, expand=frozenset()):
+        self.columns = []  # values_list() paths, in row order
+        self.serialize_row = self.compile(serializer_class(context={'expand': expand}), prefix='')
+
+    def compile(self, serializer, prefix):
+        """
+        Add the serializer's columns and return a function building its dict from a row.
+        """
+        start = len(self.columns)
+        names, converters, datetimes, nested = [], [], [], []
+        for name, field in serializer.fields.items():
+            if field.write_only:
+                continue
+            if field.source == '*' or '.' in field.source or isinstance(field, (serializers.SerializerMethodField, serializers.ListSerializer)):
+                raise ValueError(f"{type(serializer).__name__}.{name} cannot be read from a values_list() row.")
+            names.append(name)
+            # A nested serializer's slot holds the foreign key, which is None when there is no related row
+            self.columns.append(prefix + field.source)
+            if isinstance(field, serializers.BaseSerializer):
+                nested.append((name, field))
+            elif is_iso_datetime(field):
+                datetimes.append((name, field.to_representation))
+            elif not is_passthrough(field):
+                converters.append((name, field.to_representation))
+        end = len(self.columns)
+
+        # Nested columns come after this serializer's own, which stay contiguous
+        nested = [(name, self.compile(field, prefix + field.source + '__')) for name, field in nested]
+
+        def serialize_row(row, tz):
+            data = dict(zip(names, row[start:end] if start else row))
+            for name, convert in converters:
+                value = data[name]
+                if value is not None:
+                    data[name] = convert(value)
+            for name, convert in datetimes:
+                value = data[name]
+                if isinstance(value, datetime.datetime) and timezone.is_aware(value):
+                    data[name] = format_datetime(value, tz)
+                elif value is not None:
+                    data[name] = convert(value)
+            for name, serialize_nested in nested:
+                if data[name] is not None:
+                    data[name] = serialize_nested(row, tz)
+            return data
+        return serialize_row
+
+    def values_list(self, queryset, extra=()):
+        """
+        The queryset's rows with the serializer's columns, followed by the `extra` ones.
+        """
+        return queryset.values_list(*self.columns, *extra)
+
+    def serialize(self, rows):
+        tz = timezone.get_current_timezone()
+        return [self.serialize_row(row, tz) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def row_serializer(serializer_class, expand=frozenset()):
+    """
+    The RowSerializer of a serializer class and set of expansions.
+    """
+    return RowSerializer(serializer_class, frozenset(expand))
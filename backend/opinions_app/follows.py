@@ -0,0 +1,135 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+from django.db.models import F
+
+from .models import User
+from . import timeline
+from .response_cache import invalidate_on_commit
+
+INSERT_FOLLOW = """
+INSERT INTO follows (follower_id, followee_id, created_at)
+VALUES (%s, %s, NOW())
+ON CONFLICT (follower_id, followee_id) DO NOTHING
+RETURNING followid;
+"""
+
+DELETE_FOLLOW = """
+DELETE FROM follows
+WHERE follower_id = %s AND followee_id = %s;
+"""
+
+INSERT_FOLLOWS = """
+INSERT INTO follows (follower_id, followee_id, created_at)
+SELECT follower_id, followee_id, NOW() FROM (VALUES {values}) AS pairs (follower_id, followee_id)
+ON CONFLICT (follower_id, followee_id) DO NOTHING
+RETURNING follower_id, followee_id;
+"""
+
+DELETE_FOLLOWS = """
+DELETE FROM follows
+USING (VALUES {values}) AS pairs (follower_id, followee_id)
+WHERE follows.follower_id = pairs.follower_id AND follows.followee_id = pairs.followee_id
+RETURNING follows.follower_id, follows.followee_id;
+"""
+
+ADJUST_FOLLOW_COUNTS = """
+UPDATE users
+SET follower_count = users.follower_count + deltas.followers,
+    following_count = users.following_count + deltas.following
+FROM (VALUES {values}) AS deltas (userid, followers, following)
+WHERE users.userid = deltas.userid;
+"""
+
+
+def pair_values(pairs):
+    # VALUES rows and flat params for [(a, b), ...]
+    return ', '.join(['(%s, %s)'] * len(pairs)), [value for pair in pairs for value in pair]
+
+
+def adjust_follow_counts(follower_id, followee_id, delta):
+    # Always lock the lower user ID first so that two users following each
+    # other at the same time cannot deadlock.
+    updates = sorted([
+        (follower_id, {'FollowingCount': F('FollowingCount') + delta}),
+        (followee_id, {'FollowerCount': F('FollowerCount') + delta}),
+    ], key=lambda update: update[0])
+    for user_id, fields in updates:
+        User.objects.filter(pk=user_id).update(**fields)
+    invalidate_on_commit(f'user:{follower_id}', f'user:{followee_id}')
+
+
+def follow(follower_id, followee_id):
+    """
+    Make follower_id follow followee_id. Returns False if it already did.
+    Raises IntegrityError if either user does not exist.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(INSERT_FOLLOW, [follower_id, followee_id])
+            created = cursor.fetchone() is not None
+        if created:
+            adjust_follow_counts(follower_id, followee_id, 1)
+            timeline.backfill_author(follower_id, followee_id)
+    return created
+
+
+def unfollow(follower_id, followee_id):
+    """
+    Remove the follow edge. Returns False if follower_id was not following followee_id.
+    """
+    with transaction.atomic():
+        with connection.cursor() as cursor:
+            cursor.execute(DELETE_FOLLOW, [follower_id, followee_id])
+            deleted = cursor.rowcount > 0
+        if deleted:
+            adjust_follow_counts(follower_id, followee_id, -1)
+            timeline.remove_author(follower_id, followee_id)
+    return deleted
+
+
+def apply_follows(ops):
+    """
+    Follow and unfollow many pairs at once, given as [(op, follower_id, followee_id), ...]
+    with op 'follow' or 'unfollow', in the order they were made. Several ops
+    on one pair collapse to the last. Edges, counters and timelines are each
+    written with one statement per kind of change.
+
+    Returns {(follower_id, followee_id): whether the last op changed anything}.
+    Call it in a transaction. Raises IntegrityError if a user does not exist.
+    """
+    last_ops = {}
+    for op, follower_id, followee_id in ops:
+        last_ops[(follower_id, followee_id)] = op
+    # Sorted so that concurrent batches lock rows in the same order
+    to_follow = sorted(pair for pair, op in last_ops.items() if op == 'follow')
+    to_unfollow = sorted(pair for pair, op in last_ops.items() if op == 'unfollow')
+
+    followed, unfollowed = [], []
+    with connection.cursor() as cursor:
+        if to_follow:
+            values, params = pair_values(to_follow)
+            cursor.execute(INSERT_FOLLOWS.format(values=values), params)
+            followed = cursor.fetchall()
+        if to_unfollow:
+            values, params = pair_values(to_unfollow)
+            cursor.execute(DELETE_FOLLOWS.format(values=values), params)
+            unfollowed = cursor.fetchall()
+
+        counts = defaultdict(lambda: [0, 0])  # user ID -> [followers, following] change
+        for pairs, delta in ((followed, 1), (unfollowed, -1)):
+            for follower_id, followee_id in pairs:
+                counts[follower_id][1] += delta
+                counts[followee_id][0] += delta
+        rows = sorted((user_id, followers, following) for user_id, (followers, following) in counts.items() if followers or following)
+        if rows:
+            cursor.execute(
+                ADJUST_FOLLOW_COUNTS.format(values=', '.join(['(%s, %s, %s)'] * len(rows))),
+                [value for row in rows for value in row],
+            )
+            invalidate_on_commit(*[f'user:{user_id}' for user_id, _, _ in rows])
+
+    timeline.backfill_authors(followed)
+    timeline.remove_authors(unfollowed)
+    changed = set(followed) | set(unfollowed)
+    return {pair: pair in changed for pair in last_ops}
@@ -0,0 +1,323 @@
+import io
+import json
+import os
+import random
+import statistics
+import subprocess
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from PIL import Image
+
+from opinions_app import urls as api_urls
+from opinions_app.management.commands.generate_data import vocabulary
+
+# Request targets: a random sample plus the busiest rows, which see most real traffic
+SAMPLE_USERS = """
+(SELECT userid, username FROM users ORDER BY random() LIMIT %(size)s)
+UNION
+(SELECT userid, username FROM users ORDER BY follower_count DESC LIMIT 20);
+"""
+
+SAMPLE_AUTHORS = """
+SELECT user_id FROM user_stats WHERE post_count > 0 ORDER BY random() LIMIT %(size)s;
+"""
+
+SAMPLE_POSTS = """
+(SELECT postid FROM posts ORDER BY random() LIMIT %(size)s)
+UNION
+(SELECT postid FROM posts ORDER BY trending_score DESC LIMIT 20);
+"""
+
+SAMPLE_PROMPTS = """
+SELECT promptid, category FROM prompts ORDER BY random() LIMIT %(size)s;
+"""
+
+TABLE_SIZES = """
+SELECT relname, reltuples::bigint FROM pg_class
+WHERE relname IN ('users', 'prompts', 'posts', 'replies', 'votes', 'follows', 'timelines') ORDER BY relname;
+"""
+
+
+# Search terms: words of the generated texts, from common to fairly rare
+SEARCH_TERMS = vocabulary()[:1000]
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+def pair(rng, users):
+    # Two distinct users
+    first, second = rng.sample(users, 2)
+    return first[0], second[0]
+
+
+def batch(rng, t):
+    # A client's offline queue: a mix of votes, replies and follow changes
+    return {
+        'votes': [
+            {'post_id': rng.choice(t['posts']), 'vote_type': rng.choice(['upvote', 'downvote']), 'user_id': rng.choice(t['users'])[0]}
+            for _ in range(10)
+        ],
+        'replies': [
+            {'PostID': rng.choice(t['posts']), 'UserID': rng.choice(t['users'])[0], 'ReplyText': 'Benchmark reply', 'isAgree': rng.random() < 0.5}
+            for _ in range(5)
+        ],
+        'follows': [
+            (lambda ids: {'op': rng.choice(['follow', 'unfollow']), 'follower_id': ids[0], 'followee_id': ids[1]})(pair(rng, t['users']))
+            for _ in range(5)
+        ],
+    }
+
+
+def avatar(rng):
+    # A photo-sized PNG in one of a few colours, so that some uploads are repeats
+    output = io.BytesIO()
+    Image.new('RGB', (1024, 768), tuple(rng.choice((0, 128, 255)) for _ in range(3))).save(output, 'PNG')
+    return {'file': SimpleUploadedFile('avatar.png', output.getvalue(), content_type='image/png')}
+
+
+# (URL name, method) -> builder(rng, targets) returning (URL kwargs, query string, body).
+# Every route in opinions_app/urls.py needs at least one entry; POST scenarios
+# write to the database and only run with --writes.
+SCENARIOS = {
+    ('user-list', 'GET'): lambda rng, t: ({}, '', None),
+    ('post-list', 'GET'): lambda rng, t: ({}, 'expand=prompt,author,reply_count', None),
+    ('trending-posts', 'GET'): lambda rng, t: ({}, rng.choice(['', f'category={rng.choice(t["prompts"])[1]}']), None),
+    ('follower-list', 'GET'): lambda rng, t: ({'userid': rng.choice(t['users'])[0]}, '', None),
+    ('prompt-list', 'GET'): lambda rng, t: ({}, '', None),
+    ('get_replies', 'GET'): lambda rng, t: ({'post_id': rng.choice(t['posts'])}, 'expand=author', None),
+    ('post-thread', 'GET'): lambda rng, t: ({'post_id': rng.choice(t['posts'])}, '', None),
+    ('post-stance', 'GET'): lambda rng, t: ({'post_id': rng.choice(t['posts'])}, rng.choice(['', 'period=hour']), None),
+    ('get_prompt', 'GET'): lambda rng, t: ({'prompt_id': rng.choice(t['prompts'])[0]}, '', None),
+    ('prompt-stance', 'GET'): lambda rng, t: ({'prompt_id': rng.choice(t['prompts'])[0]}, rng.choice(['', 'period=hour']), None),
+    ('user-posts', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['authors'])}, '', None),
+    ('get_user_by_id', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, '', None),
+    ('user-followers', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, '', None),
+    ('user-following', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, '', None),
+    ('user-timeline', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, 'expand=author', None),
+    ('user-recommendations', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, rng.choice(['', 'expand=author']), None),
+    ('get-prompts-by-category', 'GET'): lambda rng, t: ({'category': rng.choice(t['prompts'])[1]}, '', None),
+    ('category-stance', 'GET'): lambda rng, t: ({'category': rng.choice(t['prompts'])[1]}, rng.choice(['', 'period=hour&buckets=336']), None),
+    ('get-user-total-votes', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['authors'])}, '', None),
+    ('user-stats', 'GET'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, '', None),
+    ('get-post', 'GET'): lambda rng, t: ({'post_id': rng.choice(t['posts'])}, 'expand=prompt,author,reply_count', None),
+    ('cache-stats', 'GET'): lambda rng, t: ({}, '', None),
+    ('metrics', 'GET'): lambda rng, t: ({}, '', None),
+    ('daily-prompt', 'GET'): lambda rng, t: ({}, '', None),
+    ('search', 'GET'): lambda rng, t: ({}, f'q={rng.choice(SEARCH_TERMS)}&type={rng.choice(["posts", "replies", "prompts"])}', None),
+
+    ('user-list', 'POST'): lambda rng, t: ({}, '', {'Username': f'bench-{uuid.uuid4().hex}', 'Email': f'{uuid.uuid4().hex}@example.com', 'Password': 'x'}),
+    ('post-list', 'POST'): lambda rng, t: ({}, '', {'UserID': rng.choice(t['users'])[0], 'PromptID': rng.choice(t['prompts'])[0], 'PostText': 'Benchmark post'}),
+    ('follower-list', 'POST'): lambda rng, t: (lambda ids: ({'userid': ids[0]}, '', {'follower_id': ids[1]}))(pair(rng, t['users'])),
+    ('prompt-list', 'POST'): lambda rng, t: ({}, '', {'PromptText': 'Benchmark prompt', 'Category': rng.choice(t['prompts'])[1]}),
+    ('login', 'POST'): lambda rng, t: ({}, '', {'Username': rng.choice(t['users'])[1]}),
+    ('update-votes', 'POST'): lambda rng, t: ({'vote_type': rng.choice(['upvote', 'downvote']), 'post_id': rng.choice(t['posts'])}, '', {'user_id': rng.choice(t['users'])[0]}),
+    ('register', 'POST'): lambda rng, t: ({}, '', {'Username': f'bench-{uuid.uuid4().hex}'}),
+    ('get_replies', 'POST'): lambda rng, t: ({'post_id': rng.choice(t['posts'])}, '', {'UserID': rng.choice(t['users'])[0], 'ReplyText': 'Benchmark reply', 'isAgree': rng.random() < 0.5}),
+    ('follow-user', 'POST'): lambda rng, t: (lambda ids: ({'user_id': ids[0]}, '', {'follower_user_id': ids[1]}))(pair(rng, t['users'])),
+    ('unfollow-user', 'POST'): lambda rng, t: (lambda ids: ({'user_id': ids[0]}, '', {'follower_user_id': ids[1]}))(pair(rng, t['users'])),
+    ('batch', 'POST'): lambda rng, t: ({}, '', batch(rng, t)),
+    ('user-avatar', 'POST'): lambda rng, t: ({'user_id': rng.choice(t['users'])[0]}, '', avatar(rng)),
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark every API route: runs concurrent requests through the Django test client against the "
+        "configured database and reports p50/p95/p99 latency, throughput and queries per request. "
+        "Results are saved as JSON and can be diffed against a previous run with --compare or --diff. "
+        "Run `manage.py generate_data` first for realistic numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=200, help="Measured requests per scenario (default: 200).")
+        parser.add_argument('--concurrency', type=int, default=8, help="Concurrent client threads (default: 8).")
+        parser.add_argument('--warmup', type=int, default=10, help="Unmeasured requests per scenario (default: 10).")
+        parser.add_argument('--writes', action='store_true', help="Also run the POST scenarios, which write to the database.")
+        parser.add_argument('--only', action='append', default=[], help="Only run scenarios of this URL name (repeatable).")
+        parser.add_argument('--no-cache', action='store_true', help="Disable the response cache for the run.")
+        parser.add_argument('--sample-size', type=int, default=1000, help="Random users, posts and prompts to target (default: 1000).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for the request targets.")
+        parser.add_argument('--label', default=None, help="Name of the results file (default: a timestamp).")
+        parser.add_argument('--output-dir', default=os.path.join(settings.BASE_DIR, 'benchmarks'), help="Where results are saved (default: backend/benchmarks).")
+        parser.add_argument('--compare', metavar='BASELINE', help="Compare this run with a saved results file.")
+        parser.add_argument('--diff', nargs=2, metavar=('OLD', 'NEW'), help="Compare two saved results files without running anything.")
+        parser.add_argument('--threshold', type=float, default=10.0, help="p95 increase, in percent, reported as a regression (default: 10).")
+        parser.add_argument('--fail-on-regression', action='store_true', help="Exit with an error when a regression is found.")
+
+    def handle(self, *args, **options):
+        if options['diff']:
+            old, new = (self.load(path) for path in options['diff'])
+            return self.report_diff(old, new, options)
+
+        self.check_coverage()
+        targets = self.sample_targets(options)
+        scenarios = [
+            (name, method) for name, method in SCENARIOS
+            if (method == 'GET' or options['writes']) and (not options['only'] or name in options['only'])
+        ]
+
+        started = datetime.now(dt_timezone.utc)
+        # Every request comes from one client, which the rate limits would stop after a few writes
+        with override_settings(RESPONSE_CACHE_ENABLED=settings.RESPONSE_CACHE_ENABLED and not options['no_cache'], THROTTLE_ENABLED=False):
+            results = {}
+            for name, method in scenarios:
+                results[f'{method} {name}'] = result = self.run_scenario(name, method, targets, options)
+                self.stdout.write(self.format_result(f'{method} {name}', result))
+
+        run = {
+            "started": started.isoformat(),
+            "git": self.git_revision(),
+            "options": {key: options[key] for key in ('requests', 'concurrency', 'warmup', 'writes', 'no_cache', 'seed')},
+            "table_sizes": self.table_sizes(),
+            "results": results,
+        }
+        path = self.save(run, options)
+        self.stdout.write(self.style.SUCCESS(f"Results saved to {path}"))
+
+        if options['compare']:
+            self.report_diff(self.load(options['compare']), run, options)
+
+    def check_coverage(self):
+        names = {pattern.name for pattern in api_urls.urlpatterns}
+        missing = names - {name for name, _ in SCENARIOS}
+        if missing:
+            raise CommandError(f"No benchmark scenario for: {', '.join(sorted(missing))}. Add them to SCENARIOS.")
+
+    def sample_targets(self, options):
+        params = {"size": options['sample_size']}
+        with connection.cursor() as cursor:
+            cursor.execute(SAMPLE_USERS, params)
+            users = cursor.fetchall()
+            cursor.execute(SAMPLE_AUTHORS, params)
+            authors = [row[0] for row in cursor.fetchall()]
+            cursor.execute(SAMPLE_POSTS, params)
+            posts = [row[0] for row in cursor.fetchall()]
+            cursor.execute(SAMPLE_PROMPTS, params)
+            prompts = cursor.fetchall()
+        if len(users) < 2 or not authors or not posts or not prompts:
+            raise CommandError("Not enough data to benchmark; run `manage.py generate_data` first.")
+        return {"users": users, "authors": authors, "posts": posts, "prompts": prompts, "rng_seed": options['seed']}
+
+    def run_scenario(self, name, method, targets, options):
+        build = SCENARIOS[(name, method)]
+        threads = options['concurrency']
+        latencies, query_counts, statuses = [], [], {}
+        lock = threading.Lock()
+
+        def worker(index):
+            rng = random.Random(f"{targets['rng_seed']}-{name}-{method}-{index}")
+            # Server errors are counted like any other status instead of aborting the run
+            client = Client(HTTP_HOST='127.0.0.1', raise_request_exception=False)
+            share = options['requests'] // threads + (index < options['requests'] % threads)
+            warmup = options['warmup'] // threads + (index < options['warmup'] % threads)
+            try:
+                for i in range(warmup + share):
+                    kwargs, query, body = build(rng, targets)
+                    url = reverse(name, kwargs=kwargs) + (f'?{query}' if query else '')
+                    with CaptureQueriesContext(connection) as queries:
+                        request_started = time.perf_counter()
+                        if method == 'GET':
+                            response = client.get(url)
+                        elif name == 'user-avatar':
+                            response = client.post(url, body)  # Multipart
+                        else:
+                            response = client.post(url, body, content_type='application/json')
+                        elapsed = time.perf_counter() - request_started
+                    if i < warmup:
+                        continue
+                    with lock:
+                        latencies.append(elapsed)
+                        query_counts.append(len(queries))
+                        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        wall = time.perf_counter() - started
+
+        return {
+            "requests": len(latencies),
+            "errors": sum(count for code, count in statuses.items() if code >= 400),
+            "statuses": {str(code): count for code, count in sorted(statuses.items())},
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+            "throughput_rps": round(len(latencies) / wall, 1),
+            "queries_per_request": round(statistics.mean(query_counts), 2),
+        }
+
+    def format_result(self, scenario, result):
+        line = (
+            f"{scenario:<36} p50={result['p50_ms']:>7.1f}ms p95={result['p95_ms']:>7.1f}ms "
+            f"p99={result['p99_ms']:>7.1f}ms {result['throughput_rps']:>7.1f} req/s "
+            f"{result['queries_per_request']:>5.1f} queries/req"
+        )
+        if result['errors']:
+            line += f"  errors={result['errors']} {result['statuses']}"
+        return line
+
+    def report_diff(self, old, new, options):
+        self.stdout.write(f"Comparing {old.get('git') or old['started']} -> {new.get('git') or new['started']}")
+        regressions = []
+        for scenario, result in new['results'].items():
+            before = old['results'].get(scenario)
+            if before is None:
+                self.stdout.write(f"{scenario:<36} (new)")
+                continue
+            change = (result['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            line = (
+                f"{scenario:<36} p95 {before['p95_ms']:>7.1f} -> {result['p95_ms']:>7.1f}ms ({change:+.0f}%)  "
+                f"req/s {before['throughput_rps']:>7.1f} -> {result['throughput_rps']:>7.1f}  "
+                f"queries {before['queries_per_request']:.1f} -> {result['queries_per_request']:.1f}"
+            )
+            if change > options['threshold'] or result['queries_per_request'] > before['queries_per_request']:
+                regressions.append(scenario)
+                line = self.style.ERROR(line + "  REGRESSION")
+            self.stdout.write(line)
+        if regressions and options['fail_on_regression']:
+            raise CommandError(f"{len(regressions)} scenarios regressed: {', '.join(regressions)}")
+
+    def git_revision(self):
+        try:
+            return subprocess.run(
+                ['git', 'rev-parse', '--short', 'HEAD'], cwd=settings.BASE_DIR,
+                capture_output=True, text=True, check=True,
+            ).stdout.strip()
+        except (OSError, subprocess.CalledProcessError):
+            return None
+
+    def table_sizes(self):
+        with connection.cursor() as cursor:
+            cursor.execute(TABLE_SIZES)
+            return dict(cursor.fetchall())
+
+    def save(self, run, options):
+        os.makedirs(options['output_dir'], exist_ok=True)
+        label = options['label'] or datetime.now().strftime('bench-%Y%m%d-%H%M%S')
+        path = os.path.join(options['output_dir'], f'{label}.json')
+        with open(path, 'w') as results_file:
+            json.dump(run, results_file, indent=2)
+        return path
+
+    def load(self, path):
+        try:
+            with open(path) as results_file:
+                return json.load(results_file)
+        except (OSError, ValueError) as e:
+            raise CommandError(f"Cannot read results file {path}: {e}")
@@ -0,0 +1,136 @@
+import http.client
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand, CommandError
+from django.urls import reverse
+
+from opinions_app import async_urls
+from opinions_app.management.commands import bench_api
+from opinions_app.management.commands.bench_api import SCENARIOS, percentile
+
+# Async URL name -> the sync route it mirrors, whose bench_api scenario builds the requests
+ENDPOINTS = {
+    'async-trending-posts': 'trending-posts',
+    'async-get-post': 'get-post',
+    'async-get-replies': 'get_replies',
+    'async-get-prompt': 'get_prompt',
+    'async-get-prompts-by-category': 'get-prompts-by-category',
+    'async-get-user': 'get_user_by_id',
+}
+
+# Long-lived event streams, which have no request/response latency to compare
+STREAMS = {'post-events', 'prompt-events'}
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync read endpoints served by a WSGI server with their async versions served by an "
+        "ASGI server, over real HTTP at one or more concurrency levels. Start both servers first, e.g. "
+        "`gunicorn changemyopinion.wsgi -w 4 --threads 4 -b 127.0.0.1:8000` and "
+        "`uvicorn changemyopinion.asgi:application --workers 4 --port 8001`, with RESPONSE_CACHE_ENABLED=False "
+        "so every request reaches the database."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--wsgi-url', default='http://127.0.0.1:8000', help="Base URL of the WSGI server (default: http://127.0.0.1:8000).")
+        parser.add_argument('--asgi-url', default='http://127.0.0.1:8001', help="Base URL of the ASGI server (default: http://127.0.0.1:8001).")
+        parser.add_argument('--concurrency', default='1,16,64', help="Comma-separated client thread counts (default: 1,16,64).")
+        parser.add_argument('--requests', type=int, default=500, help="Measured requests per endpoint and level (default: 500).")
+        parser.add_argument('--warmup', type=int, default=20, help="Unmeasured requests per endpoint and level (default: 20).")
+        parser.add_argument('--only', action='append', default=[], help="Only run this async URL name (repeatable).")
+        parser.add_argument('--sample-size', type=int, default=1000, help="Random users, posts and prompts to target (default: 1000).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for the request targets.")
+
+    def handle(self, *args, **options):
+        missing = {pattern.name for pattern in async_urls.urlpatterns} - set(ENDPOINTS) - STREAMS
+        if missing:
+            raise CommandError(f"No benchmark endpoint for: {', '.join(sorted(missing))}. Add them to ENDPOINTS.")
+        try:
+            levels = [int(level) for level in options['concurrency'].split(',')]
+        except ValueError:
+            raise CommandError("--concurrency takes comma-separated integers, e.g. 1,16,64.")
+
+        targets = bench_api.Command().sample_targets(options)
+        servers = {'wsgi': options['wsgi_url'], 'asgi': options['asgi_url']}
+        for server, base_url in servers.items():
+            self.check_server(server, base_url)
+
+        for async_name, sync_name in ENDPOINTS.items():
+            if options['only'] and async_name not in options['only']:
+                continue
+            for threads in levels:
+                results = {
+                    server: self.run(base_url, name, SCENARIOS[(sync_name, 'GET')], targets, threads, options)
+                    for server, name, base_url in (('wsgi', sync_name, servers['wsgi']), ('asgi', async_name, servers['asgi']))
+                }
+                self.stdout.write(self.format_results(sync_name, threads, results))
+
+    def check_server(self, server, base_url):
+        parts = urlsplit(base_url)
+        try:
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=5)
+            connection.request('GET', reverse('prompt-list'))
+            connection.getresponse().read()
+            connection.close()
+        except OSError as error:
+            raise CommandError(f"The {server.upper()} server at {base_url} is not reachable: {error}")
+
+    def run(self, base_url, name, build, targets, threads, options):
+        parts = urlsplit(base_url)
+        latencies, errors = [], 0
+        lock = threading.Lock()
+
+        def worker(index):
+            nonlocal errors
+            rng = random.Random(f"{targets['rng_seed']}-{name}-{threads}-{index}")
+            # One keep-alive connection per client thread
+            connection = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=30)
+            share = options['requests'] // threads + (index < options['requests'] % threads)
+            warmup = options['warmup'] // threads + (index < options['warmup'] % threads)
+            try:
+                for i in range(warmup + share):
+                    kwargs, query, _ = build(rng, targets)
+                    url = reverse(name, kwargs=kwargs) + (f'?{query}' if query else '')
+                    request_started = time.perf_counter()
+                    connection.request('GET', url)
+                    response = connection.getresponse()
+                    response.read()
+                    elapsed = time.perf_counter() - request_started
+                    if i < warmup:
+                        continue
+                    with lock:
+                        latencies.append(elapsed)
+                        errors += response.status >= 500
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            list(pool.map(worker, range(threads)))
+        wall = time.perf_counter() - started
+
+        return {
+            "errors": errors,
+            "p50_ms": percentile(latencies, 0.50) * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "p99_ms": percentile(latencies, 0.99) * 1000,
+            "throughput_rps": len(latencies) / wall,
+        }
+
+    def format_results(self, name, threads, results):
+        lines = [f"{name} @ {threads} threads"]
+        for server, result in results.items():
+            line = (
+                f"  {server}  p50={result['p50_ms']:>7.1f}ms p95={result['p95_ms']:>7.1f}ms "
+                f"p99={result['p99_ms']:>7.1f}ms {result['throughput_rps']:>7.1f} req/s"
+            )
+            if result['errors']:
+                line += f"  5xx={result['errors']}"
+            lines.append(line)
+        speedup = results['asgi']['throughput_rps'] / max(results['wsgi']['throughput_rps'], 1e-9)
+        lines.append(f"  asgi/wsgi throughput: {speedup:.2f}x")
+        return "\n".join(lines)
@@ -0,0 +1,112 @@
+import importlib.util
+import statistics
+import threading
+import time
+
+from django.core.management.base import BaseCommand
+from django.core.signals import request_finished, request_started
+from django.db import connection, connections
+from django.db.backends.postgresql.psycopg_any import is_psycopg3
+
+from opinions_app.models import Prompt
+
+SESSIONS = "SELECT sessions FROM pg_stat_database WHERE datname = current_database();"
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time requests that each run one small query under every DB_CONNECTIONS mode (see settings.py), "
+        "with the request_started and request_finished signals that open, check and close connections "
+        "as Django's handlers send them, and count the Postgres sessions each mode opens. "
+        "The pool mode needs psycopg 3 and psycopg_pool."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500, help="Requests per mode and thread (default: 500).")
+        parser.add_argument('--threads', type=int, default=4, help="Threads sending requests at once (default: 4).")
+
+    def handle(self, *args, **options):
+        modes = {
+            'per-request': {'CONN_MAX_AGE': 0, 'CONN_HEALTH_CHECKS': False},
+            'persistent': {'CONN_MAX_AGE': 300, 'CONN_HEALTH_CHECKS': True},
+        }
+        if is_psycopg3 and importlib.util.find_spec('psycopg_pool'):
+            modes['pool'] = {
+                'CONN_MAX_AGE': 0,
+                'CONN_HEALTH_CHECKS': True,
+                'OPTIONS': {'pool': {'min_size': 2, 'max_size': options['threads'], 'max_lifetime': 300}},
+            }
+        else:
+            self.stdout.write("Skipping the pool mode: it needs psycopg 3 and psycopg_pool.")
+
+        self.stdout.write(f"{'mode':<12} {'requests':>8} {'p50 ms':>7} {'p95 ms':>7} {'mean ms':>8} {'sessions opened':>16}")
+        results = {}
+        for mode, overrides in modes.items():
+            # A database alias per mode, so that each has its own connections and pool
+            alias = f'bench_{mode}'
+            connections.settings[alias] = {**connections.settings['default'], 'OPTIONS': {}, 'TEST': {'MIRROR': 'default'}, **overrides}
+            try:
+                results[mode] = self.run_mode(alias, options)
+            finally:
+                connections[alias].close()
+                if getattr(connections[alias], 'pool', None):
+                    connections[alias].close_pool()
+                del connections[alias]
+                del connections.settings[alias]
+            result = results[mode]
+            self.stdout.write(
+                f"{mode:<12} {result['requests']:>8} {result['p50_ms']:>7.2f} {result['p95_ms']:>7.2f} "
+                f"{result['mean_ms']:>8.2f} {result['sessions']:>16}"
+            )
+
+        baseline = results['per-request']['mean_ms']
+        for mode, result in results.items():
+            if mode != 'per-request':
+                self.stdout.write(f"{mode}: {baseline - result['mean_ms']:.2f}ms less per request than per-request connections")
+
+    def run_mode(self, alias, options):
+        latencies = []
+        lock = threading.Lock()
+
+        def client():
+            samples = []
+            try:
+                for _ in range(options['requests']):
+                    started = time.perf_counter()
+                    request_started.send(sender=self.__class__)
+                    try:
+                        list(Prompt.objects.using(alias).order_by('PromptID').values_list('PromptID', 'PromptText')[:20])
+                    finally:
+                        request_finished.send(sender=self.__class__)
+                    samples.append(time.perf_counter() - started)
+            finally:
+                connections[alias].close()
+            with lock:
+                latencies.extend(samples)
+
+        sessions_before = self.sessions()
+        threads = [threading.Thread(target=client) for _ in range(options['threads'])]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return {
+            'requests': len(latencies),
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'mean_ms': statistics.mean(latencies) * 1000,
+            # Less the one this count is read from
+            'sessions': self.sessions() - sessions_before - 1,
+        }
+
+    def sessions(self):
+        # Sessions ever opened on the database; each count is read on a new connection
+        connection.close()
+        with connection.cursor() as cursor:
+            cursor.execute(SESSIONS)
+            return cursor.fetchone()[0]
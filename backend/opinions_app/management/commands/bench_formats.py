@@ -0,0 +1,117 @@
+import gzip
+import json
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+
+from opinions_app.management.commands.bench_api import SCENARIOS, Command as BenchAPICommand
+from opinions_app.renderers import ColumnarJSONRenderer
+
+FORMATS = (
+    ('json', JSONRenderer()),
+    ('columnar', ColumnarJSONRenderer()),
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare response formats on the list endpoints: body size, gzipped size, render time and parse time "
+        "of the current JSON against columnar JSON for the same serialized pages, next to the time of the "
+        "request itself (queries and serializers). Run `manage.py generate_data` first for realistic numbers."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--pages', type=int, default=20, help="Pages fetched per endpoint (default: 20).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed renders and parses per page and format (default: 20).")
+        parser.add_argument('--limit', type=int, default=50, help="Page size (default: 50).")
+        parser.add_argument('--sample-size', type=int, default=200, help="Random users, posts and prompts to target (default: 200).")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed for the request targets.")
+
+    def handle(self, *args, **options):
+        targets = BenchAPICommand().sample_targets(options)
+        client = Client(HTTP_HOST='127.0.0.1')
+        self.stdout.write(
+            f"{'endpoint':<26} {'request':>10}  "
+            + '  '.join(f"{name + ' bytes':>15} {'gzip':>7} {'render':>8} {'parse':>8}" for name, _ in FORMATS)
+        )
+
+        totals = {name: [0, 0] for name, _ in FORMATS}
+        # Uncached, so every request runs its serializer
+        with override_settings(RESPONSE_CACHE_ENABLED=False):
+            for (name, method), build in SCENARIOS.items():
+                if method != 'GET':
+                    continue
+                result = self.measure(client, name, build, targets, options)
+                if result is None:
+                    continue
+                for format_name, _ in FORMATS:
+                    totals[format_name][0] += result[format_name]['bytes']
+                    totals[format_name][1] += result[format_name]['gzip']
+                self.stdout.write(
+                    f"{name:<26} {result['request_ms']:>8.2f}ms  "
+                    + '  '.join(
+                        f"{result[format_name]['bytes']:>15} {result[format_name]['gzip']:>7} "
+                        f"{result[format_name]['render_ms']:>6.2f}ms {result[format_name]['parse_ms']:>6.2f}ms"
+                        for format_name, _ in FORMATS
+                    )
+                )
+
+        json_bytes, json_gzip = totals['json']
+        for format_name, (size, gzipped) in totals.items():
+            if json_bytes:
+                self.stdout.write(
+                    f"{format_name}: {size / json_bytes:.0%} of the JSON bytes, {gzipped / json_gzip:.0%} of the gzipped JSON bytes"
+                )
+
+    def measure(self, client, name, build, targets, options):
+        """
+        Mean sizes and render times per page of one endpoint, or None when it
+        returns no list of objects, which both formats render the same.
+        """
+        rng = random.Random(f"{options['seed']}-{name}")
+        samples = {format_name: {'bytes': [], 'gzip': [], 'render': [], 'parse': []} for format_name, _ in FORMATS}
+        request_times = []
+        found_list = False
+        for _ in range(options['pages']):
+            kwargs, query, _ = build(rng, targets)
+            query = '&'.join(part for part in (query, f"limit={options['limit']}") if part)
+            started = time.perf_counter()
+            response = client.get(f"{reverse(name, kwargs=kwargs)}?{query}")
+            request_times.append(time.perf_counter() - started)
+            if response.status_code != 200 or not hasattr(response, 'data'):
+                continue
+
+            data = response.data
+            for format_name, renderer in FORMATS:
+                body = renderer.render(data)
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    renderer.render(data)
+                samples[format_name]['render'].append((time.perf_counter() - started) / options['repeat'])
+                started = time.perf_counter()
+                for _ in range(options['repeat']):
+                    json.loads(body)
+                samples[format_name]['parse'].append((time.perf_counter() - started) / options['repeat'])
+                samples[format_name]['bytes'].append(len(body))
+                samples[format_name]['gzip'].append(len(gzip.compress(body, compresslevel=6)))
+            found_list = found_list or samples['columnar']['bytes'][-1] != samples['json']['bytes'][-1]
+
+        if not found_list:
+            return None
+        result = {
+            format_name: {
+                'bytes': round(statistics.mean(sample['bytes'])),
+                'gzip': round(statistics.mean(sample['gzip'])),
+                'render_ms': statistics.mean(sample['render']) * 1000,
+                'parse_ms': statistics.mean(sample['parse']) * 1000,
+            }
+            for format_name, sample in samples.items()
+        }
+        result['request_ms'] = statistics.median(request_times) * 1000
+        return result
@@ -0,0 +1,60 @@
+import math
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from opinions_app import metrics
+
+# Cheap read endpoints, where the instrumentation is the largest share of a request
+URL_NAMES = ('prompt-list', 'user-list', 'cache-stats')
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure what the metrics middleware and query instrumentation add to a request: alternating blocks "
+        "of requests with METRICS_ENABLED off and on, and the cost of the execute wrapper per query."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per endpoint and mode (default: 1000).")
+        parser.add_argument('--queries', type=int, default=5000, help="Queries per mode for the per-query cost (default: 5000).")
+
+    def handle(self, *args, **options):
+        client = Client(HTTP_HOST='127.0.0.1')
+        for url_name in URL_NAMES:
+            url = reverse(url_name)
+            latencies = {False: [], True: []}
+            # Alternating blocks of 50, so that drift affects both modes alike
+            for block in range(math.ceil(options['requests'] / 50) * 2):
+                enabled = bool(block % 2)
+                with override_settings(METRICS_ENABLED=enabled):
+                    for _ in range(50):
+                        started = time.perf_counter()
+                        client.get(url)
+                        latencies[enabled].append(time.perf_counter() - started)
+            off, on = (statistics.median(latencies[enabled]) * 1e6 for enabled in (False, True))
+            self.stdout.write(f"{url_name:<14} p50 {off:8.0f}us without metrics, {on:8.0f}us with them ({on - off:+.0f}us)")
+
+        # The wrapper is installed on the connection either way; it only times queries inside a request
+        connection.ensure_connection()
+        samples = {}
+        for enabled in (False, True):
+            token = metrics.current_request.set(metrics.RequestMetrics() if enabled else None)
+            try:
+                with connection.cursor() as cursor:
+                    started = time.perf_counter()
+                    for _ in range(options['queries']):
+                        cursor.execute("SELECT 1;")
+                    samples[enabled] = (time.perf_counter() - started) / options['queries'] * 1e6
+            finally:
+                metrics.current_request.reset(token)
+        self.stdout.write(
+            f"SELECT 1       {samples[False]:8.1f}us outside a request, {samples[True]:8.1f}us timed and counted "
+            f"({samples[True] - samples[False]:+.1f}us per query)"
+        )
+        metrics.reset()
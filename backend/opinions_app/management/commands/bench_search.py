@@ -0,0 +1,104 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from opinions_app.management.commands.bench_api import percentile
+from opinions_app.management.commands.generate_data import CATEGORIES, vocabulary
+from opinions_app.models import Post, Prompt, Reply
+from opinions_app.search import CATEGORY_LOOKUPS, RECENT_ORDERING, SEARCH_MODELS, search_queryset
+from opinions_app.views import search_paginators
+
+# The text column an icontains search would scan
+ICONTAINS_FIELDS = {
+    Post: 'PostText',
+    Reply: 'ReplyText',
+    Prompt: 'PromptText',
+}
+
+
+def search_cases(words):
+    """
+    (label, search query, icontains term, category) over words of every
+    frequency, from the vocabulary of `manage.py generate_data`.
+    """
+    common, medium, uncommon, rare = words[0], words[100], words[300], words[3000]
+    return [
+        ('common word', common, common, None),
+        ('medium word', medium, medium, None),
+        ('uncommon word', uncommon, uncommon, None),
+        ('rare word', rare, rare, None),
+        ('two words', f'{medium} {words[101]}', None, None),
+        ('phrase', f'"{common} {words[1]}"', f'{common} {words[1]}', None),
+        ('word OR word', f'{rare} or {words[3001]}', None, None),
+        ('common, in category', common, common, CATEGORIES[0]),
+        ('rare, in category', rare, rare, CATEGORIES[0]),
+    ]
+
+
+class Command(BaseCommand):
+    help = (
+        "Time full-text search queries (first page by rank and by recency) against the equivalent "
+        "icontains scans, for words of every frequency. Run `manage.py generate_data` first: the "
+        "search terms come from its vocabulary."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--type', action='append', choices=sorted(SEARCH_MODELS), help="Only search this type (repeatable).")
+        parser.add_argument('--repeat', type=int, default=20, help="Timed runs of each search query (default: 20).")
+        parser.add_argument('--icontains-repeat', type=int, default=3, help="Timed runs of each icontains query (default: 3).")
+        parser.add_argument('--no-icontains', action='store_true', help="Skip the icontains comparison.")
+        parser.add_argument('--limit', type=int, default=20, help="Page size (default: 20).")
+        parser.add_argument('--target-ms', type=float, default=50.0, help="p95 above which a search is flagged as slow (default: 50).")
+
+    def handle(self, *args, **options):
+        cases = search_cases(vocabulary())
+        slow = 0
+        for kind in options['type'] or list(SEARCH_MODELS):
+            model = SEARCH_MODELS[kind]
+            rows = model.objects.count()
+            if not rows:
+                raise CommandError(f"No {kind} to search; run `manage.py generate_data` first.")
+            self.stdout.write(f"\n{kind} ({rows} rows)")
+            self.stdout.write(f"  {'query':<22} {'matches':>9} {'rank p50/p95':>16} {'recent p50/p95':>16} {'icontains p50/p95':>20}")
+            for label, query, term, category in cases:
+                matches = search_queryset(model, query, category).count()
+                timings = {
+                    sort: self.time(lambda sort=sort: self.search_page(kind, model, query, category, sort, options), options['repeat'])
+                    for sort in ('rank', 'recent')
+                }
+                line = f"  {label:<22} {matches:>9} {self.format(timings['rank'])} {self.format(timings['recent'])}"
+                if term and not options['no_icontains']:
+                    line += '    ' + self.format(self.time(lambda: self.icontains_page(model, term, category, options), options['icontains_repeat']))
+                else:
+                    line += f"{'-':>20}"
+                if max(percentile(samples, 0.95) for samples in timings.values()) * 1000 > options['target_ms']:
+                    slow += 1
+                    line += '  SLOW'
+                self.stdout.write(line)
+
+        if slow:
+            self.stdout.write(self.style.WARNING(f"\n{slow} searches over {options['target_ms']:.0f}ms at p95."))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"\nEvery search under {options['target_ms']:.0f}ms at p95."))
+
+    def search_page(self, kind, model, query, category, sort, options):
+        paginator = search_paginators[(kind, sort)]
+        return list(paginator.seek(search_queryset(model, query, category, ranked=sort == 'rank'))[:options['limit']])
+
+    def icontains_page(self, model, term, category, options):
+        results = model.objects.filter(**{f'{ICONTAINS_FIELDS[model]}__icontains': term})
+        if category:
+            results = results.filter(**{CATEGORY_LOOKUPS[model]: category})
+        return list(results.order_by(*RECENT_ORDERING[model])[:options['limit']])
+
+    def time(self, run, repeat):
+        run()  # Warm the cache
+        samples = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            run()
+            samples.append(time.perf_counter() - started)
+        return samples
+
+    def format(self, samples):
+        return f"{percentile(samples, 0.5) * 1000:>7.1f}/{percentile(samples, 0.95) * 1000:<7.1f}ms"
@@ -0,0 +1,88 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from opinions_app.expand import expand_posts, expand_replies
+from opinions_app.fast_serializers import row_serializer
+from opinions_app.models import Post, Prompt, Reply, User
+from opinions_app.serializers import PostSerializer, PromptSerializer, ReplySerializer, UserSerializer
+
+# (label, serializer, expand, queryset) for every list the views serialize
+# with a RowSerializer, including rows with null relations
+CASES = [
+    ("users", UserSerializer, set(), lambda: User.objects.order_by('-UserID')),
+    ("prompts", PromptSerializer, set(), lambda: Prompt.objects.order_by('PromptID')),
+    ("posts", PostSerializer, set(), lambda: Post.objects.order_by('-CreatedAt', '-PostID')),
+    (
+        "posts ?expand=prompt,author,reply_count",
+        PostSerializer,
+        {'prompt', 'author', 'reply_count'},
+        lambda: expand_posts(Post.objects.order_by('-TrendingScore', '-PostID'), {'prompt', 'author', 'reply_count'}),
+    ),
+    (
+        "posts without a prompt ?expand=prompt",
+        PostSerializer,
+        {'prompt'},
+        lambda: expand_posts(Post.objects.filter(PromptID__isnull=True).order_by('-PostID'), {'prompt'}),
+    ),
+    ("replies", ReplySerializer, set(), lambda: Reply.objects.order_by('-ReplyID')),
+    (
+        "replies ?expand=author",
+        ReplySerializer,
+        {'author'},
+        lambda: expand_replies(Reply.objects.order_by('-ReplyID'), {'author'}),
+    ),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Check that the RowSerializers of fast_serializers.py output exactly what their ModelSerializers do, "
+        "then compare the time per item of both, with and without the query. Fails on the first difference."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=2000, help="Rows per case (default: 2000).")
+        parser.add_argument('--repeat', type=int, default=5, help="Timed runs per case and serializer (default: 5).")
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'case':<40} {'rows':>6} {'DRF µs/item':>12} {'rows µs/item':>13} {'speedup':>8}  "
+            f"{'with query: DRF':>16} {'rows':>7}"
+        )
+        for label, serializer_class, expand, queryset in CASES:
+            rows = options['rows']
+            fast = row_serializer(serializer_class, frozenset(expand))
+
+            instances = list(queryset()[:rows])
+            values = list(fast.values_list(queryset()[:rows]))
+            if not instances:
+                self.stdout.write(f"{label:<40} {'no rows':>6}")
+                continue
+            expected = serializer_class(instances, many=True, context={'expand': expand}).data
+            actual = fast.serialize(values)
+            for index, (want, got) in enumerate(zip(expected, actual)):
+                if want != got or list(want) != list(got):
+                    raise CommandError(f"{label}: row {index} differs.\nModelSerializer: {dict(want)}\nRowSerializer:   {got}")
+            if len(expected) != len(actual):
+                raise CommandError(f"{label}: {len(expected)} rows from the ModelSerializer but {len(actual)} from the RowSerializer.")
+
+            count = len(instances)
+            drf = self.time(lambda: serializer_class(instances, many=True, context={'expand': expand}).data, options) / count
+            rows_only = self.time(lambda: fast.serialize(values), options) / count
+            drf_query = self.time(lambda: serializer_class(list(queryset()[:rows]), many=True, context={'expand': expand}).data, options) / count
+            rows_query = self.time(lambda: fast.serialize(list(fast.values_list(queryset()[:rows]))), options) / count
+            self.stdout.write(
+                f"{label:<40} {count:>6} {drf * 1e6:>12.1f} {rows_only * 1e6:>13.1f} {drf / rows_only:>7.1f}x  "
+                f"{drf_query * 1e6:>16.1f} {rows_query * 1e6:>7.1f}"
+            )
+        self.stdout.write(self.style.SUCCESS("All RowSerializers match their ModelSerializers."))
+
+    def time(self, func, options):
+        samples = []
+        for _ in range(options['repeat']):
+            started = time.perf_counter()
+            func()
+            samples.append(time.perf_counter() - started)
+        return statistics.median(samples)
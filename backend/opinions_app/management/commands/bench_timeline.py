@@ -0,0 +1,111 @@
+import random
+import statistics
+import time
+import uuid
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from opinions_app.models import Post, User
+from opinions_app.timeline import fan_out_post, read_timeline
+
+FOLLOW_ALL_AUTHORS = """
+INSERT INTO follows (follower_id, followee_id, created_at)
+SELECT follower.userid, author.userid, NOW()
+FROM users follower, users author
+WHERE follower.userid = ANY(%s) AND author.userid = ANY(%s);
+"""
+
+# Raw deletes: the ORM would load every cascaded timeline row into memory
+DELETE_BENCH_USERS = """
+DELETE FROM timelines WHERE owner_id = ANY(%(users)s);
+DELETE FROM follows WHERE follower_id = ANY(%(users)s);
+DELETE FROM posts WHERE user_id = ANY(%(users)s);
+DELETE FROM user_stats WHERE user_id = ANY(%(users)s);
+DELETE FROM users WHERE userid = ANY(%(users)s);
+"""
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Benchmark home timelines: fan-out-on-write cost per post and page read latency, "
+        "for pushed timelines and for authors merged in at read time. "
+        "Creates its own users, follows and posts and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--followers', type=int, default=10000, help="Followers per author (default: 10000).")
+        parser.add_argument('--authors', type=int, default=5, help="Authors followed by every follower (default: 5).")
+        parser.add_argument('--posts', type=int, default=10, help="Posts per author and mode (default: 10).")
+        parser.add_argument('--readers', type=int, default=50, help="Followers whose timelines are read (default: 50).")
+        parser.add_argument('--pages', type=int, default=5, help="Pages read per follower (default: 5).")
+        parser.add_argument('--page-size', type=int, default=50, help="Posts per page (default: 50).")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        self.stdout.write(f"Creating {options['authors']} authors with {options['followers']} followers each...")
+        users = User.objects.bulk_create([
+            User(Username=f'bench-{run_id}-{i}', Email=f'bench-{run_id}-{i}@example.com', Password='')
+            for i in range(options['followers'] + options['authors'])
+        ], batch_size=5000)
+        authors, followers = users[:options['authors']], users[options['authors']:]
+        follower_ids = [user.UserID for user in followers]
+        with connection.cursor() as cursor:
+            cursor.execute(FOLLOW_ALL_AUTHORS, [follower_ids, [author.UserID for author in authors]])
+        User.objects.filter(pk__in=[author.UserID for author in authors]).update(FollowerCount=options['followers'])
+        User.objects.filter(pk__in=follower_ids).update(FollowingCount=options['authors'])
+        for author in authors:
+            author.FollowerCount = options['followers']
+
+        readers = random.Random(run_id).sample(follower_ids, min(options['readers'], len(follower_ids)))
+        try:
+            # Push: every post is written into all follower timelines
+            with override_settings(TIMELINE_FANOUT_LIMIT=options['followers']):
+                self.report_writes("push", authors, options)
+                self.report_reads("push", readers, options)
+
+            # Pull: the same authors are now over the limit and merged at read time
+            with override_settings(TIMELINE_FANOUT_LIMIT=options['followers'] - 1):
+                self.report_writes("pull", authors, options)
+                self.report_reads("push + pull", readers, options)
+        finally:
+            self.stdout.write("Cleaning up...")
+            with connection.cursor() as cursor:
+                cursor.execute(DELETE_BENCH_USERS, {"users": [user.UserID for user in users]})
+
+    def report_writes(self, mode, authors, options):
+        timings = []
+        for i in range(options['posts']):
+            for author in authors:
+                post = Post.objects.create(UserID=author, PostText=f'bench {mode} {i}')
+                started = time.perf_counter()
+                fan_out_post(post)
+                timings.append(time.perf_counter() - started)
+        self.stdout.write(
+            f"[{mode}] fan-out per post: p50={percentile(timings, 0.5) * 1000:.1f}ms "
+            f"p95={percentile(timings, 0.95) * 1000:.1f}ms max={max(timings) * 1000:.1f}ms"
+        )
+
+    def report_reads(self, mode, readers, options):
+        timings, query_counts = [], []
+        for reader in readers:
+            after = None
+            for _ in range(options['pages']):
+                started = time.perf_counter()
+                with CaptureQueriesContext(connection) as queries:
+                    posts, after = read_timeline(reader, options['page_size'], after)
+                timings.append(time.perf_counter() - started)
+                query_counts.append(len(queries))
+                if after is None:
+                    break
+        self.stdout.write(
+            f"[{mode}] page read ({options['page_size']} posts): p50={percentile(timings, 0.5) * 1000:.1f}ms "
+            f"p95={percentile(timings, 0.95) * 1000:.1f}ms max={max(timings) * 1000:.1f}ms "
+            f"queries/page={statistics.mean(query_counts):.1f}"
+        )
@@ -0,0 +1,213 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from opinions_app.user_stats import rebuild_user_stats
+
+# Bulk seed data, created inside a transaction that is rolled back at the end.
+# The seeded IDs are numbered 1..n in temporary tables so rows can pick one at
+# random with a join. Authors are skewed (random() ^ 3) so a few users own most
+# of the posts, and a few posts get most of the replies.
+SEED_DATA = """
+CREATE TEMPORARY TABLE explain_users ON COMMIT DROP AS
+WITH created AS (
+    INSERT INTO users (username, email, password, join_date, reply_points, follower_count, following_count)
+    SELECT 'explain-' || i, 'explain-' || i || '@example.com', '', NOW(), 0, 0, 0
+    FROM generate_series(1, %(users)s) AS i
+    RETURNING userid
+)
+SELECT row_number() OVER () AS n, userid FROM created;
+
+CREATE TEMPORARY TABLE explain_prompts ON COMMIT DROP AS
+WITH created AS (
+    INSERT INTO prompts (prompt_text, category)
+    SELECT 'Explain prompt ' || i, 'explain-' || (i %% 20)
+    FROM generate_series(1, %(prompts)s) AS i
+    RETURNING promptid
+)
+SELECT row_number() OVER () AS n, promptid FROM created;
+
+CREATE TEMPORARY TABLE explain_posts ON COMMIT DROP AS
+WITH created AS (
+    INSERT INTO posts (user_id, prompt_id, upvote_count, downvote_count, created_at, posttext, trending_score)
+    SELECT author.userid,
+           CASE WHEN picks.i %% 10 = 0 THEN NULL ELSE prompt.promptid END,
+           floor(random() * 100)::int,
+           floor(random() * 20)::int,
+           NOW() - random() * INTERVAL '90 days',
+           'Explain post ' || picks.i,
+           random() * 100
+    FROM (
+        SELECT i, 1 + floor(%(users)s * random() ^ 3)::int AS author, 1 + floor(%(prompts)s * random())::int AS prompt
+        FROM generate_series(1, %(posts)s) AS i
+    ) AS picks
+    JOIN explain_users AS author ON author.n = picks.author
+    JOIN explain_prompts AS prompt ON prompt.n = picks.prompt
+    RETURNING postid
+)
+SELECT row_number() OVER () AS n, postid FROM created;
+
+INSERT INTO replies (post_id, user_id, reply_text, created_at, isagree)
+SELECT post.postid, author.userid, 'Explain reply ' || picks.i, NOW() - random() * INTERVAL '90 days', random() < 0.5
+FROM (
+    SELECT i, 1 + floor(%(posts)s * random() ^ 3)::int AS post, 1 + floor(%(users)s * random())::int AS author
+    FROM generate_series(1, %(replies)s) AS i
+) AS picks
+JOIN explain_posts AS post ON post.n = picks.post
+JOIN explain_users AS author ON author.n = picks.author;
+
+INSERT INTO follows (follower_id, followee_id, created_at)
+SELECT follower.userid, followee.userid, NOW()
+FROM (
+    SELECT 1 + floor(%(users)s * random())::int AS follower, 1 + floor(%(users)s * random() ^ 3)::int AS followee
+    FROM generate_series(1, %(follows)s)
+) AS picks
+JOIN explain_users AS follower ON follower.n = picks.follower
+JOIN explain_users AS followee ON followee.n = picks.followee
+WHERE follower.userid <> followee.userid
+ON CONFLICT DO NOTHING;
+
+-- Home timelines of the first 200 seeded users
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT follows.follower_id, posts.postid, posts.created_at
+FROM explain_users
+JOIN follows ON follows.follower_id = explain_users.userid
+JOIN posts ON posts.user_id = follows.followee_id
+WHERE explain_users.n <= 200
+ON CONFLICT DO NOTHING;
+
+ANALYZE users, prompts, posts, replies, follows, timelines;
+"""
+
+# The most active rows, so every endpoint is explained against its worst case
+PICK_TARGETS = """
+SELECT (SELECT user_id FROM posts GROUP BY user_id ORDER BY COUNT(*) DESC LIMIT 1),
+       (SELECT post_id FROM replies GROUP BY post_id ORDER BY COUNT(*) DESC LIMIT 1),
+       (SELECT prompt_id FROM posts WHERE prompt_id IS NOT NULL GROUP BY prompt_id ORDER BY COUNT(*) DESC LIMIT 1),
+       (SELECT owner_id FROM timelines GROUP BY owner_id ORDER BY COUNT(*) DESC LIMIT 1);
+"""
+
+ENDPOINTS = [
+    '/api/users/',
+    '/api/user/{user}/',
+    '/api/user/{user}/posts/?expand=prompt,reply_count',
+    '/api/user/{user}/followers/',
+    '/api/user/{user}/following/',
+    '/api/user/{user}/total-votes/',
+    '/api/user/{user}/stats/',
+    '/api/user/{owner}/timeline/?expand=author',
+    '/api/posts/',
+    '/api/posts/?expand=prompt,author,reply_count',
+    '/api/posts/trending/',
+    '/api/posts/trending/?category={category}',
+    '/api/posts/{post}/?expand=prompt,author,reply_count',
+    '/api/posts/{post}/replies/?expand=author',
+    '/api/posts/{post}/thread/',
+    '/api/prompts/',
+    '/api/prompt/{prompt}/',
+    '/api/prompts/category/{category}/',
+    '/api/daily/',
+]
+
+
+def plan_nodes(plan):
+    yield plan
+    for child in plan.get('Plans', ()):
+        yield from plan_nodes(child)
+
+
+class Command(BaseCommand):
+    help = (
+        "Run EXPLAIN ANALYZE on every query issued by the read endpoints and fail if any of them "
+        "sequentially scans a large table. Seeds a large dataset inside a transaction that is "
+        "rolled back afterwards, unless --no-seed is given."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-seed', action='store_true', help="Explain against the existing data only.")
+        parser.add_argument('--users', type=int, default=20000, help="Seeded users (default: 20000).")
+        parser.add_argument('--prompts', type=int, default=2000, help="Seeded prompts (default: 2000).")
+        parser.add_argument('--posts', type=int, default=200000, help="Seeded posts (default: 200000).")
+        parser.add_argument('--replies', type=int, default=500000, help="Seeded replies (default: 500000).")
+        parser.add_argument('--follows', type=int, default=100000, help="Seeded follow edges (default: 100000).")
+        parser.add_argument(
+            '--min-rows', type=int, default=1000,
+            help="Only sequential scans of tables with at least this many rows fail the check (default: 1000).",
+        )
+
+    def handle(self, *args, **options):
+        failures = []
+        with transaction.atomic():
+            with connection.cursor() as cursor:
+                if not options['no_seed']:
+                    self.stdout.write("Seeding data...")
+                    cursor.execute(SEED_DATA, options)
+                    rebuild_user_stats()
+                cursor.execute(PICK_TARGETS)
+                user, post, prompt, owner = cursor.fetchone()
+                if user is None or post is None or prompt is None:
+                    raise CommandError("Not enough posts, replies and prompts to explain the endpoints.")
+                cursor.execute("SELECT category FROM prompts WHERE promptid = %s", [prompt])
+                category = cursor.fetchone()[0]
+
+            targets = {"user": user, "post": post, "prompt": prompt, "owner": owner or user, "category": category}
+            # The handlers must run, not the response cache
+            with override_settings(RESPONSE_CACHE_ENABLED=False):
+                client = Client(HTTP_HOST='127.0.0.1')
+                for endpoint in ENDPOINTS:
+                    url = endpoint.format(**targets)
+                    next_cursor = self.explain_url(client, url, options, failures)
+                    # The second page exercises the cursor seek
+                    if next_cursor:
+                        separator = '&' if '?' in url else '?'
+                        self.explain_url(client, f'{url}{separator}cursor={next_cursor}', options, failures)
+
+            transaction.set_rollback(True)
+
+        if failures:
+            raise CommandError("Sequential scans found:\n" + "\n".join(failures))
+        self.stdout.write(self.style.SUCCESS("No sequential scans of large tables."))
+
+    def explain_url(self, client, url, options, failures):
+        """
+        Request the URL, explain each SELECT it ran and add any sequential
+        scans of large tables to `failures`. Returns the next page's cursor.
+        """
+        with CaptureQueriesContext(connection) as queries:
+            response = client.get(url)
+        if response.status_code != 200:
+            raise CommandError(f"GET {url} returned {response.status_code}")
+        body = response.json()
+        next_cursor = response.get('X-Next-Cursor') or (isinstance(body, dict) and body.get('next_cursor'))
+
+        self.stdout.write(f"GET {url} ({len(queries)} queries)")
+        for query in queries.captured_queries:
+            sql = query['sql']
+            if not sql.lstrip().upper().startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute('EXPLAIN (ANALYZE, FORMAT JSON) ' + sql)
+                result = cursor.fetchone()[0]
+            explained = result if isinstance(result, list) else json.loads(result)
+            plan = explained[0]['Plan']
+            scans = []
+            for node in plan_nodes(plan):
+                if 'Relation Name' in node:
+                    scans.append(f"{node['Node Type']} on {node['Relation Name']}" + (f" using {node['Index Name']}" if 'Index Name' in node else ''))
+                elif 'Index Name' in node:
+                    scans.append(f"{node['Node Type']} using {node['Index Name']}")
+                if node['Node Type'] == 'Seq Scan' and self.row_count(node['Relation Name']) >= options['min_rows']:
+                    failures.append(f"GET {url}: Seq Scan on {node['Relation Name']}\n    {sql}")
+            self.stdout.write(f"  {explained[0]['Execution Time']:.2f}ms  " + ", ".join(scans))
+            if options['verbosity'] >= 2:
+                self.stdout.write(f"    {sql}")
+        return next_cursor
+
+    def row_count(self, table):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT reltuples FROM pg_class WHERE relname = %s", [table])
+            row = cursor.fetchone()
+        return row[0] if row else 0
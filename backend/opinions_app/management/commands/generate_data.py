@@ -0,0 +1,269 @@
+import io
+import itertools
+import random
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+
+from opinions_app.trending import hot_score
+from opinions_app.user_stats import rebuild_user_stats
+
+# The categories offered by the app
+CATEGORIES = ['sports', 'music', 'movies', 'food', 'fashion', 'tech', 'travel', 'edu', 'politics', 'health', 'fitness']
+
+# Generated text is made of pseudo-words built from these syllables
+SYLLABLES = [
+    'ka', 'lo', 'mi', 'ra', 'te', 'su', 'no', 'vi', 'de', 'po', 'ban', 'rel', 'tis', 'mor', 'gun',
+    'sha', 'qui', 'zen', 'fa', 'bru', 'tor', 'lin', 'dex', 'mar', 'cas', 'pli', 'vo', 'ne', 'hul', 'gri',
+]
+
+# Taken for the whole run: rows are copied with IDs reserved up front, so no
+# other session may draw from the sequences or insert in the meantime
+LOCK_TABLES = "LOCK TABLE users, prompts, posts, replies, follows IN EXCLUSIVE MODE;"
+
+RESERVE_IDS = """
+SELECT setval(pg_get_serial_sequence(%(table)s, %(column)s), nextval(pg_get_serial_sequence(%(table)s, %(column)s)) + %(count)s - 1);
+"""
+
+CREATE_FOLLOWS_STAGING = """
+CREATE TEMPORARY TABLE generated_follows (follower_id INTEGER, followee_id INTEGER, created_at TIMESTAMPTZ) ON COMMIT DROP;
+"""
+
+# Random pairs repeat, so they are copied to a staging table and deduplicated on insert
+INSERT_STAGED_FOLLOWS = """
+INSERT INTO follows (follower_id, followee_id, created_at)
+SELECT DISTINCT ON (follower_id, followee_id) follower_id, followee_id, created_at
+FROM generated_follows
+WHERE follower_id <> followee_id
+ON CONFLICT DO NOTHING;
+"""
+
+UPDATE_FOLLOW_COUNTS = """
+UPDATE users
+SET follower_count = (SELECT COUNT(*) FROM follows WHERE follows.followee_id = users.userid),
+    following_count = (SELECT COUNT(*) FROM follows WHERE follows.follower_id = users.userid)
+WHERE userid BETWEEN %(first)s AND %(last)s;
+"""
+
+# Pushes each followed author's latest posts, as a new follow would (see timeline.backfill_author)
+BUILD_TIMELINES = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT follows.follower_id, recent.postid, recent.created_at
+FROM follows
+JOIN users author ON author.userid = follows.followee_id AND author.follower_count <= %(fanout_limit)s
+CROSS JOIN LATERAL (
+    SELECT postid, created_at FROM posts
+    WHERE posts.user_id = follows.followee_id
+    ORDER BY created_at DESC, postid DESC
+    LIMIT %(backfill)s
+) AS recent
+WHERE follows.follower_id BETWEEN %(first)s AND %(last)s
+ON CONFLICT DO NOTHING;
+"""
+
+# Posts of authors over the fan-out limit are merged into timelines at read time (see timeline.fan_out_post)
+MARK_PULLED_POSTS = """
+UPDATE posts SET pulled = true
+FROM users author
+WHERE author.userid = posts.user_id AND author.follower_count > %(fanout_limit)s
+  AND posts.user_id BETWEEN %(first)s AND %(last)s;
+"""
+
+# Authors see their own posts in their timeline (see timeline.fan_out_post)
+ADD_OWN_POSTS_TO_TIMELINES = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT user_id, postid, created_at FROM posts
+WHERE user_id BETWEEN %(first)s AND %(last)s
+ON CONFLICT DO NOTHING;
+"""
+
+
+def power_law_weights(count, exponent, rng):
+    """
+    Cumulative Zipf weights (rank ** -exponent) over `count` items, with the
+    ranks shuffled so popularity does not follow the ID order.
+    """
+    ranks = list(range(1, count + 1))
+    rng.shuffle(ranks)
+    return list(itertools.accumulate(rank ** -exponent for rank in ranks))
+
+
+def vocabulary(size=5000, seed=0):
+    """
+    `size` distinct pseudo-words, most frequent first. The same for every run,
+    so benchmarks can pick search terms by how common they are.
+    """
+    rng = random.Random(seed)
+    words = {}
+    while len(words) < size:
+        words[''.join(rng.choices(SYLLABLES, k=rng.randint(2, 3)))] = None
+    return list(words)
+
+
+def word_weights(count, exponent=1.0):
+    # Cumulative Zipf weights in rank order: word n is used about 1/n as often as the first
+    return list(itertools.accumulate(rank ** -exponent for rank in range(1, count + 1)))
+
+
+def copy_rows(cursor, table, columns, rows, batch_size):
+    """
+    Stream tab-separated rows into `table` with COPY, `batch_size` rows per statement.
+    """
+    statement = f"COPY {table} ({', '.join(columns)}) FROM STDIN"
+    copied = 0
+    while True:
+        buffer = io.StringIO()
+        batch = 0
+        for row in itertools.islice(rows, batch_size):
+            buffer.write('\t'.join(r'\N' if value is None else str(value) for value in row))
+            buffer.write('\n')
+            batch += 1
+        if not batch:
+            return copied
+        buffer.seek(0)
+        cursor.copy_expert(statement, buffer)
+        copied += batch
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a large synthetic dataset with COPY: users, prompts, posts, replies and follows, with "
+        "power-law skew (a few prolific and widely followed users, a few viral posts that draw most replies) "
+        "and texts of Zipf-distributed pseudo-words for search. "
+        "Everything is added in one transaction next to the existing data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=100000, help="Users (default: 100000).")
+        parser.add_argument('--prompts', type=int, default=500, help="Prompts (default: 500).")
+        parser.add_argument('--posts', type=int, default=500000, help="Posts (default: 500000).")
+        parser.add_argument('--replies', type=int, default=1500000, help="Replies (default: 1500000).")
+        parser.add_argument('--follows', type=int, default=1000000, help="Follow edges before deduplication (default: 1000000).")
+        parser.add_argument('--days', type=int, default=90, help="Spread post dates over the last N days (default: 90).")
+        parser.add_argument('--skew', type=float, default=1.1, help="Zipf exponent for authors and followees (default: 1.1).")
+        parser.add_argument('--timelines', action='store_true', help="Also build the generated users' home timelines.")
+        parser.add_argument('--seed', type=int, default=None, help="Random seed, for a reproducible dataset.")
+        parser.add_argument('--batch-size', type=int, default=50000, help="Rows per COPY statement (default: 50000).")
+
+    def handle(self, *args, **options):
+        if options['users'] < 2 or options['prompts'] < 1:
+            raise CommandError("At least 2 users and 1 prompt are needed.")
+        self.rng = random.Random(options['seed'])
+        self.options = options
+        self.now = datetime.now(dt_timezone.utc)
+        self.words = vocabulary()
+        self.word_weights = word_weights(len(self.words))
+
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(LOCK_TABLES)
+            users = self.step("users", lambda: self.copy_users(cursor))
+            prompts = self.step("prompts", lambda: self.copy_prompts(cursor))
+            posts = self.step("posts", lambda: self.copy_posts(cursor, users, prompts))
+            self.step("replies", lambda: self.copy_replies(cursor, users, posts))
+            self.step("follows", lambda: self.copy_follows(cursor, users))
+            self.step("user stats", rebuild_user_stats)
+            if options['timelines']:
+                self.step("timelines", lambda: self.build_timelines(cursor, users))
+        # Fresh planner statistics for the benchmarks that usually follow
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE users, prompts, posts, replies, follows, timelines, user_stats;")
+        self.stdout.write(self.style.SUCCESS("Done."))
+
+    def step(self, name, run):
+        started = time.perf_counter()
+        result = run()
+        elapsed = time.perf_counter() - started
+        rows = len(result) if isinstance(result, (list, range)) else result
+        if isinstance(rows, int):
+            self.stdout.write(f"{name}: {rows} rows in {elapsed:.1f}s ({rows / max(elapsed, 1e-9):.0f} rows/s)")
+        else:
+            self.stdout.write(f"{name}: {elapsed:.1f}s")
+        return result
+
+    def reserve_ids(self, cursor, table, column, count):
+        cursor.execute(RESERVE_IDS, {"table": table, "column": column, "count": count})
+        last = cursor.fetchone()[0]
+        return range(last - count + 1, last + 1)
+
+    def random_time(self, start):
+        return start + (self.now - start) * self.rng.random()
+
+    def random_text(self, low, high):
+        return ' '.join(self.rng.choices(self.words, cum_weights=self.word_weights, k=self.rng.randint(low, high)))
+
+    def copy_users(self, cursor):
+        ids = self.reserve_ids(cursor, 'users', 'userid', self.options['users'])
+        start = self.now - timedelta(days=self.options['days'] * 2)
+        rows = (
+            (user_id, f'gen_{user_id}', f'gen_{user_id}@example.com', '', self.random_time(start), f'Generated user {user_id}', 0, 0, 0)
+            for user_id in ids
+        )
+        copy_rows(cursor, 'users', ['userid', 'username', 'email', 'password', 'join_date', 'bio', 'reply_points', 'follower_count', 'following_count'], rows, self.options['batch_size'])
+        return ids
+
+    def copy_prompts(self, cursor):
+        ids = self.reserve_ids(cursor, 'prompts', 'promptid', self.options['prompts'])
+        rows = ((prompt_id, self.random_text(6, 15), self.rng.choice(CATEGORIES)) for prompt_id in ids)
+        copy_rows(cursor, 'prompts', ['promptid', 'prompt_text', 'category'], rows, self.options['batch_size'])
+        return ids
+
+    def copy_posts(self, cursor, users, prompts):
+        """
+        Copy the posts and return [(post_id, created_at, upvotes)] for the replies.
+        """
+        ids = self.reserve_ids(cursor, 'posts', 'postid', self.options['posts'])
+        authors = self.rng.choices(users, cum_weights=power_law_weights(len(users), self.options['skew'], self.rng), k=len(ids))
+        start = self.now - timedelta(days=self.options['days'])
+        posts = []
+
+        def rows():
+            for post_id, author in zip(ids, authors):
+                created = self.random_time(start)
+                # Pareto-distributed votes: most posts get a handful, a few go viral
+                upvotes = min(int(self.rng.paretovariate(1.2)) - 1, 1000000)
+                downvotes = int(upvotes * self.rng.random() * 0.4)
+                posts.append((post_id, created, upvotes))
+                yield (
+                    post_id, author, self.rng.choice(prompts), upvotes, downvotes, created,
+                    self.random_text(8, 40), hot_score(upvotes, downvotes, created),
+                )
+
+        copy_rows(cursor, 'posts', ['postid', 'user_id', 'prompt_id', 'upvote_count', 'downvote_count', 'created_at', 'posttext', 'trending_score'], rows(), self.options['batch_size'])
+        return posts
+
+    def copy_replies(self, cursor, users, posts):
+        # Replies follow the votes, so viral posts get most of them
+        cum_weights = list(itertools.accumulate(upvotes + 1 for _, _, upvotes in posts))
+        targets = self.rng.choices(posts, cum_weights=cum_weights, k=self.options['replies'])
+        rows = (
+            (post_id, self.rng.choice(users), self.random_text(5, 30), self.random_time(created), self.rng.random() < 0.5)
+            for post_id, created, _ in targets
+        )
+        return copy_rows(cursor, 'replies', ['post_id', 'user_id', 'reply_text', 'created_at', 'isagree'], rows, self.options['batch_size'])
+
+    def copy_follows(self, cursor, users):
+        cum_weights = power_law_weights(len(users), self.options['skew'], self.rng)
+        followees = self.rng.choices(users, cum_weights=cum_weights, k=self.options['follows'])
+        rows = ((self.rng.choice(users), followee, self.now) for followee in followees)
+        cursor.execute(CREATE_FOLLOWS_STAGING)
+        copy_rows(cursor, 'generated_follows', ['follower_id', 'followee_id', 'created_at'], rows, self.options['batch_size'])
+        cursor.execute(INSERT_STAGED_FOLLOWS)
+        inserted = cursor.rowcount
+        cursor.execute(UPDATE_FOLLOW_COUNTS, {"first": users[0], "last": users[-1]})
+        return inserted
+
+    def build_timelines(self, cursor, users):
+        params = {
+            "first": users[0],
+            "last": users[-1],
+            "fanout_limit": settings.TIMELINE_FANOUT_LIMIT,
+            "backfill": settings.TIMELINE_BACKFILL,
+        }
+        cursor.execute(MARK_PULLED_POSTS, params)
+        cursor.execute(BUILD_TIMELINES, params)
+        inserted = cursor.rowcount
+        cursor.execute(ADD_OWN_POSTS_TO_TIMELINES, params)
+        return inserted + cursor.rowcount
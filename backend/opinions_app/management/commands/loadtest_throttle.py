@@ -0,0 +1,135 @@
+import math
+import statistics
+import threading
+import time
+import uuid
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+
+from opinions_app.models import Post, User
+
+
+def percentile(samples, fraction):
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * fraction))]
+
+
+class Command(BaseCommand):
+    help = (
+        "Flood the vote endpoint from one client while another votes at a normal pace, with rate limits off "
+        "and on, and report how much of the flood reaches the database and the normal client's latency. "
+        "Also measures the latency the throttle adds to a request that is let through. "
+        "Creates its own user and post and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--duration', type=float, default=5.0, help="Seconds each flood lasts (default: 5).")
+        parser.add_argument('--flooders', type=int, default=4, help="Flooding threads, all from one IP (default: 4).")
+        parser.add_argument('--interval', type=float, default=0.05, help="Seconds between the normal client's votes (default: 0.05).")
+        parser.add_argument('--requests', type=int, default=500, help="Requests per mode for the overhead measurement (default: 500).")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        user = User.objects.create(Username=f'loadtest-{run_id}', Email=f'loadtest-{run_id}@example.com', Password='')
+        post = Post.objects.create(UserID=user, PostText=f'loadtest {run_id}')
+        try:
+            self.report_overhead(user, options)
+            results = {}
+            for enabled in (False, True):
+                with override_settings(THROTTLE_ENABLED=enabled):
+                    results[enabled] = self.flood(post, options)
+        finally:
+            post.delete()
+            user.delete()
+
+        for enabled, result in results.items():
+            self.stdout.write(
+                f"rate limits {'on ' if enabled else 'off'}: flood sent {result['sent']} "
+                f"({result['sent'] / options['duration']:.0f}/s), {result['accepted']} counted, {result['throttled']} throttled; "
+                f"normal client p50={result['p50_ms']:.1f}ms p95={result['p95_ms']:.1f}ms, {result['normal_throttled']} throttled"
+            )
+        if results[True]['normal_throttled']:
+            raise CommandError("The normal client was throttled.")
+        if results[True]['accepted'] >= results[False]['accepted']:
+            raise CommandError("The rate limits did not stop the flood.")
+        self.stdout.write(self.style.SUCCESS("The flood was absorbed without throttling the normal client."))
+
+    def report_overhead(self, user, options):
+        """
+        Login attempts with and without rate limits, each from a
+        new IP and for a new (unknown) username, so that none is throttled.
+        """
+        client = Client(HTTP_HOST='127.0.0.1')
+        url = reverse('login')
+        latencies = {False: [], True: []}
+        # Alternating blocks of 50, so that drift affects both modes alike
+        for block in range(math.ceil(options['requests'] / 50) * 2):
+            enabled = bool(block % 2)
+            with override_settings(THROTTLE_ENABLED=enabled):
+                for i in range(block * 50, block * 50 + 50):
+                    started = time.perf_counter()
+                    response = client.post(url, {'Username': f'{user.Username}-{i}'}, content_type='application/json', REMOTE_ADDR=f'10.{i // 65536 % 256}.{i // 256 % 256}.{i % 256}')
+                    latencies[enabled].append(time.perf_counter() - started)
+                    if response.status_code == 429:
+                        raise CommandError("A login attempt was throttled.")
+        off, on = (statistics.median(latencies[enabled]) * 1000 for enabled in (False, True))
+        self.stdout.write(
+            f"request latency: p50 {off:.2f}ms without rate limits, {on:.2f}ms with them ({(on - off) * 1000:+.0f}us); "
+            f"p95 {percentile(latencies[False], 0.95) * 1000:.2f}ms / {percentile(latencies[True], 0.95) * 1000:.2f}ms"
+        )
+
+    def flood(self, post, options):
+        url = reverse('update-votes', kwargs={'vote_type': 'upvote', 'post_id': post.PostID})
+        before = Post.objects.get(pk=post.PostID).UpvoteCount
+        stop = threading.Event()
+        lock = threading.Lock()
+        counts = {'sent': 0, 'throttled': 0}
+        normal = {'latencies': [], 'throttled': 0}
+
+        def flooder():
+            client = Client(HTTP_HOST='127.0.0.1')
+            try:
+                while not stop.is_set():
+                    response = client.post(url, {}, content_type='application/json', REMOTE_ADDR='192.0.2.1')
+                    with lock:
+                        counts['sent'] += 1
+                        counts['throttled'] += response.status_code == 429
+            finally:
+                connection.close()
+
+        def normal_client():
+            # Anonymous votes from a new address each time, as many separate users would send
+            client = Client(HTTP_HOST='127.0.0.1')
+            try:
+                i = 0
+                while not stop.wait(options['interval']):
+                    i += 1
+                    started = time.perf_counter()
+                    response = client.post(url, {}, content_type='application/json', REMOTE_ADDR=f'198.51.{i // 256 % 256}.{i % 256}')
+                    normal['latencies'].append(time.perf_counter() - started)
+                    normal['throttled'] += response.status_code == 429
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=flooder) for _ in range(options['flooders'])] + [threading.Thread(target=normal_client)]
+        for thread in threads:
+            thread.start()
+        time.sleep(options['duration'])
+        stop.set()
+        for thread in threads:
+            thread.join()
+
+        counted = Post.objects.get(pk=post.PostID).UpvoteCount - before
+        latencies = normal['latencies']
+        return {
+            'sent': counts['sent'],
+            'throttled': counts['throttled'],
+            'accepted': counted - len(latencies) + normal['throttled'],
+            'p50_ms': statistics.median(latencies) * 1000,
+            'p95_ms': percentile(latencies, 0.95) * 1000,
+            'normal_throttled': normal['throttled'],
+        }
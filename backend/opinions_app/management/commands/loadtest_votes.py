@@ -0,0 +1,82 @@
+import random
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+
+from opinions_app import votes
+from opinions_app.models import Post, User, Vote
+
+
+class Command(BaseCommand):
+    help = (
+        "Hammer one post with concurrent votes and check that the final counters are exact. "
+        "Every user votes several times (and sometimes flips their vote) to exercise deduplication. "
+        "Creates its own users and post and deletes them afterwards."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=500, help="Number of distinct voters (default: 500).")
+        parser.add_argument('--repeats', type=int, default=3, help="Votes cast by each voter (default: 3).")
+        parser.add_argument('--anonymous', type=int, default=500, help="Extra votes without a user_id (default: 500).")
+        parser.add_argument('--threads', type=int, default=16, help="Concurrent voting threads (default: 16).")
+        parser.add_argument('--write-behind', action='store_true', help="Route votes through the write-behind buffer.")
+
+    def handle(self, *args, **options):
+        run_id = uuid.uuid4().hex[:8]
+        users = User.objects.bulk_create([
+            User(Username=f'loadtest-{run_id}-{i}', Email=f'loadtest-{run_id}-{i}@example.com', Password='')
+            for i in range(options['users'])
+        ])
+        post = Post.objects.create(UserID=users[0], PostText=f'loadtest {run_id}')
+
+        # Each voter's last vote is the one that must count
+        rng = random.Random(run_id)
+        jobs = []
+        expected = {'upvote': 0, 'downvote': 0}
+        for user in users:
+            choices = [rng.choice(votes.VOTE_TYPES) for _ in range(options['repeats'])]
+            expected[choices[-1]] += 1
+            jobs.append((user.UserID, choices))
+        for _ in range(options['anonymous']):
+            vote_type = rng.choice(votes.VOTE_TYPES)
+            expected[vote_type] += 1
+            jobs.append((None, [vote_type]))
+        rng.shuffle(jobs)
+
+        def cast(job):
+            user_id, choices = job
+            try:
+                for vote_type in choices:
+                    votes.record_vote(post.PostID, vote_type, user_id=user_id, write_behind=options['write_behind'])
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        try:
+            with ThreadPoolExecutor(max_workers=options['threads']) as pool:
+                list(pool.map(cast, jobs))
+            if options['write_behind']:
+                votes.get_vote_buffer().flush()
+            elapsed = time.perf_counter() - started
+
+            post.refresh_from_db()
+            recorded = {
+                vote_type: Vote.objects.filter(PostID=post, VoteType=vote_type).count()
+                for vote_type in votes.VOTE_TYPES
+            }
+        finally:
+            post.delete()
+            User.objects.filter(pk__in=[user.UserID for user in users]).delete()
+
+        total = sum(len(choices) for _, choices in jobs)
+        self.stdout.write(f"{total} votes in {elapsed:.2f}s ({total / elapsed:.0f} votes/s) on {options['threads']} threads")
+        self.stdout.write(f"expected   up={expected['upvote']} down={expected['downvote']}")
+        self.stdout.write(f"counters   up={post.UpvoteCount} down={post.DownvoteCount}")
+        self.stdout.write(f"vote rows  up={recorded['upvote']} down={recorded['downvote']} (+{options['anonymous']} anonymous)")
+
+        if (post.UpvoteCount, post.DownvoteCount) != (expected['upvote'], expected['downvote']):
+            raise CommandError("Final vote counts do not match the votes cast.")
+        self.stdout.write(self.style.SUCCESS("Final vote counts are exact."))
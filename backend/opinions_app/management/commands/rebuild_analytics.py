@@ -0,0 +1,36 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.utils.dateparse import parse_date
+
+from opinions_app.analytics import prune_rollups, rebuild_rollups
+
+
+class Command(BaseCommand):
+    help = (
+        "Backfill the stance rollups served by the /stance/ endpoints from the posts, replies and votes tables "
+        "with one bulk statement, and drop hourly buckets older than ANALYTICS_HOURLY_DAYS. Writes to the "
+        "rollups wait while it runs."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--since', help="Only rebuild the buckets from this date (YYYY-MM-DD) on.")
+        parser.add_argument(
+            '--prune', action='store_true',
+            help="Only drop the expired hourly buckets; run it nightly (e.g. from cron).",
+        )
+
+    def handle(self, *args, **options):
+        if options['prune']:
+            pruned = prune_rollups()
+            self.stdout.write(self.style.SUCCESS(f"Dropped {pruned} expired hourly buckets."))
+            return
+
+        since = None
+        if options['since']:
+            try:
+                since = parse_date(options['since'])
+            except ValueError:
+                since = None
+            if since is None:
+                raise CommandError("Invalid --since. Use YYYY-MM-DD.")
+        rebuilt = rebuild_rollups(since)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} stance rollups."))
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from opinions_app.user_stats import rebuild_user_stats
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute every user's stats (vote totals, post and reply counts, agree/disagree received) "
+        "from the posts and replies tables with one bulk statement. Writes to user_stats wait while it runs."
+    )
+
+    def handle(self, *args, **options):
+        rebuilt = rebuild_user_stats()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt stats for {rebuilt} users."))
@@ -0,0 +1,27 @@
+from django.core.management.base import BaseCommand
+
+from opinions_app.recommendations import refresh_recommendations
+
+
+class Command(BaseCommand):
+    help = (
+        "Recompute the prompt and post recommendations served by /api/user/<id>/recommendations/. Run it "
+        "nightly (e.g. from cron): it adds the activity since the last run to each user's interests and "
+        "rescores the users with new activity and those whose lists are older than RECOMMEND_MAX_AGE_DAYS."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--full', action='store_true',
+            help="Rebuild every user's interests from all activity, e.g. after changing the weights in recommendations.py.",
+        )
+
+    def handle(self, *args, **options):
+        run = refresh_recommendations(full=options['full'])
+        for step, seconds in run.timings.items():
+            self.stdout.write(f"{step:<14} {seconds:8.1f}s")
+        kind = "Rebuilt" if run.Full else "Refreshed"
+        self.stdout.write(self.style.SUCCESS(
+            f"{kind} recommendations for {run.Users} users from {run.interactions} interactions "
+            f"in {(run.FinishedAt - run.StartedAt).total_seconds():.1f}s."
+        ))
@@ -0,0 +1,24 @@
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from opinions_app.trending import refresh_trending_scores
+
+
+class Command(BaseCommand):
+    help = "Recompute the precomputed trending scores read by the trending feed. Run it periodically (e.g. every minute from cron)."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=7,
+            help="Only rescore posts created in the last N days (default: 7). Use 0 to rescore every post.",
+        )
+
+    def handle(self, *args, **options):
+        if options['days']:
+            since = timezone.now() - timedelta(days=options['days'])
+        else:
+            since = datetime(1970, 1, 1, tzinfo=dt_timezone.utc)
+        updated = refresh_trending_scores(since)
+        self.stdout.write(self.style.SUCCESS(f"Updated trending scores for {updated} posts."))
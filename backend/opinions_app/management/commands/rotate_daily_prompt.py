@@ -0,0 +1,54 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+
+from opinions_app.daily import rebuild_daily_responses, schedule_daily_prompt
+from opinions_app.models import Prompt
+
+
+class Command(BaseCommand):
+    help = (
+        "Schedule the daily prompt for today and the next days that have none, picking the least recently "
+        "featured prompts. Run it daily (e.g. from cron) so the next prompt is ready before midnight; "
+        "/api/daily/ schedules today's prompt itself if it has not run."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=2, help="Days to schedule, starting today (default: 2).")
+        parser.add_argument('--date', help="Only this date (YYYY-MM-DD), for --prompt or --rebuild.")
+        parser.add_argument('--prompt', type=int, help="Feature this prompt ID on --date (default: today), replacing any scheduled one.")
+        parser.add_argument('--rebuild', action='store_true', help="Recompute the responses snapshot of --date (default: today) from the posts table.")
+
+    def handle(self, *args, **options):
+        today = timezone.localdate()
+        date = today
+        if options['date']:
+            try:
+                date = parse_date(options['date'])
+            except ValueError:
+                date = None
+            if date is None:
+                raise CommandError("--date takes a date as YYYY-MM-DD.")
+
+        if options['rebuild']:
+            rebuilt = rebuild_daily_responses(date)
+            if rebuilt is None:
+                raise CommandError(f"No daily prompt is scheduled on {date}.")
+            self.stdout.write(self.style.SUCCESS(f"Rebuilt {rebuilt} responses for {date}."))
+            return
+
+        if options['prompt'] is not None:
+            if not Prompt.objects.filter(pk=options['prompt']).exists():
+                raise CommandError(f"Prompt {options['prompt']} does not exist.")
+            dates = [date]
+        else:
+            dates = [today + timedelta(days=day) for day in range(options['days'])]
+
+        for day in dates:
+            daily = schedule_daily_prompt(day, options['prompt'])
+            if daily is None:
+                raise CommandError("There are no prompts to schedule.")
+            self.stdout.write(f"{day}: prompt {daily.PromptID_id} ({daily.responses.count()} responses)")
+        self.stdout.write(self.style.SUCCESS(f"Scheduled {len(dates)} days."))
@@ -0,0 +1,62 @@
+import io
+import os
+import pstats
+from collections import Counter
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from opinions_app.profiling import FORMATS
+
+
+class Command(BaseCommand):
+    help = (
+        "List the request profiles in PROFILE_DIR, or merge those of one URL name: pstats profiles are "
+        "printed as a table of the most expensive functions, collapsed stacks are printed merged, one "
+        "line per stack, for flamegraph.pl or speedscope."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('view', nargs='?', help="URL name whose profiles to merge, e.g. get_replies.")
+        parser.add_argument('--format', choices=sorted(FORMATS), default='pstats', help="Which profiles to merge (default: pstats).")
+        parser.add_argument('--sort', default='cumulative', help="pstats sort key (default: cumulative).")
+        parser.add_argument('--limit', type=int, default=30, help="pstats rows to print (default: 30).")
+
+    def handle(self, *args, **options):
+        if not os.path.isdir(settings.PROFILE_DIR):
+            raise CommandError(f"No profiles in {settings.PROFILE_DIR}.")
+        if options['view'] is None:
+            self.list_profiles()
+            return
+
+        directory = os.path.join(settings.PROFILE_DIR, options['view'])
+        extension = FORMATS[options['format']]
+        paths = sorted(
+            os.path.join(directory, name) for name in (os.listdir(directory) if os.path.isdir(directory) else ())
+            if name.endswith(extension)
+        )
+        if not paths:
+            raise CommandError(f"No {options['format']} profiles of {options['view']}.")
+
+        if options['format'] == 'pstats':
+            output = io.StringIO()
+            stats = pstats.Stats(*paths, stream=output)
+            stats.strip_dirs().sort_stats(options['sort']).print_stats(options['limit'])
+            self.stdout.write(f"{len(paths)} profiles of {options['view']}")
+            self.stdout.write(output.getvalue())
+        else:
+            stacks = Counter()
+            for path in paths:
+                with open(path) as profile:
+                    for line in profile:
+                        stack, _, count = line.rstrip('\n').rpartition(' ')
+                        stacks[stack] += int(count)
+            for stack, count in stacks.most_common():
+                self.stdout.write(f"{stack} {count}")
+
+    def list_profiles(self):
+        self.stdout.write(f"{'view':<32} {'collapsed':>9} {'pstats':>7}  newest")
+        for view in sorted(os.listdir(settings.PROFILE_DIR)):
+            names = sorted(os.listdir(os.path.join(settings.PROFILE_DIR, view)))
+            counts = {kind: sum(name.endswith(extension) for name in names) for kind, extension in FORMATS.items()}
+            self.stdout.write(f"{view:<32} {counts['collapsed']:>9} {counts['pstats']:>7}  {names[-1] if names else ''}")
@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from opinions_app.timeline import trim_timelines
+
+
+class Command(BaseCommand):
+    help = "Delete home timeline entries beyond the newest TIMELINE_MAX_LENGTH per user. Run it periodically."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--max-length', type=int, default=settings.TIMELINE_MAX_LENGTH,
+            help=f"Entries to keep per timeline (default: TIMELINE_MAX_LENGTH, currently {settings.TIMELINE_MAX_LENGTH}).",
+        )
+
+    def handle(self, *args, **options):
+        deleted = trim_timelines(options['max_length'])
+        self.stdout.write(self.style.SUCCESS(f"Deleted {deleted} timeline entries."))
@@ -0,0 +1,204 @@
+import bisect
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+logger = logging.getLogger(__name__)
+
+# Request metrics of this process, per URL name, in Prometheus' text format at
+# /api/metrics/. Each server process keeps its own: scrape every process, or
+# aggregate them in Prometheus by instance.
+#
+# Queries are timed by an execute wrapper installed on every database
+# connection when it opens. It charges them to the request being served
+# through a context variable, which also reaches the query threads of the
+# async views.
+
+PROMETHEUS_CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Upper bounds of the histogram buckets
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (0, 1, 2, 3, 5, 10, 20, 50, 100)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576)
+
+# Requests with no URL name, such as 404s
+UNMATCHED = 'unmatched'
+METHODS = {'GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS'}
+
+
+class RequestMetrics:
+    """
+    What one request spent, filled in while it is served. Queries of an async
+    view may be recorded from several threads at once.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.queries = 0
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.slow_queries = 0
+        self.statements = Counter()
+
+    def add_query(self, sql, seconds, slow):
+        with self.lock:
+            self.queries += 1
+            self.sql_seconds += seconds
+            self.slow_queries += slow
+            self.statements[sql] += 1
+
+    def add_render(self, seconds):
+        with self.lock:
+            self.render_seconds += seconds
+
+
+current_request = contextvars.ContextVar('current_request_metrics', default=None)
+
+
+def record_query(execute, sql, params, many, context):
+    request_metrics = current_request.get()
+    if request_metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        seconds = time.perf_counter() - started
+        slow = seconds >= settings.METRICS_SLOW_QUERY
+        request_metrics.add_query(sql, seconds, slow)
+        if slow:
+            logger.warning("Slow query (%.1fms) on %s: %s", seconds * 1000, context['connection'].alias, sql)
+
+
+@receiver(connection_created)
+def instrument_connection(sender, connection, **kwargs):
+    # Sent each time the connection (re)opens; the wrapper list outlives it
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+def record_render(seconds):
+    """
+    Charge `seconds` of response rendering to the current request, for
+    responses that are not rendered by DRF (see MetricsMiddleware).
+    """
+    request_metrics = current_request.get()
+    if request_metrics is not None:
+        request_metrics.add_render(seconds)
+
+
+class Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last one is +Inf
+        self.sum = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+
+class ViewMetrics:
+    def __init__(self):
+        self.duration = Histogram(DURATION_BUCKETS)
+        self.queries = Histogram(QUERY_COUNT_BUCKETS)
+        self.response_size = Histogram(SIZE_BUCKETS)
+        self.sql_seconds = 0.0
+        self.render_seconds = 0.0
+        self.slow_queries = 0
+        self.repeated_queries = 0
+        self.statuses = Counter()
+
+
+registry_lock = threading.Lock()
+registry = {}  # (URL name, method) -> ViewMetrics
+
+
+def observe(view_name, method, status_code, seconds, size, request_metrics):
+    """
+    Record a finished request, and log any statement it ran at least
+    METRICS_REPEATED_QUERY times: usually a query per row of a list (N+1).
+    """
+    repeated = [
+        (sql, count) for sql, count in request_metrics.statements.items()
+        if count >= settings.METRICS_REPEATED_QUERY
+    ]
+    for sql, count in repeated:
+        logger.warning("Possible N+1 in %s %s: the same query ran %d times: %s", method, view_name, count, sql)
+
+    with registry_lock:
+        metrics = registry.get((view_name, method))
+        if metrics is None:
+            metrics = registry[(view_name, method)] = ViewMetrics()
+        metrics.duration.observe(seconds)
+        metrics.queries.observe(request_metrics.queries)
+        if size is not None:
+            metrics.response_size.observe(size)
+        metrics.sql_seconds += request_metrics.sql_seconds
+        metrics.render_seconds += request_metrics.render_seconds
+        metrics.slow_queries += request_metrics.slow_queries
+        metrics.repeated_queries += bool(repeated)
+        metrics.statuses[status_code] += 1
+
+
+def reset():
+    with registry_lock:
+        registry.clear()
+
+
+def label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_metrics():
+    """
+    The registry in Prometheus' text exposition format.
+    """
+    with registry_lock:
+        snapshot = sorted(registry.items())
+        lines = []
+
+        def family(name, kind, description, samples):
+            lines.append(f"# HELP {name} {description}")
+            lines.append(f"# TYPE {name} {kind}")
+            lines.extend(samples)
+
+        def labels(view_name, method, **extra):
+            pairs = {'view': view_name, 'method': method, **extra}
+            return '{' + ','.join(f'{key}="{label_value(value)}"' for key, value in pairs.items()) + '}'
+
+        def histogram(name, description, attribute):
+            samples = []
+            for (view_name, method), metrics in snapshot:
+                hist = getattr(metrics, attribute)
+                cumulative = 0
+                for bound, count in zip([*hist.buckets, '+Inf'], hist.counts):
+                    cumulative += count
+                    samples.append(f"{name}_bucket{labels(view_name, method, le=bound)} {cumulative}")
+                samples.append(f"{name}_sum{labels(view_name, method)} {hist.sum}")
+                samples.append(f"{name}_count{labels(view_name, method)} {cumulative}")
+            family(name, 'histogram', description, samples)
+
+        def counter(name, description, attribute):
+            samples = [f"{name}{labels(view_name, method)} {getattr(metrics, attribute)}" for (view_name, method), metrics in snapshot]
+            family(name, 'counter', description, samples)
+
+        family('flare_http_requests_total', 'counter', "Requests served, by URL name, method and status code.", [
+            f"flare_http_requests_total{labels(view_name, method, status=status_code)} {count}"
+            for (view_name, method), metrics in snapshot
+            for status_code, count in sorted(metrics.statuses.items())
+        ])
+        histogram('flare_http_request_duration_seconds', "Time from the request reaching the middleware to its response.", 'duration')
+        histogram('flare_db_queries_per_request', "Database queries run while serving a request.", 'queries')
+        histogram('flare_http_response_size_bytes', "Size of the response body as sent, after compression. Streams are not counted.", 'response_size')
+        counter('flare_db_query_seconds_total', "Time spent running database queries.", 'sql_seconds')
+        counter('flare_render_seconds_total', "Time spent rendering response data to JSON.", 'render_seconds')
+        counter('flare_db_slow_queries_total', "Queries that took longer than METRICS_SLOW_QUERY seconds.", 'slow_queries')
+        counter('flare_db_repeated_query_requests_total', "Requests that ran the same statement METRICS_REPEATED_QUERY times or more (possible N+1).", 'repeated_queries')
+    return '\n'.join(lines) + '\n'
@@ -0,0 +1,115 @@
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.middleware.gzip import GZipMiddleware as DjangoGZipMiddleware
+
+from . import metrics, profiling
+
+
+class GZipMiddleware(DjangoGZipMiddleware):
+    """
+    Django's GZipMiddleware, except for Server-Sent Event streams: those are
+    mostly idle keep-alives, and compressing them would hold a zlib stream in
+    memory for every connected client.
+    """
+
+    def process_response(self, request, response):
+        if response.get('Content-Type', '').startswith('text/event-stream'):
+            return response
+        return super().process_response(request, response)
+
+
+class MetricsMiddleware:
+    """
+    Records the latency, queries, render time and response size of every
+    request under its URL name (see metrics.py). Goes first in MIDDLEWARE, so
+    that it times the whole request and sees the compressed size.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        if not settings.METRICS_ENABLED:
+            return self.get_response(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.observe(request, response, request_metrics, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.METRICS_ENABLED:
+            return await self.get_response(request)
+        request_metrics = metrics.RequestMetrics()
+        token = metrics.current_request.set(request_metrics)
+        started = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            metrics.current_request.reset(token)
+        self.observe(request, response, request_metrics, time.perf_counter() - started)
+        return response
+
+    def process_template_response(self, request, response):
+        # DRF responses are rendered after the view returns, and before the response reaches __call__
+        request_metrics = metrics.current_request.get()
+        if request_metrics is not None:
+            started = time.perf_counter()
+            response.add_post_render_callback(lambda rendered: request_metrics.add_render(time.perf_counter() - started))
+        return response
+
+    def observe(self, request, response, request_metrics, seconds):
+        match = request.resolver_match
+        view_name = match.view_name if match and match.view_name else metrics.UNMATCHED
+        # Any other method a client sends is one label value, so it cannot grow the registry
+        method = request.method if request.method in metrics.METHODS else 'OTHER'
+        size = None if response.streaming else len(response.content)
+        metrics.observe(view_name, method, response.status_code, seconds, size, request_metrics)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles the requests profiling.requested_format() picks and saves their
+    profiles, named in an X-Profile-Id response header. Goes after
+    AuthenticationMiddleware, which it needs to recognise staff users. Async
+    requests pass through unprofiled.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.get_response(request)
+        profile_format = profiling.requested_format(request)
+        if profile_format is None:
+            return self.get_response(request)
+
+        profiler = profiling.RequestProfiler(profile_format)
+        profiler.start()
+        try:
+            response = self.get_response(request)
+        finally:
+            profiler.stop()
+        match = request.resolver_match
+        view_name = match.view_name if match and match.view_name else metrics.UNMATCHED
+        method = request.method if request.method in metrics.METHODS else 'OTHER'
+        response['X-Profile-Id'] = profiler.save(view_name, method)
+        return response
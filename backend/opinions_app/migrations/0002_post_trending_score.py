@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='TrendingScore',
+            field=models.FloatField(db_column='trending_score', default=0),
+        ),
+        # Score existing posts so the trending feed is populated before the first refresh
+        migrations.RunSQL(
+            """
+            UPDATE posts
+            SET trending_score = SIGN(upvote_count - downvote_count)
+                * LOG(GREATEST(ABS(upvote_count - downvote_count), 1))
+                + (EXTRACT(EPOCH FROM created_at) - 1735689600) / 45000;
+            """,
+            migrations.RunSQL.noop,
+        ),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(fields=['-TrendingScore', '-PostID'], name='posts_trending_idx'),
+        ),
+    ]
@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:21
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0002_post_trending_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Vote',
+            fields=[
+                ('VoteID', models.AutoField(db_column='voteid', primary_key=True, serialize=False)),
+                ('VoteType', models.CharField(choices=[('upvote', 'Upvote'), ('downvote', 'Downvote')], db_column='vote_type', max_length=8)),
+                ('CreatedAt', models.DateTimeField(auto_now_add=True, db_column='created_at')),
+                ('PostID', models.ForeignKey(db_column='post_id', on_delete=django.db.models.deletion.CASCADE, to='opinions_app.post')),
+                ('UserID', models.ForeignKey(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, to='opinions_app.user')),
+            ],
+            options={
+                'db_table': 'votes',
+                'constraints': [models.UniqueConstraint(fields=('UserID', 'PostID'), name='votes_user_post_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:23
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Copy every valid entry of users.followers into the follows table and
+# initialise the counters from it. Self-follows and IDs of deleted users are dropped.
+COPY_FOLLOWERS = """
+INSERT INTO follows (follower_id, followee_id, created_at)
+SELECT DISTINCT f.follower_id, u.userid, NOW()
+FROM users u
+CROSS JOIN LATERAL unnest(u.followers) AS f (follower_id)
+JOIN users follower ON follower.userid = f.follower_id
+WHERE f.follower_id <> u.userid
+ON CONFLICT DO NOTHING;
+
+UPDATE users
+SET follower_count = (SELECT COUNT(*) FROM follows WHERE follows.followee_id = users.userid),
+    following_count = (SELECT COUNT(*) FROM follows WHERE follows.follower_id = users.userid);
+"""
+
+RESTORE_FOLLOWERS = """
+UPDATE users
+SET followers = ARRAY(
+    SELECT follower_id FROM follows WHERE follows.followee_id = users.userid ORDER BY followid
+);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0003_vote'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Follow',
+            fields=[
+                ('FollowID', models.AutoField(db_column='followid', primary_key=True, serialize=False)),
+                ('CreatedAt', models.DateTimeField(auto_now_add=True, db_column='created_at')),
+                ('FolloweeID', models.ForeignKey(db_column='followee_id', on_delete=django.db.models.deletion.CASCADE, related_name='follower_edges', to='opinions_app.user')),
+                ('FollowerID', models.ForeignKey(db_column='follower_id', on_delete=django.db.models.deletion.CASCADE, related_name='following_edges', to='opinions_app.user')),
+            ],
+            options={
+                'db_table': 'follows',
+                'indexes': [models.Index(fields=['FolloweeID', 'FollowerID'], name='follows_followee_idx')],
+                'constraints': [models.UniqueConstraint(fields=('FollowerID', 'FolloweeID'), name='follows_follower_followee_uniq'), models.CheckConstraint(condition=models.Q(('FollowerID', models.F('FolloweeID')), _negated=True), name='follows_no_self_follow')],
+            },
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='FollowerCount',
+            field=models.IntegerField(db_column='follower_count', default=0),
+        ),
+        migrations.AddField(
+            model_name='user',
+            name='FollowingCount',
+            field=models.IntegerField(db_column='following_count', default=0),
+        ),
+        migrations.RunSQL(COPY_FOLLOWERS, RESTORE_FOLLOWERS),
+        migrations.RemoveField(
+            model_name='user',
+            name='Followers',
+        ),
+    ]
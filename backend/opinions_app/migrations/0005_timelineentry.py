@@ -0,0 +1,28 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:24
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0004_follow'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelineEntry',
+            fields=[
+                ('EntryID', models.BigAutoField(db_column='entryid', primary_key=True, serialize=False)),
+                ('CreatedAt', models.DateTimeField(db_column='created_at')),
+                ('OwnerID', models.ForeignKey(db_column='owner_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='opinions_app.user')),
+                ('PostID', models.ForeignKey(db_column='post_id', on_delete=django.db.models.deletion.CASCADE, related_name='timeline_entries', to='opinions_app.post')),
+            ],
+            options={
+                'db_table': 'timelines',
+                'indexes': [models.Index(fields=['OwnerID', '-CreatedAt', '-PostID'], name='timelines_owner_recent_idx')],
+                'constraints': [models.UniqueConstraint(fields=('OwnerID', 'PostID'), name='timelines_owner_post_uniq')],
+            },
+        ),
+    ]
@@ -0,0 +1,45 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+# Initial stats for every existing user, from their posts and replies
+BACKFILL_USER_STATS = """
+INSERT INTO user_stats (user_id, total_upvotes, total_downvotes, post_count, reply_count, agree_received, disagree_received)
+SELECT users.userid,
+       COALESCE((SELECT SUM(upvote_count) FROM posts WHERE posts.user_id = users.userid), 0),
+       COALESCE((SELECT SUM(downvote_count) FROM posts WHERE posts.user_id = users.userid), 0),
+       (SELECT COUNT(*) FROM posts WHERE posts.user_id = users.userid),
+       (SELECT COUNT(*) FROM replies WHERE replies.user_id = users.userid),
+       (SELECT COUNT(*) FROM replies JOIN posts ON posts.postid = replies.post_id
+        WHERE posts.user_id = users.userid AND replies.isagree),
+       (SELECT COUNT(*) FROM replies JOIN posts ON posts.postid = replies.post_id
+        WHERE posts.user_id = users.userid AND NOT replies.isagree)
+FROM users;
+"""
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0005_timelineentry'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='UserStats',
+            fields=[
+                ('UserID', models.OneToOneField(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='stats', serialize=False, to='opinions_app.user')),
+                ('TotalUpvotes', models.IntegerField(db_column='total_upvotes', default=0)),
+                ('TotalDownvotes', models.IntegerField(db_column='total_downvotes', default=0)),
+                ('PostCount', models.IntegerField(db_column='post_count', default=0)),
+                ('ReplyCount', models.IntegerField(db_column='reply_count', default=0)),
+                ('AgreeReceived', models.IntegerField(db_column='agree_received', default=0)),
+                ('DisagreeReceived', models.IntegerField(db_column='disagree_received', default=0)),
+            ],
+            options={
+                'db_table': 'user_stats',
+            },
+        ),
+        migrations.RunSQL(BACKFILL_USER_STATS, migrations.RunSQL.noop),
+    ]
@@ -0,0 +1,40 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so posts stay writable during the migration
+    atomic = False
+
+    dependencies = [
+        ('opinions_app', '0006_userstats'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['-CreatedAt', '-PostID'], name='posts_recent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(fields=['UserID', '-CreatedAt', '-PostID'], name='posts_user_recent_idx'),
+        ),
+        AddIndexConcurrently(
+            model_name='post',
+            index=models.Index(condition=models.Q(('PromptID__isnull', False)), fields=['PromptID', '-TrendingScore', '-PostID'], name='posts_prompt_trending_idx'),
+        ),
+        # The single-column foreign key indexes are prefixes of the indexes above
+        migrations.AlterField(
+            model_name='post',
+            name='PromptID',
+            field=models.ForeignKey(db_column='prompt_id', db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to='opinions_app.prompt'),
+        ),
+        migrations.AlterField(
+            model_name='post',
+            name='UserID',
+            field=models.ForeignKey(db_column='user_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='opinions_app.user'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently so replies stay writable during the migration
+    atomic = False
+
+    dependencies = [
+        ('opinions_app', '0007_post_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='reply',
+            index=models.Index(fields=['PostID', 'CreatedAt', 'ReplyID'], name='replies_post_created_idx'),
+        ),
+        # The single-column foreign key index is a prefix of replies_post_created_idx
+        migrations.AlterField(
+            model_name='reply',
+            name='PostID',
+            field=models.ForeignKey(db_column='post_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='opinions_app.post'),
+        ),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:33
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    atomic = False
+
+    dependencies = [
+        ('opinions_app', '0008_reply_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='prompt',
+            index=models.Index(fields=['Category', 'PromptID'], name='prompts_category_idx'),
+        ),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 18:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0009_prompt_indexes'),
+    ]
+
+    # Each dropped index is a prefix of a composite index or unique constraint
+    operations = [
+        migrations.AlterField(
+            model_name='follow',
+            name='FolloweeID',
+            field=models.ForeignKey(db_column='followee_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='follower_edges', to='opinions_app.user'),
+        ),
+        migrations.AlterField(
+            model_name='follow',
+            name='FollowerID',
+            field=models.ForeignKey(db_column='follower_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='following_edges', to='opinions_app.user'),
+        ),
+        migrations.AlterField(
+            model_name='vote',
+            name='UserID',
+            field=models.ForeignKey(db_column='user_id', db_index=False, on_delete=django.db.models.deletion.CASCADE, to='opinions_app.user'),
+        ),
+    ]
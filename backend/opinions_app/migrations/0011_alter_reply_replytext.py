@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 09:10
+
+from django.db import migrations, models
+
+
+# 0001_initial created the column as "replytext", while the model, db_start.py
+# and the search vectors of 0012 use "reply_text"
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0011_reply_stance_index'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reply',
+            name='ReplyText',
+            field=models.TextField(db_column='reply_text'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:05
+
+from django.contrib.postgres.operations import AddIndexConcurrently
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    # Built concurrently so replies stay writable during the migration
+    atomic = False
+
+    dependencies = [
+        ('opinions_app', '0010_drop_redundant_fk_indexes'),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name='reply',
+            index=models.Index(fields=['PostID', 'isAgree'], name='replies_post_stance_idx'),
+        ),
+    ]
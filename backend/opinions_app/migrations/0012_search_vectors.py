@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:20
+
+from django.db import migrations
+
+# The tsvector columns are generated by Postgres, so every write keeps them
+# current. They are left out of the models: search.py reads them with SQL,
+# and no other query or serializer should load them.
+SEARCHABLE = [
+    ('prompts', 'prompt_text'),
+    ('posts', 'posttext'),
+    ('replies', 'reply_text'),
+]
+
+
+def add_search_vector(table, column):
+    return [
+        migrations.RunSQL(
+            f"ALTER TABLE {table} ADD COLUMN search_vector tsvector "
+            f"GENERATED ALWAYS AS (to_tsvector('english', COALESCE({column}, ''))) STORED;",
+            reverse_sql=f"ALTER TABLE {table} DROP COLUMN search_vector;",
+        ),
+        migrations.RunSQL(
+            f"CREATE INDEX CONCURRENTLY {table}_search_idx ON {table} USING GIN (search_vector);",
+            reverse_sql=f"DROP INDEX CONCURRENTLY {table}_search_idx;",
+        ),
+    ]
+
+
+class Migration(migrations.Migration):
+    # Indexes are built concurrently. Adding the columns still rewrites each
+    # table under an exclusive lock.
+    atomic = False
+
+    dependencies = [
+        ('opinions_app', '0011_alter_reply_replytext'),
+    ]
+
+    operations = [operation for table, column in SEARCHABLE for operation in add_search_vector(table, column)]
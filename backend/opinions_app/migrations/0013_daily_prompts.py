@@ -0,0 +1,38 @@
+# Generated by Django 5.1.3 on 2026-10-18 19:30
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0012_search_vectors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyPrompt',
+            fields=[
+                ('Date', models.DateField(db_column='date', primary_key=True, serialize=False)),
+                ('PromptID', models.ForeignKey(db_column='prompt_id', on_delete=django.db.models.deletion.CASCADE, related_name='daily_dates', to='opinions_app.prompt')),
+            ],
+            options={
+                'db_table': 'daily_prompts',
+            },
+        ),
+        migrations.CreateModel(
+            name='DailyResponse',
+            fields=[
+                ('ResponseID', models.BigAutoField(db_column='responseid', primary_key=True, serialize=False)),
+                ('Score', models.IntegerField(db_column='score', default=0)),
+                ('Date', models.ForeignKey(db_column='date', db_index=False, on_delete=django.db.models.deletion.CASCADE, related_name='responses', to='opinions_app.dailyprompt')),
+                ('PostID', models.ForeignKey(db_column='post_id', on_delete=django.db.models.deletion.CASCADE, related_name='daily_responses', to='opinions_app.post')),
+            ],
+            options={
+                'db_table': 'daily_responses',
+                'indexes': [models.Index(fields=['Date', '-Score', '-PostID'], name='daily_responses_top_idx')],
+                'constraints': [models.UniqueConstraint(fields=('Date', 'PostID'), name='daily_responses_date_post_uniq')],
+            },
+        ),
+    ]
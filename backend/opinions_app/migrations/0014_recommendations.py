@@ -0,0 +1,43 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:02
+
+import django.contrib.postgres.fields
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0013_daily_prompts'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RecommendationRun',
+            fields=[
+                ('RunID', models.AutoField(db_column='runid', primary_key=True, serialize=False)),
+                ('StartedAt', models.DateTimeField(db_column='started_at')),
+                ('FinishedAt', models.DateTimeField(db_column='finished_at', null=True)),
+                ('Full', models.BooleanField(db_column='full', default=False)),
+                ('Users', models.IntegerField(db_column='users', default=0)),
+            ],
+            options={
+                'db_table': 'recommendation_runs',
+            },
+        ),
+        migrations.CreateModel(
+            name='Recommendation',
+            fields=[
+                ('UserID', models.OneToOneField(db_column='user_id', on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='recommendation', serialize=False, to='opinions_app.user')),
+                ('Vector', models.BinaryField(db_column='vector')),
+                ('PostIDs', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), db_column='post_ids', size=None)),
+                ('PromptIDs', django.contrib.postgres.fields.ArrayField(base_field=models.IntegerField(), db_column='prompt_ids', size=None)),
+                ('Categories', django.contrib.postgres.fields.ArrayField(base_field=models.TextField(), db_column='categories', size=None)),
+                ('ComputedAt', models.DateTimeField(db_column='computed_at')),
+            ],
+            options={
+                'db_table': 'recommendations',
+                'indexes': [models.Index(fields=['ComputedAt'], name='recommendations_computed_idx')],
+            },
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.1.3 on 2026-10-18 20:23
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0014_recommendations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StanceRollup',
+            fields=[
+                ('RollupID', models.BigAutoField(db_column='rollupid', primary_key=True, serialize=False)),
+                ('Scope', models.TextField(db_column='scope')),
+                ('Key', models.TextField(db_column='key')),
+                ('Period', models.TextField(db_column='period')),
+                ('BucketStart', models.DateTimeField(db_column='bucket_start')),
+                ('Posts', models.IntegerField(db_column='posts', default=0)),
+                ('Agree', models.IntegerField(db_column='agree', default=0)),
+                ('Disagree', models.IntegerField(db_column='disagree', default=0)),
+                ('Upvotes', models.IntegerField(db_column='upvotes', default=0)),
+                ('Downvotes', models.IntegerField(db_column='downvotes', default=0)),
+            ],
+            options={
+                'db_table': 'stance_rollups',
+                'constraints': [models.UniqueConstraint(fields=('Scope', 'Key', 'Period', 'BucketStart'), name='stance_rollups_bucket_uniq')],
+            },
+        ),
+    ]
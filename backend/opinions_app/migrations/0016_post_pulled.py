@@ -0,0 +1,30 @@
+# Generated by Django 5.1.3 on 2026-10-18 21:40
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+def mark_pulled_posts(apps, schema_editor):
+    # Posts of authors over the limit were never pushed into follower timelines
+    Post = apps.get_model('opinions_app', 'Post')
+    Post.objects.filter(UserID__FollowerCount__gt=settings.TIMELINE_FANOUT_LIMIT).update(Pulled=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0015_stance_rollups'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='Pulled',
+            field=models.BooleanField(db_column='pulled', db_default=False),
+        ),
+        migrations.RunPython(mark_pulled_posts, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='post',
+            index=models.Index(condition=models.Q(('Pulled', True)), fields=['UserID', '-CreatedAt', '-PostID'], name='posts_user_pulled_idx'),
+        ),
+    ]
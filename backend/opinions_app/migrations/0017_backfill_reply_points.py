@@ -0,0 +1,20 @@
+# Generated by Django 5.1.3 on 2026-10-19 09:40
+
+from django.db import migrations
+
+
+# User.ReplyPoints is now a point per reply written, kept in step by user_stats.py
+BACKFILL_REPLY_POINTS = """
+UPDATE users SET reply_points = (SELECT COUNT(*) FROM replies WHERE replies.user_id = users.userid);
+"""
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('opinions_app', '0016_post_pulled'),
+    ]
+
+    operations = [
+        migrations.RunSQL(BACKFILL_REPLY_POINTS, migrations.RunSQL.noop),
+    ]
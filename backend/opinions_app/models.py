@@ -1,5 +1,7 @@
-from django.db import models
 from django.contrib.postgres.fields import ArrayField
+from django.db import models
+from django.utils import timezone
+from .trending import hot_score
 
 class Prompt(models.Model):
     PromptID = models.AutoField(primary_key=True, db_column='promptid')
@@ -8,6 +10,10 @@ class Prompt(models.Model):
     
     class Meta:
         db_table = 'prompts'
+        indexes = [
+            # Prompts of a category, in ID order
+            models.Index(fields=['Category', 'PromptID'], name='prompts_category_idx'),
+        ]
 
 class User(models.Model):
     UserID = models.AutoField(primary_key=True, db_column='userid')  
@@ -18,27 +24,73 @@ class User(models.Model):
     JoinDate = models.DateTimeField(auto_now_add=True, db_column='join_date')
     Bio = models.TextField(null=True, db_column='bio')
     ReplyPoints = models.IntegerField(default=0, db_column='reply_points')
-    Followers = ArrayField(models.IntegerField(), null=True, db_column='followers')  # Array of user IDs who follow this user
+    FollowerCount = models.IntegerField(default=0, db_column='follower_count')  # Maintained alongside the follows table
+    FollowingCount = models.IntegerField(default=0, db_column='following_count')
 
     class Meta:
         db_table = 'users'
 
+class Follow(models.Model):
+    FollowID = models.AutoField(primary_key=True, db_column='followid')
+    FollowerID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='follower_id', related_name='following_edges', db_index=False)  # The user who follows; covered by the unique constraint
+    FolloweeID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='followee_id', related_name='follower_edges', db_index=False)  # The user being followed; covered by follows_followee_idx
+    CreatedAt = models.DateTimeField(auto_now_add=True, db_column='created_at')
+
+    class Meta:
+        db_table = 'follows'
+        constraints = [
+            # Also serves "who does X follow" lookups, ordered by followee
+            models.UniqueConstraint(fields=['FollowerID', 'FolloweeID'], name='follows_follower_followee_uniq'),
+            models.CheckConstraint(condition=~models.Q(FollowerID=models.F('FolloweeID')), name='follows_no_self_follow'),
+        ]
+        indexes = [
+            # "Who follows X" lookups, ordered by follower
+            models.Index(fields=['FolloweeID', 'FollowerID'], name='follows_followee_idx'),
+        ]
+
 class Post(models.Model):
     PostID = models.AutoField(primary_key=True, db_column='postid')
-    PromptID = models.ForeignKey(Prompt, on_delete=models.SET_NULL, db_column='prompt_id', null=True)  # Relating to Prompt
-    UserID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='user_id')  # Relating to User
+    PromptID = models.ForeignKey(Prompt, on_delete=models.SET_NULL, db_column='prompt_id', null=True, db_index=False)  # Relating to Prompt; covered by posts_prompt_trending_idx
+    UserID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='user_id', db_index=False)  # Relating to User; covered by posts_user_recent_idx
     UpvoteCount = models.IntegerField(default=0, db_column='upvote_count')
     DownvoteCount = models.IntegerField(default=0, db_column='downvote_count')
     CreatedAt = models.DateTimeField(auto_now_add=True, db_column='created_at')
     PostText = models.TextField(db_column='posttext')
+    TrendingScore = models.FloatField(default=0, db_column='trending_score')  # Refreshed periodically by `manage.py refresh_trending`
+    Pulled = models.BooleanField(db_default=False, db_column='pulled')  # Merged into follower timelines at read time rather than pushed (see timeline.py)
     
     class Meta:
         db_table = 'posts'
+        indexes = [
+            models.Index(fields=['-TrendingScore', '-PostID'], name='posts_trending_idx'),
+            # Newest first, for the post feed and the trending refresh window
+            models.Index(fields=['-CreatedAt', '-PostID'], name='posts_recent_idx'),
+            # A user's posts, newest first (profile pages, timeline pulls and backfills)
+            models.Index(fields=['UserID', '-CreatedAt', '-PostID'], name='posts_user_recent_idx'),
+            # The pulled posts of a user, newest first, for timeline reads
+            models.Index(
+                fields=['UserID', '-CreatedAt', '-PostID'],
+                name='posts_user_pulled_idx',
+                condition=models.Q(Pulled=True),
+            ),
+            # Trending posts per prompt; posts without a prompt are left out
+            models.Index(
+                fields=['PromptID', '-TrendingScore', '-PostID'],
+                name='posts_prompt_trending_idx',
+                condition=models.Q(PromptID__isnull=False),
+            ),
+        ]
+
+    def save(self, *args, **kwargs):
+        # Score new posts immediately so they show up in the trending feed before the next refresh
+        if self._state.adding:
+            self.TrendingScore = hot_score(self.UpvoteCount, self.DownvoteCount, timezone.now())
+        super().save(*args, **kwargs)
 
 
 class Reply(models.Model):
     ReplyID = models.AutoField(primary_key=True, db_column='id')
-    PostID = models.ForeignKey(Post, on_delete=models.CASCADE, db_column='post_id')  # Relating to Post
+    PostID = models.ForeignKey(Post, on_delete=models.CASCADE, db_column='post_id', db_index=False)  # Relating to Post; covered by replies_post_created_idx
     UserID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='user_id')  # Relating to User
     ReplyText = models.TextField(db_column='reply_text')
     CreatedAt = models.DateTimeField(auto_now_add=True, db_column='created_at')
@@ -46,4 +98,138 @@ class Reply(models.Model):
 
     class Meta:
         db_table = 'replies'
-        
+        indexes = [
+            # A post's replies in conversation order
+            models.Index(fields=['PostID', 'CreatedAt', 'ReplyID'], name='replies_post_created_idx'),
+            # Agree/disagree counts of a post, as index-only scans
+            models.Index(fields=['PostID', 'isAgree'], name='replies_post_stance_idx'),
+        ]
+
+
+class Vote(models.Model):
+    VOTE_TYPES = [('upvote', 'Upvote'), ('downvote', 'Downvote')]
+
+    VoteID = models.AutoField(primary_key=True, db_column='voteid')
+    PostID = models.ForeignKey(Post, on_delete=models.CASCADE, db_column='post_id')  # Relating to Post
+    UserID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='user_id', db_index=False)  # Relating to User; covered by the unique constraint
+    VoteType = models.CharField(max_length=8, choices=VOTE_TYPES, db_column='vote_type')
+    CreatedAt = models.DateTimeField(auto_now_add=True, db_column='created_at')
+
+    class Meta:
+        db_table = 'votes'
+        constraints = [
+            # One vote per user per post; makes repeated votes idempotent
+            models.UniqueConstraint(fields=['UserID', 'PostID'], name='votes_user_post_uniq'),
+        ]
+
+
+class TimelineEntry(models.Model):
+    EntryID = models.BigAutoField(primary_key=True, db_column='entryid')
+    OwnerID = models.ForeignKey(User, on_delete=models.CASCADE, db_column='owner_id', related_name='timeline_entries', db_index=False)  # Whose home timeline this is; covered by the indexes below
+    PostID = models.ForeignKey(Post, on_delete=models.CASCADE, db_column='post_id', related_name='timeline_entries')
+    CreatedAt = models.DateTimeField(db_column='created_at')  # Copy of the post's CreatedAt, so pages are read from one index
+
+    class Meta:
+        db_table = 'timelines'
+        constraints = [
+            models.UniqueConstraint(fields=['OwnerID', 'PostID'], name='timelines_owner_post_uniq'),
+        ]
+        indexes = [
+            models.Index(fields=['OwnerID', '-CreatedAt', '-PostID'], name='timelines_owner_recent_idx'),
+        ]
+
+
+class UserStats(models.Model):
+    # Per-user aggregates, kept in step with post, reply and vote writes by user_stats.py.
+    # Rebuild them from scratch with `manage.py rebuild_user_stats`.
+    UserID = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, db_column='user_id', related_name='stats')
+    TotalUpvotes = models.IntegerField(default=0, db_column='total_upvotes')  # Upvotes received on the user's posts
+    TotalDownvotes = models.IntegerField(default=0, db_column='total_downvotes')
+    PostCount = models.IntegerField(default=0, db_column='post_count')
+    ReplyCount = models.IntegerField(default=0, db_column='reply_count')  # Replies written by the user
+    AgreeReceived = models.IntegerField(default=0, db_column='agree_received')  # Replies to the user's posts, by isAgree
+    DisagreeReceived = models.IntegerField(default=0, db_column='disagree_received')
+
+    class Meta:
+        db_table = 'user_stats'
+
+
+class DailyPrompt(models.Model):
+    # The prompt featured on each date, scheduled by daily.py (`manage.py rotate_daily_prompt`)
+    Date = models.DateField(primary_key=True, db_column='date')
+    PromptID = models.ForeignKey(Prompt, on_delete=models.CASCADE, db_column='prompt_id', related_name='daily_dates')
+
+    class Meta:
+        db_table = 'daily_prompts'
+
+
+class DailyResponse(models.Model):
+    # Posts answering a date's daily prompt, with their net votes. A snapshot
+    # kept in step with post and vote writes by daily.py, so the top responses
+    # are read from one index instead of sorting every post on the prompt.
+    ResponseID = models.BigAutoField(primary_key=True, db_column='responseid')
+    Date = models.ForeignKey(DailyPrompt, on_delete=models.CASCADE, db_column='date', related_name='responses', db_index=False)  # Covered by the indexes below
+    PostID = models.ForeignKey(Post, on_delete=models.CASCADE, db_column='post_id', related_name='daily_responses')
+    Score = models.IntegerField(default=0, db_column='score')  # UpvoteCount - DownvoteCount of the post
+
+    class Meta:
+        db_table = 'daily_responses'
+        constraints = [
+            models.UniqueConstraint(fields=['Date', 'PostID'], name='daily_responses_date_post_uniq'),
+        ]
+        indexes = [
+            # A date's responses, best first
+            models.Index(fields=['Date', '-Score', '-PostID'], name='daily_responses_top_idx'),
+        ]
+
+
+class Recommendation(models.Model):
+    # A user's "for you" lists, precomputed by recommendations.py (`manage.py refresh_recommendations`)
+    UserID = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, db_column='user_id', related_name='recommendation')
+    Vector = models.BinaryField(db_column='vector')  # The user's interests, as float32; decayed and added to by each refresh
+    PostIDs = ArrayField(models.IntegerField(), db_column='post_ids')  # Best first
+    PromptIDs = ArrayField(models.IntegerField(), db_column='prompt_ids')
+    Categories = ArrayField(models.TextField(), db_column='categories')  # Of the prompts the user engages with most
+    ComputedAt = models.DateTimeField(db_column='computed_at')  # Activity up to this time is in Vector
+
+    class Meta:
+        db_table = 'recommendations'
+        indexes = [
+            # Lists due for a rescore
+            models.Index(fields=['ComputedAt'], name='recommendations_computed_idx'),
+        ]
+
+
+class RecommendationRun(models.Model):
+    # One `manage.py refresh_recommendations`; the next run picks up activity after the last finished one
+    RunID = models.AutoField(primary_key=True, db_column='runid')
+    StartedAt = models.DateTimeField(db_column='started_at')
+    FinishedAt = models.DateTimeField(null=True, db_column='finished_at')
+    Full = models.BooleanField(default=False, db_column='full')  # Rebuilt from all activity rather than added to
+    Users = models.IntegerField(default=0, db_column='users')  # Lists written
+
+    class Meta:
+        db_table = 'recommendation_runs'
+
+
+class StanceRollup(models.Model):
+    # A post's, prompt's or category's activity in an hour or a day, kept in
+    # step with post, reply and vote writes by analytics.py. Rebuild them
+    # with `manage.py rebuild_analytics`.
+    RollupID = models.BigAutoField(primary_key=True, db_column='rollupid')
+    Scope = models.TextField(db_column='scope')  # 'post', 'prompt' or 'category'
+    Key = models.TextField(db_column='key')  # The PostID, PromptID or category
+    Period = models.TextField(db_column='period')  # 'hour' or 'day'
+    BucketStart = models.DateTimeField(db_column='bucket_start')  # In UTC
+    Posts = models.IntegerField(default=0, db_column='posts')  # Written on the prompt or category
+    Agree = models.IntegerField(default=0, db_column='agree')  # Replies, by isAgree
+    Disagree = models.IntegerField(default=0, db_column='disagree')
+    Upvotes = models.IntegerField(default=0, db_column='upvotes')  # Net change of the posts' vote counters
+    Downvotes = models.IntegerField(default=0, db_column='downvotes')
+
+    class Meta:
+        db_table = 'stance_rollups'
+        constraints = [
+            # Also serves a trend, read as a range of one key's buckets
+            models.UniqueConstraint(fields=['Scope', 'Key', 'Period', 'BucketStart'], name='stance_rollups_bucket_uniq'),
+        ]
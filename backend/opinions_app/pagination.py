@@ -0,0 +1,206 @@
+import base64
+import binascii
+import datetime
+import json
+import math
+from functools import reduce
+from operator import or_
+
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+class InvalidCursor(Exception):
+    pass
+
+
+def encode_cursor(values):
+    payload = [
+        {"dt": value.isoformat()} if isinstance(value, datetime.datetime) else value
+        for value in values
+    ]
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        payload = json.loads(raw)
+    except (binascii.Error, ValueError):
+        raise InvalidCursor(cursor)
+    if not isinstance(payload, list) or len(payload) != size:
+        raise InvalidCursor(cursor)
+
+    values = []
+    for value in payload:
+        if isinstance(value, dict):
+            value = parse_datetime(value.get("dt") or "") if isinstance(value.get("dt"), str) else None
+            if value is None:
+                raise InvalidCursor(cursor)
+        elif not is_cursor_scalar(value):
+            raise InvalidCursor(cursor)
+        values.append(value)
+    return values
+
+
+def is_cursor_scalar(value):
+    # Cursors only ever hold strings and finite numbers besides datetimes
+    if isinstance(value, bool) or not isinstance(value, (str, int, float)):
+        return False
+    return not isinstance(value, float) or math.isfinite(value)
+
+
+class KeysetPaginator:
+    """
+    Keyset (seek) pagination over a fixed, unique ordering.
+
+    Each page is fetched with a WHERE clause on the ordering values of the
+    previous page's last row instead of an OFFSET, so page N costs the same
+    as page 1. The ordering must end in a unique column (usually the primary
+    key) so that ties are broken deterministically.
+    """
+
+    def __init__(self, ordering, default_size=DEFAULT_PAGE_SIZE, max_size=MAX_PAGE_SIZE):
+        self.ordering = ordering
+        self.fields = [(name.lstrip('-'), name.startswith('-')) for name in ordering]
+        self.default_size = default_size
+        self.max_size = max_size
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params.get('limit', self.default_size))
+        except ValueError:
+            return self.default_size
+        return max(1, min(size, self.max_size))
+
+    def seek_filter(self, values):
+        # (a, b) after (va, vb) == a <= va AND (a < va OR (a = va AND b < vb))
+        # for descending orderings; the leading bound lets Postgres range-scan
+        # the matching index instead of filtering the whole table.
+        clauses = []
+        for i, (name, descending) in enumerate(self.fields):
+            clause = Q(**{f'{name}__{"lt" if descending else "gt"}': values[i]})
+            for j, (previous, _) in enumerate(self.fields[:i]):
+                clause &= Q(**{previous: values[j]})
+            clauses.append(clause)
+
+        lead, descending = self.fields[0]
+        return Q(**{f'{lead}__{"lte" if descending else "gte"}': values[0]}) & reduce(or_, clauses)
+
+    def clean_values(self, model, values):
+        """
+        Convert the ordering values of a cursor to the types of the model's
+        fields, raising InvalidCursor for any a field cannot take, so that a
+        crafted cursor is a 400 rather than an error of the query.
+        """
+        cleaned = []
+        for (name, _), value in zip(self.fields, values):
+            try:
+                field = model._meta.get_field(name)
+            except FieldDoesNotExist:
+                # An annotation, such as a search rank, orders by a number
+                if not is_cursor_scalar(value) or isinstance(value, str):
+                    raise InvalidCursor(values)
+                cleaned.append(value)
+                continue
+            try:
+                cleaned.append(field.to_python(value))
+            except (ValidationError, TypeError, ValueError, OverflowError):
+                raise InvalidCursor(values)
+        return cleaned
+
+    def seek(self, queryset, values=None):
+        """
+        Order the queryset and, given the ordering values of a previous row, keep only the rows after it.
+        Raises InvalidCursor when the values do not fit the ordering fields.
+        """
+        queryset = queryset.order_by(*self.ordering)
+        if values is not None:
+            queryset = queryset.filter(self.seek_filter(self.clean_values(queryset.model, values)))
+        return queryset
+
+    def page_queryset(self, queryset, request):
+        """
+        The rows of the request's page plus one, and the page size.
+        """
+        size = self.get_page_size(request)
+        cursor = request.query_params.get('cursor')
+
+        values = decode_cursor(cursor, len(self.fields)) if cursor else None
+        # Fetch one extra row to learn whether another page exists.
+        return self.seek(queryset, values)[:size + 1], size
+
+    def split_page(self, rows, size, cursor_values=None):
+        if len(rows) <= size:
+            return rows, None
+
+        page = rows[:size]
+        last = page[-1]
+        if cursor_values is None:
+            return page, encode_cursor([getattr(last, name) for name, _ in self.fields])
+        return page, encode_cursor(cursor_values(last))
+
+    def paginate(self, queryset, request):
+        """
+        Return (page, next_cursor) for the request's `cursor` and `limit` parameters.
+        next_cursor is None on the last page.
+        """
+        rows, size = self.page_queryset(queryset, request)
+        return self.split_page(list(rows), size)
+
+    async def apaginate(self, queryset, request):
+        """
+        Async version of paginate(), for async views.
+        """
+        rows, size = self.page_queryset(queryset, request)
+        return self.split_page([row async for row in rows], size)
+
+    def page_rows(self, queryset, request, serializer):
+        # The ordering columns follow the serializer's, for the next cursor
+        rows, size = self.page_queryset(queryset, request)
+        return serializer.values_list(rows, extra=[name for name, _ in self.fields]), size
+
+    def split_rows(self, rows, size, serializer):
+        page, next_cursor = self.split_page(rows, size, cursor_values=lambda row: row[-len(self.fields):])
+        return serializer.serialize(page), next_cursor
+
+    def paginate_rows(self, queryset, request, serializer):
+        """
+        Like paginate(), but the page is read with values_list() and returned
+        already serialized by `serializer`, a RowSerializer (see fast_serializers.py).
+        """
+        rows, size = self.page_rows(queryset, request, serializer)
+        return self.split_rows(list(rows), size, serializer)
+
+    async def apaginate_rows(self, queryset, request, serializer):
+        """
+        Async version of paginate_rows(), for async views.
+        """
+        rows, size = self.page_rows(queryset, request, serializer)
+        return self.split_rows([row async for row in rows], size, serializer)
+
+    def get_paginated_response(self, data, next_cursor, request, key=None):
+        """
+        Wrap a serialized page in a Response. Endpoints that already return an
+        object get a `next_cursor` key next to `key`; endpoints that return a bare
+        list keep that shape. Both always carry the cursor in the `X-Next-Cursor`
+        and `Link` headers.
+        """
+        if key:
+            response = Response({key: data, "next_cursor": next_cursor}, status=status.HTTP_200_OK)
+        else:
+            response = Response(data, status=status.HTTP_200_OK)
+
+        if next_cursor:
+            next_url = replace_query_param(request.build_absolute_uri(), 'cursor', next_cursor)
+            response['X-Next-Cursor'] = next_cursor
+            response['Link'] = f'<{next_url}>; rel="next"'
+        return response
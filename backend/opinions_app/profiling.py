@@ -0,0 +1,154 @@
+import cProfile
+import hmac
+import os
+import random
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timezone
+
+from django.conf import settings
+
+# Profiles of single live requests, written to PROFILE_DIR/<URL name>/ by
+# ProfilingMiddleware. A request is profiled when it carries
+# `X-Profile: <PROFILE_SECRET>` (any value for a staff user signed in to the
+# admin), or at random for a PROFILE_SAMPLE_RATE fraction of traffic.
+#
+# Two formats, chosen per request with `X-Profile-Format` (PROFILE_FORMAT by
+# default):
+#   collapsed  stacks sampled every PROFILE_INTERVAL seconds, one
+#              "frame;frame;frame count" line per stack, for flamegraph.pl or
+#              speedscope. Cheap enough to sample production traffic. The
+#              sampler needs the GIL, so while the request computes it gets a
+#              sample at most every sys.getswitchinterval() (5ms): merge the
+#              profiles of many requests (`manage.py show_profiles`).
+#   pstats     every call, with cProfile. Exact call counts, but the request
+#              runs several times slower. Read with `manage.py show_profiles`
+#              or pstats.
+#
+# Sync views only: an async view shares its thread with every other request
+# on the event loop.
+FORMATS = {'collapsed': '.collapsed', 'pstats': '.prof'}
+
+
+def requested_format(request):
+    """
+    The format to profile the request in, or None to leave it alone.
+    """
+    header = request.headers.get('X-Profile')
+    if header is not None and (is_staff(request) or (settings.PROFILE_SECRET and hmac.compare_digest(header, settings.PROFILE_SECRET))):
+        profile_format = request.headers.get('X-Profile-Format', settings.PROFILE_FORMAT)
+        return profile_format if profile_format in FORMATS else settings.PROFILE_FORMAT
+    if settings.PROFILE_SAMPLE_RATE and random.random() < settings.PROFILE_SAMPLE_RATE:
+        return settings.PROFILE_FORMAT
+    return None
+
+
+def is_staff(request):
+    user = getattr(request, 'user', None)
+    return bool(user is not None and user.is_staff)
+
+
+def frame_label(code):
+    filename = code.co_filename
+    # The shortest path relative to sys.path, e.g. rest_framework/views.py
+    for path in sys.path:
+        if path and code.co_filename.startswith(path + os.sep):
+            relative = code.co_filename[len(path) + 1:]
+            if len(relative) < len(filename):
+                filename = relative
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+class StackSampler:
+    """
+    Samples the stack of the thread that starts it from a background thread,
+    from the frame below `root` down, until stopped.
+    """
+
+    def __init__(self, interval):
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.sampler = threading.Thread(target=self.run, name='profile-sampler', daemon=True)
+
+    def start(self, root):
+        self.thread_id = threading.get_ident()
+        self.root = root
+        self.sampler.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.sampler.join()
+
+    def run(self):
+        labels = {}
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None and frame is not self.root:
+                code = frame.f_code
+                label = labels.get(code)
+                if label is None:
+                    label = labels[code] = frame_label(code)
+                stack.append(label)
+                frame = frame.f_back
+            # Not once the request is over and the thread is waiting in stop()
+            if stack and not self.stopped.is_set():
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def write(self, path):
+        with open(path, 'w') as output:
+            for stack, count in self.stacks.most_common():
+                output.write(f"{stack} {count}\n")
+
+
+class RequestProfiler:
+    def __init__(self, profile_format):
+        self.format = profile_format
+        if profile_format == 'pstats':
+            self.profiler = cProfile.Profile()
+        else:
+            self.profiler = StackSampler(settings.PROFILE_INTERVAL)
+
+    def start(self):
+        self.started = time.perf_counter()
+        if self.format == 'pstats':
+            self.profiler.enable()
+        else:
+            # Stacks start below the caller, the middleware
+            self.profiler.start(sys._getframe(1))
+
+    def stop(self):
+        if self.format == 'pstats':
+            self.profiler.disable()
+        else:
+            self.profiler.stop()
+        self.seconds = time.perf_counter() - self.started
+
+    def save(self, view_name, method):
+        """
+        Write the profile under PROFILE_DIR/<view_name>/ and return its name.
+        Only the newest PROFILE_KEEP profiles of each view are kept.
+        """
+        directory = os.path.join(settings.PROFILE_DIR, view_name)
+        os.makedirs(directory, exist_ok=True)
+        # Sorts oldest first
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S.%f')
+        name = f"{stamp}-{method}-{self.seconds * 1000:.0f}ms{FORMATS[self.format]}"
+        if self.format == 'pstats':
+            self.profiler.dump_stats(os.path.join(directory, name))
+        else:
+            self.profiler.write(os.path.join(directory, name))
+        prune(directory, settings.PROFILE_KEEP)
+        return f"{view_name}/{name}"
+
+
+def prune(directory, keep):
+    names = sorted(name for name in os.listdir(directory) if name.endswith(tuple(FORMATS.values())))
+    for name in names[:-keep] if keep else names:
+        try:
+            os.remove(os.path.join(directory, name))
+        except FileNotFoundError:
+            pass  # Pruned by another request
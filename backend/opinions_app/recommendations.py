@@ -0,0 +1,445 @@
+import re
+import time
+import zlib
+from contextlib import contextmanager
+from itertools import chain
+from datetime import datetime, timedelta, timezone as dt_timezone
+
+import numpy as np
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import RecommendationRun
+
+# "For you" lists of prompts and posts, precomputed per user.
+#
+# Prompts and posts are TF-IDF vectors of their text, hashed into FEATURES
+# buckets and reduced to DIMENSIONS by a fixed random projection: a prompt's
+# vector includes its category, a post's includes its prompt. A user's
+# interests are the sum of the vectors of the posts they wrote, replied to,
+# voted on or got in their home timeline, weighted by INTERACTION_WEIGHTS and
+# halved every RECOMMEND_HALF_LIFE_DAYS. Lists rank prompts and candidate
+# posts by cosine similarity to those interests (posts also by trending rank),
+# leaving out what the user already posted on, replied to, voted on or has in
+# their timeline.
+#
+# Interests are stored with the lists, so a refresh only reads the activity
+# since the last one: it decays each stored vector by the time since it was
+# computed and adds the new activity, which gives the same vector as summing
+# every interaction again. Only users with new activity, and those whose lists
+# are older than RECOMMEND_MAX_AGE_DAYS, are rescored.
+#
+# Changing DIMENSIONS, FEATURES, PROJECTION_SEED or the weights makes stored
+# interests incomparable with new vectors: run `refresh_recommendations --full`.
+DIMENSIONS = 64
+FEATURES = 1 << 16
+PROJECTION_SEED = 1735689600
+
+TOKEN = re.compile(r'\w{2,}')
+
+INTERACTION_WEIGHTS = {
+    'post': 3.0,
+    'disagree': 2.0,  # A reply arguing with the post
+    'agree': 1.5,
+    'upvote': 1.0,
+    'downvote': 0.5,  # Still interested in the topic
+    'timeline': 0.25,  # A post by someone the user follows
+}
+CATEGORY_WEIGHT = 1.0  # Of a prompt's category, next to its text
+PROMPT_WEIGHT = 0.5  # Of a post's prompt, next to its text
+POPULARITY_WEIGHT = 0.1  # Of a candidate's trending rank, next to its similarity
+
+PROJECT_CHUNK = 4096  # Texts projected at once
+INTERACTION_CHUNK = 50000  # Interactions read at once
+VECTOR_CHUNK = 10000  # Stored interests read at once
+
+PROMPTS = """
+SELECT promptid, prompt_text, category FROM prompts ORDER BY promptid;
+"""
+
+CANDIDATE_POSTS = """
+SELECT postid, posttext, prompt_id
+FROM posts
+WHERE created_at >= %(since)s
+ORDER BY trending_score DESC, postid DESC
+LIMIT %(limit)s;
+"""
+
+POST_TEXTS = """
+SELECT postid, posttext, prompt_id FROM posts WHERE postid = ANY(%s) ORDER BY postid;
+"""
+
+ALL_USERS = """
+SELECT userid FROM users ORDER BY userid;
+"""
+
+# Users with activity in the window, and users whose lists are due for a rescore
+REFRESH_USERS = """
+SELECT user_id FROM posts WHERE created_at > %(since)s AND created_at <= %(until)s
+UNION
+SELECT user_id FROM replies WHERE created_at > %(since)s AND created_at <= %(until)s
+UNION
+SELECT user_id FROM votes WHERE created_at > %(since)s AND created_at <= %(until)s
+UNION
+SELECT owner_id FROM timelines WHERE created_at > %(since)s AND created_at <= %(until)s
+UNION
+SELECT user_id FROM recommendations WHERE computed_at < %(stale)s
+ORDER BY 1;
+"""
+
+STORED_INTERESTS = """
+SELECT user_id, vector, EXTRACT(EPOCH FROM %(until)s - computed_at)::float8
+FROM recommendations
+WHERE user_id = ANY(%(users)s);
+"""
+
+# (post, user, weight) of the activity in the window, each weight decayed by
+# its age. Activity a user's stored interests already include is left out,
+# and the rows come by post so that each post is embedded about once.
+INTERACTIONS = """
+SELECT interactions.post_id, interactions.user_id,
+       interactions.weight * POWER(0.5, EXTRACT(EPOCH FROM %(until)s - interactions.created_at)::float8 / %(half_life)s)
+FROM (
+    SELECT postid AS post_id, user_id, %(post)s::float8 AS weight, created_at
+    FROM posts WHERE created_at > %(since)s AND created_at <= %(until)s
+    UNION ALL
+    SELECT post_id, user_id, CASE WHEN isagree THEN %(agree)s::float8 ELSE %(disagree)s::float8 END, created_at
+    FROM replies WHERE created_at > %(since)s AND created_at <= %(until)s
+    UNION ALL
+    SELECT post_id, user_id, CASE WHEN vote_type = 'upvote' THEN %(upvote)s::float8 ELSE %(downvote)s::float8 END, created_at
+    FROM votes WHERE created_at > %(since)s AND created_at <= %(until)s
+    UNION ALL
+    SELECT post_id, owner_id, %(timeline)s::float8, created_at
+    FROM timelines WHERE created_at > %(since)s AND created_at <= %(until)s
+) AS interactions
+LEFT JOIN recommendations ON recommendations.user_id = interactions.user_id AND NOT %(full)s
+WHERE recommendations.computed_at IS NULL OR interactions.created_at > recommendations.computed_at
+ORDER BY interactions.post_id;
+"""
+
+# What the users already saw of the candidates, which are all newer than
+# `since`: no one votes on, replies to or gets a post before it exists
+SEEN_POSTS = """
+SELECT user_id, post_id FROM votes WHERE user_id = ANY(%(users)s) AND created_at >= %(since)s
+UNION ALL
+SELECT user_id, post_id FROM replies WHERE user_id = ANY(%(users)s) AND created_at >= %(since)s
+UNION ALL
+SELECT user_id, postid FROM posts WHERE user_id = ANY(%(users)s) AND created_at >= %(since)s
+UNION ALL
+SELECT owner_id, post_id FROM timelines WHERE owner_id = ANY(%(users)s) AND created_at >= %(since)s;
+"""
+
+ANSWERED_PROMPTS = """
+SELECT DISTINCT user_id, prompt_id FROM posts WHERE user_id = ANY(%(users)s) AND prompt_id IS NOT NULL;
+"""
+
+SAVE_RECOMMENDATIONS = """
+INSERT INTO recommendations (user_id, vector, post_ids, prompt_ids, categories, computed_at)
+VALUES {values}
+ON CONFLICT (user_id) DO UPDATE
+SET vector = EXCLUDED.vector,
+    post_ids = EXCLUDED.post_ids,
+    prompt_ids = EXCLUDED.prompt_ids,
+    categories = EXCLUDED.categories,
+    computed_at = EXCLUDED.computed_at;
+"""
+
+
+def normalize(vectors):
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return np.divide(vectors, norms, out=np.zeros_like(vectors), where=norms > 0)
+
+
+def positions(sorted_ids, ids):
+    """
+    The index of each of `ids` in the sorted array `sorted_ids`, and whether
+    it is there at all.
+    """
+    index = np.searchsorted(sorted_ids, ids)
+    found = index < len(sorted_ids)
+    found[found] = sorted_ids[index[found]] == ids[found]
+    return index, found
+
+
+def array_literal(ids):
+    # Adapting a list sends ARRAY[...] with every element quoted on its own, which is several times slower
+    return '{' + ','.join(map(str, ids)) + '}'
+
+
+def top_n(scores, n):
+    """
+    The columns of the `n` highest scores of each row, best first, and those
+    scores.
+    """
+    n = min(n, scores.shape[1])
+    if n == 0:
+        return np.zeros((len(scores), 0), np.int64), np.zeros((len(scores), 0), scores.dtype)
+    best = np.argpartition(scores, -n, axis=1)[:, -n:]
+    best_scores = np.take_along_axis(scores, best, axis=1)
+    order = np.argsort(-best_scores, axis=1, kind='stable')
+    return np.take_along_axis(best, order, axis=1), np.take_along_axis(best_scores, order, axis=1)
+
+
+class TextVectors:
+    """
+    Unit TF-IDF vectors of texts in DIMENSIONS dimensions. The projection is
+    the same in every run, so vectors of different runs can be added up; the
+    IDF is that of the texts passed to fit().
+    """
+
+    def __init__(self):
+        rng = np.random.default_rng(PROJECTION_SEED)
+        self.projection = rng.standard_normal((FEATURES, DIMENSIONS), dtype=np.float32) / np.float32(np.sqrt(DIMENSIONS))
+        self.idf = np.ones(FEATURES, np.float32)
+
+    def token_vector(self, token):
+        return self.projection[zlib.crc32(token.encode()) % FEATURES]
+
+    def count(self, texts):
+        """
+        (text index, bucket, count) arrays of the buckets the texts' tokens
+        hash to, ordered by text.
+        """
+        # map() keeps the per-token work in C
+        tokens = list(map(TOKEN.findall, map(str.lower, texts)))
+        lengths = np.fromiter(map(len, tokens), np.int64, len(tokens))
+        hashes = np.fromiter(map(zlib.crc32, map(str.encode, chain.from_iterable(tokens))), np.int64, int(lengths.sum()))
+        keys, counts = np.unique(np.repeat(np.arange(len(texts)), lengths) * FEATURES + hashes % FEATURES, return_counts=True)
+        indexes, buckets = np.divmod(keys, FEATURES)
+        return indexes, buckets, counts
+
+    def fit(self, texts):
+        counted = self.count(texts)
+        document_frequency = np.bincount(counted[1], minlength=FEATURES)
+        self.idf = (np.log((1 + len(texts)) / (1 + document_frequency)) + 1).astype(np.float32)
+        return self.project(len(texts), *counted)
+
+    def transform(self, texts):
+        return self.project(len(texts), *self.count(texts))
+
+    def project(self, size, indexes, buckets, counts):
+        vectors = np.zeros((size, DIMENSIONS), np.float32)
+        weights = (1 + np.log(counts.astype(np.float32))) * self.idf[buckets]
+        bounds = np.searchsorted(indexes, np.arange(0, size + PROJECT_CHUNK, PROJECT_CHUNK))
+        for start, end in zip(bounds[:-1], bounds[1:]):
+            if start == end:
+                continue
+            # Sum the weighted projections of each text's buckets
+            present, offsets = np.unique(indexes[start:end], return_index=True)
+            projected = self.projection[buckets[start:end]]
+            projected *= weights[start:end, None]
+            vectors[present] = np.add.reduceat(projected, offsets)
+        return normalize(vectors)
+
+
+class Refresh:
+    """
+    One computation of the lists of the users with activity between `since`
+    and `until` (every user when `since` is None) and of those due for a
+    rescore.
+    """
+
+    def __init__(self, since, until):
+        self.since = since
+        self.until = until
+        self.half_life = settings.RECOMMEND_HALF_LIFE_DAYS * 86400
+        self.text = TextVectors()
+        self.interactions = 0
+        self.timings = {}
+
+    @contextmanager
+    def step(self, name):
+        started = time.perf_counter()
+        yield
+        self.timings[name] = time.perf_counter() - started
+
+    def run(self):
+        """
+        Returns the number of lists written.
+        """
+        with self.step('items'):
+            self.load_items()
+        with self.step('users'):
+            self.load_users()
+        with self.step('interactions'):
+            self.add_interactions()
+        with self.step('lists'):
+            return self.save_lists()
+
+    def load_items(self):
+        candidates_since = self.until - timedelta(days=settings.RECOMMEND_POST_DAYS)
+        with connection.cursor() as cursor:
+            cursor.execute(PROMPTS)
+            prompts = cursor.fetchall()
+            cursor.execute(CANDIDATE_POSTS, {
+                "since": candidates_since,
+                "limit": settings.RECOMMEND_CANDIDATES,
+            })
+            posts = cursor.fetchall()
+        self.candidates_since = candidates_since
+        vectors = self.text.fit([row[1] for row in prompts] + [row[1] for row in posts])
+
+        self.categories = sorted({row[2] for row in prompts})
+        category_index = {category: index for index, category in enumerate(self.categories)}
+        self.category_vectors = normalize(np.array(
+            [self.text.token_vector(f'category:{category}') for category in self.categories], np.float32,
+        ).reshape(-1, DIMENSIONS))
+
+        self.prompt_ids = np.array([row[0] for row in prompts], np.int64)
+        self.prompt_vectors = vectors[:len(prompts)]
+        if len(prompts):
+            self.prompt_vectors = normalize(
+                self.prompt_vectors + CATEGORY_WEIGHT * self.category_vectors[[category_index[row[2]] for row in prompts]]
+            )
+
+        # Kept in ID order for lookups; popularity is 1 for the best-trending candidate down to 0
+        post_ids = np.array([row[0] for row in posts], np.int64)
+        popularity = 1 - np.arange(len(posts), dtype=np.float32) / max(len(posts), 1)
+        post_vectors = self.add_prompts(vectors[len(prompts):], [row[2] for row in posts])
+        order = np.argsort(post_ids)
+        self.post_ids, self.post_vectors, self.popularity = post_ids[order], post_vectors[order], popularity[order]
+
+    def add_prompts(self, vectors, prompt_ids):
+        prompt_ids = np.array([-1 if prompt_id is None else prompt_id for prompt_id in prompt_ids], np.int64)
+        index, found = positions(self.prompt_ids, prompt_ids)
+        vectors = vectors.copy()
+        vectors[found] += PROMPT_WEIGHT * self.prompt_vectors[index[found]]
+        return normalize(vectors)
+
+    def post_vectors_of(self, post_ids):
+        """
+        Vectors of the posts `post_ids` (sorted): the candidates' as computed,
+        others from their text. Deleted posts get zeros.
+        """
+        index, found = positions(self.post_ids, post_ids)
+        vectors = np.zeros((len(post_ids), DIMENSIONS), np.float32)
+        vectors[found] = self.post_vectors[index[found]]
+        missing = post_ids[~found]
+        if len(missing):
+            with connection.cursor() as cursor:
+                cursor.execute(POST_TEXTS, [missing.tolist()])
+                rows = cursor.fetchall()
+            fetched = np.array([row[0] for row in rows], np.int64)
+            fetched_vectors = self.add_prompts(self.text.transform([row[1] for row in rows]), [row[2] for row in rows])
+            index, exists = positions(fetched, missing)
+            missing_vectors = np.zeros((len(missing), DIMENSIONS), np.float32)
+            missing_vectors[exists] = fetched_vectors[index[exists]]
+            vectors[~found] = missing_vectors
+        return vectors
+
+    def load_users(self):
+        with connection.cursor() as cursor:
+            if self.since is None:
+                cursor.execute(ALL_USERS)
+            else:
+                cursor.execute(REFRESH_USERS, {
+                    "since": self.since,
+                    "until": self.until,
+                    "stale": self.until - timedelta(days=settings.RECOMMEND_MAX_AGE_DAYS),
+                })
+            self.user_ids = np.array([row[0] for row in cursor.fetchall()], np.int64)
+            self.interests = np.zeros((len(self.user_ids), DIMENSIONS), np.float32)
+            if self.since is None:
+                return
+
+            # Stored interests, decayed to `until`
+            for start in range(0, len(self.user_ids), VECTOR_CHUNK):
+                cursor.execute(STORED_INTERESTS, {"users": self.user_ids[start:start + VECTOR_CHUNK].tolist(), "until": self.until})
+                rows = cursor.fetchall()
+                if not rows:
+                    continue
+                index, _ = positions(self.user_ids, np.array([row[0] for row in rows], np.int64))
+                decay = np.array([0.5 ** (max(row[2], 0) / self.half_life) for row in rows], np.float32)
+                stored = np.frombuffer(b''.join(bytes(row[1]) for row in rows), np.float32).reshape(len(rows), DIMENSIONS)
+                self.interests[index] = stored * decay[:, None]
+
+    def add_interactions(self):
+        weights = {name: float(weight) for name, weight in INTERACTION_WEIGHTS.items()}
+        params = {
+            **weights,
+            "since": self.since or datetime(1970, 1, 1, tzinfo=dt_timezone.utc),
+            "until": self.until,
+            "half_life": float(self.half_life),
+            "full": self.since is None,
+        }
+        # A server-side cursor, so that a full rebuild streams every interaction instead of loading them
+        with transaction.atomic(), connection.chunked_cursor() as cursor:
+            cursor.execute(INTERACTIONS, params)
+            while rows := cursor.fetchmany(INTERACTION_CHUNK):
+                self.add_chunk(np.array(rows, np.float64))
+
+    def add_chunk(self, rows):
+        post_ids = rows[:, 0].astype(np.int64)
+        users, found = positions(self.user_ids, rows[:, 1].astype(np.int64))
+        weights = rows[:, 2].astype(np.float32)
+        unique_posts, post_index = np.unique(post_ids, return_inverse=True)
+        vectors = self.post_vectors_of(unique_posts)
+        np.add.at(self.interests, users[found], weights[found, None] * vectors[post_index[found]])
+        self.interactions += len(rows)
+
+    def save_lists(self):
+        written = 0
+        active = np.flatnonzero(np.any(self.interests != 0, axis=1))
+        for start in range(0, len(active), settings.RECOMMEND_BATCH_SIZE):
+            rows = active[start:start + settings.RECOMMEND_BATCH_SIZE]
+            user_ids = self.user_ids[rows]
+            interests = normalize(self.interests[rows])
+            with connection.cursor() as cursor:
+                cursor.execute(SEEN_POSTS, {"users": user_ids.tolist(), "since": self.candidates_since})
+                post_lists = self.rank(
+                    interests @ self.post_vectors.T + POPULARITY_WEIGHT * self.popularity,
+                    user_ids, self.post_ids, cursor.fetchall(), settings.RECOMMEND_POSTS,
+                )
+                cursor.execute(ANSWERED_PROMPTS, {"users": user_ids.tolist()})
+                prompt_lists = self.rank(
+                    interests @ self.prompt_vectors.T,
+                    user_ids, self.prompt_ids, cursor.fetchall(), settings.RECOMMEND_PROMPTS,
+                )
+                best, scores = top_n(interests @ self.category_vectors.T, settings.RECOMMEND_CATEGORIES)
+                category_lists = [[self.categories[column] for column in columns[row_scores > 0]] for columns, row_scores in zip(best, scores)]
+
+                params = []
+                for index, row in enumerate(rows):
+                    params.extend([
+                        int(user_ids[index]), self.interests[row].tobytes(),
+                        array_literal(post_lists[index]), array_literal(prompt_lists[index]), category_lists[index], self.until,
+                    ])
+                values = ', '.join(['(%s, %s, %s::integer[], %s::integer[], %s, %s)'] * len(rows))
+                cursor.execute(SAVE_RECOMMENDATIONS.format(values=values), params)
+            written += len(rows)
+        return written
+
+    def rank(self, scores, user_ids, item_ids, excluded, n):
+        """
+        The IDs of the `n` best-scoring items of each user, leaving out the
+        (user, item) pairs of `excluded`.
+        """
+        if excluded:
+            pairs = np.array(excluded, np.int64)
+            users, user_found = positions(user_ids, pairs[:, 0])
+            items, item_found = positions(item_ids, pairs[:, 1])
+            both = user_found & item_found
+            scores[users[both], items[both]] = -np.inf
+        best, best_scores = top_n(scores, n)
+        return [item_ids[columns[row_scores > -np.inf]].tolist() for columns, row_scores in zip(best, best_scores)]
+
+
+def refresh_recommendations(full=False):
+    """
+    Bring every user's lists up to date: add the activity since the last
+    finished run to their interests (all activity with `full`, or when no run
+    finished yet) and rescore them. Returns the finished RecommendationRun,
+    with the seconds each step took in `timings` and the number of
+    interactions read in `interactions`.
+    """
+    last = RecommendationRun.objects.filter(FinishedAt__isnull=False).order_by('-StartedAt').first()
+    full = full or last is None
+    run = RecommendationRun.objects.create(StartedAt=timezone.now(), Full=full)
+    refresh = Refresh(None if full else last.StartedAt, run.StartedAt)
+    run.Users = refresh.run()
+    run.FinishedAt = timezone.now()
+    run.save(update_fields=['Users', 'FinishedAt'])
+    run.timings = refresh.timings
+    run.interactions = refresh.interactions
+    return run
@@ -0,0 +1,59 @@
+from rest_framework.renderers import JSONRenderer
+
+# Columnar JSON: every list of objects in a response is sent as its keys once
+# and one array of values per object, e.g.
+#
+#   [{"PostID": 1, "UpvoteCount": 3}, {"PostID": 2, "UpvoteCount": 0}]
+#   -> {"columns": ["PostID", "UpvoteCount"], "rows": [[1, 3], [2, 0]]}
+#
+# Other values, including objects nested in a row (such as an expanded
+# Author), keep their usual shape. Clients ask for it with
+# `Accept: application/vnd.flare.columnar+json` or `?format=columnar`.
+COLUMNAR_MEDIA_TYPE = 'application/vnd.flare.columnar+json'
+COLUMNAR_FORMAT = 'columnar'
+
+
+def columnar(data):
+    """
+    `data` with each non-empty list of objects replaced by {"columns", "rows"}.
+    A key missing from some objects is null in their rows.
+    """
+    if isinstance(data, dict):
+        return {key: columnar(value) for key, value in data.items()}
+    if not isinstance(data, list):
+        return data
+    if not data or not all(isinstance(item, dict) for item in data):
+        return [columnar(item) for item in data]
+
+    columns = list(data[0])
+    seen = set(columns)
+    for item in data[1:]:
+        if item.keys() != seen:
+            for key in item:
+                if key not in seen:
+                    seen.add(key)
+                    columns.append(key)
+
+    rows = [[item.get(key) for key in columns] for item in data]
+    # Only the columns holding objects or lists need another pass
+    for index in range(len(columns)):
+        if any(isinstance(row[index], (dict, list)) for row in rows):
+            for row in rows:
+                row[index] = columnar(row[index])
+    return {"columns": columns, "rows": rows}
+
+
+def wants_columnar(request):
+    """
+    Whether a plain Django request asks for columnar JSON, for views that do
+    not go through DRF's content negotiation.
+    """
+    return request.GET.get('format') == COLUMNAR_FORMAT or COLUMNAR_MEDIA_TYPE in request.headers.get('Accept', '')
+
+
+class ColumnarJSONRenderer(JSONRenderer):
+    media_type = COLUMNAR_MEDIA_TYPE
+    format = COLUMNAR_FORMAT
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return super().render(columnar(data), accepted_media_type, renderer_context)
@@ -0,0 +1,153 @@
+import hashlib
+import json
+import threading
+import uuid
+from collections import Counter
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import parse_etags
+from rest_framework import status
+from rest_framework.response import Response
+from rest_framework.utils.encoders import JSONEncoder
+
+# Response headers that are part of a cached entry (set by the paginators)
+CACHED_HEADERS = ('X-Next-Cursor', 'Link')
+
+stats_lock = threading.Lock()
+stats = Counter()
+
+
+def record(view_name, outcome):
+    with stats_lock:
+        stats[(view_name, outcome)] += 1
+
+
+def get_stats():
+    """
+    Hit and miss counts of this process, per cached view.
+    """
+    with stats_lock:
+        snapshot = dict(stats)
+    views = sorted({view_name for view_name, _ in snapshot})
+    result = {}
+    for view_name in views:
+        hits = snapshot.get((view_name, 'hit'), 0)
+        misses = snapshot.get((view_name, 'miss'), 0)
+        result[view_name] = {
+            "hits": hits,
+            "misses": misses,
+            "not_modified": snapshot.get((view_name, 'not_modified'), 0),
+            "hit_ratio": round(hits / (hits + misses), 4) if hits + misses else None,
+        }
+    return result
+
+
+def tag_key(tag):
+    return f'resp:tag:{tag}'
+
+
+def invalidate(*tags):
+    """
+    Invalidate every cached response that depends on any of the tags, e.g. invalidate('post:5').
+    Each tag has a random version token; cached entries remember the tokens they were built with.
+    """
+    cache.set_many({tag_key(tag): uuid.uuid4().hex for tag in tags}, timeout=None)
+
+
+def invalidate_on_commit(*tags):
+    """
+    Invalidate the tags once the current transaction commits (immediately in
+    autocommit mode), so a concurrent request cannot re-cache the old rows.
+    """
+    transaction.on_commit(lambda: invalidate(*tags))
+
+
+def get_tag_versions(tags):
+    keys = {tag: tag_key(tag) for tag in tags}
+    found = cache.get_many(list(keys.values()))
+    versions = {}
+    for tag, key in keys.items():
+        if key not in found:
+            # add() keeps a version another process may have set in the meantime
+            cache.add(key, uuid.uuid4().hex, timeout=None)
+            found[key] = cache.get(key)
+        versions[tag] = found[key]
+    return versions
+
+
+def is_fresh(entry):
+    current = cache.get_many([tag_key(tag) for tag in entry['tags']])
+    return all(current.get(tag_key(tag)) == version for tag, version in entry['tags'].items())
+
+
+def make_etag(data):
+    body = json.dumps(data, cls=JSONEncoder, sort_keys=True, separators=(',', ':'))
+    return '"%s"' % hashlib.sha1(body.encode()).hexdigest()
+
+
+def build_response(request, view_name, entry, outcome):
+    etag = entry['etag']
+    renderer = getattr(request, 'accepted_renderer', None)
+    if renderer is not None and renderer.format != 'json':
+        # Each format of the data is a different representation
+        etag = '"%s-%s"' % (etag.strip('"'), renderer.format)
+    # Compared weakly: GZipMiddleware turns the ETags it compresses into W/"..."
+    if etag in [tag.removeprefix('W/') for tag in parse_etags(request.headers.get('If-None-Match', ''))]:
+        record(view_name, 'not_modified')
+        response = Response(status=status.HTTP_304_NOT_MODIFIED)
+    else:
+        response = Response(entry['data'], status=status.HTTP_200_OK)
+        for header, value in entry['headers'].items():
+            response[header] = value
+    record(view_name, outcome)
+    response['ETag'] = etag
+    response['Cache-Control'] = 'no-cache'  # Clients may store it but must revalidate with If-None-Match
+    return response
+
+
+def cached_response(ttl, tags):
+    """
+    Cache the 200 responses of an APIView `get` handler for `ttl` seconds.
+
+    `tags(kwargs)` returns the tags the response depends on, from the URL
+    kwargs alone, e.g. ['post:5', 'thread:5']. Their versions are taken before
+    the handler runs, so a write that lands while the response is built leaves
+    the entry stale. Writes invalidate tags (see signals.py), which makes every
+    entry built with the old tag versions a miss; rows a response embeds
+    through a relation bump a tag of the URL's object, as thread:<post_id>.
+    Responses carry an ETag, and a matching If-None-Match gets an empty 304.
+    """
+    def decorator(handler):
+        view_name = handler.__qualname__.split('.')[0]
+
+        @wraps(handler)
+        def wrapper(self, request, *args, **kwargs):
+            if not settings.RESPONSE_CACHE_ENABLED:
+                return handler(self, request, *args, **kwargs)
+
+            key = 'resp:%s:%s' % (view_name, hashlib.md5(request.build_absolute_uri().encode()).hexdigest())
+            entry = cache.get(key)
+            if entry is not None and is_fresh(entry):
+                return build_response(request, view_name, entry, 'hit')
+
+            # Take the tag versions before building the response, so a write
+            # that lands while it is built leaves the entry already stale
+            versions = get_tag_versions(tags(kwargs))
+            response = handler(self, request, *args, **kwargs)
+            if response.status_code != status.HTTP_200_OK:
+                return response
+
+            data = response.data
+            entry = {
+                'data': data,
+                'etag': make_etag(data),
+                'headers': {header: response[header] for header in CACHED_HEADERS if header in response},
+                'tags': versions,
+            }
+            cache.set(key, entry, timeout=ttl)
+            return build_response(request, view_name, entry, 'miss')
+        return wrapper
+    return decorator
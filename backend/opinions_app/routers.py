@@ -0,0 +1,65 @@
+import contextvars
+import inspect
+from functools import wraps
+
+from django.conf import settings
+
+# Read-only list views opt in to the read replica with @replica_reads. Their ORM
+# reads then go to the 'replica' database when one is configured (see
+# DB_REPLICA_HOST in settings.py); everything else, including all writes and
+# raw SQL on `connection`, stays on 'default'.
+#
+# A replica lags the primary by a little, so a list read from it may miss a
+# row written a moment ago. Single objects, which a client often reads right
+# after creating them, and views behind the response cache are left on the
+# primary: a stale read there would be cached until its TTL, not until the
+# next invalidation.
+REPLICA = 'replica'
+
+reading_from_replica = contextvars.ContextVar('reading_from_replica', default=False)
+
+
+def replica_reads(view_method):
+    """
+    Send the ORM reads of a view method (sync or async) to the read replica.
+    """
+    if inspect.iscoroutinefunction(view_method):
+        @wraps(view_method)
+        async def async_wrapper(*args, **kwargs):
+            token = reading_from_replica.set(True)
+            try:
+                return await view_method(*args, **kwargs)
+            finally:
+                reading_from_replica.reset(token)
+        return async_wrapper
+
+    @wraps(view_method)
+    def wrapper(*args, **kwargs):
+        token = reading_from_replica.set(True)
+        try:
+            return view_method(*args, **kwargs)
+        finally:
+            reading_from_replica.reset(token)
+    return wrapper
+
+
+class ReplicaRouter:
+    """
+    Routes the reads of @replica_reads views to the replica. The replica holds
+    the same rows as the primary, so relations between objects loaded from
+    either are allowed, and migrations only run on the primary.
+    """
+
+    def db_for_read(self, model, **hints):
+        if reading_from_replica.get() and REPLICA in settings.DATABASES:
+            return REPLICA
+        return None
+
+    def db_for_write(self, model, **hints):
+        return 'default'
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db != REPLICA
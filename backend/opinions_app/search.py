@@ -0,0 +1,73 @@
+import json
+
+from django.conf import settings
+from django.db.models import BooleanField, FloatField
+from django.db.models.expressions import RawSQL
+
+from .models import Post, Prompt, Reply
+
+# The searchable tables each have a generated, GIN-indexed `search_vector`
+# column (migration 0012), built with this text search configuration
+SEARCH_CONFIG = 'english'
+
+# websearch_to_tsquery takes what people type into a search box: words,
+# "quoted phrases", OR and -excluded words. It never raises a syntax error.
+TSQUERY = f"websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+
+SEARCH_MODELS = {
+    'posts': Post,
+    'replies': Reply,
+    'prompts': Prompt,
+}
+
+# Newest first; replies go by ID, which the primary key index can walk backwards
+RECENT_ORDERING = {
+    Post: ('-CreatedAt', '-PostID'),
+    Reply: ('-ReplyID',),
+    Prompt: ('-PromptID',),
+}
+
+# How each model reaches its prompt's category
+CATEGORY_LOOKUPS = {
+    Post: 'PromptID__Category',
+    Reply: 'PostID__PromptID__Category',
+    Prompt: 'Category',
+}
+
+
+def search_queryset(model, query, category=None, ranked=False):
+    """
+    The rows of `model` matching the search `query`, annotated with their
+    relevance as `Rank`, optionally limited to one prompt category.
+
+    Ranking has to score every match, which takes seconds for a word found
+    in millions of rows. So when the results are `ranked` and the planner
+    expects more than SEARCH_RANK_EXACT matches, only the SEARCH_RANK_WINDOW
+    most recent matches are kept and ranked. Otherwise the ranking is exact.
+    """
+    table = model._meta.db_table
+    matches = RawSQL(f"{table}.search_vector @@ {TSQUERY}", [query], output_field=BooleanField())
+    # ts_rank_cd favours rows where the query words appear close together. It
+    # returns a real; as a double the rank survives the round trip through a
+    # page cursor exactly, so the keyset comparison finds the same rows.
+    rank = RawSQL(f"ts_rank_cd({table}.search_vector, {TSQUERY})::double precision", [query], output_field=FloatField())
+
+    queryset = model.objects.filter(matches)
+    if category:
+        queryset = queryset.filter(**{CATEGORY_LOOKUPS[model]: category})
+    if ranked and estimated_count(queryset) > settings.SEARCH_RANK_EXACT:
+        # Fetched first rather than as a subquery, where the table names in the
+        # raw SQL above would no longer refer to the subquery's rows
+        recent = queryset.order_by(*RECENT_ORDERING[model]).values_list('pk', flat=True)
+        queryset = model.objects.filter(pk__in=list(recent[:settings.SEARCH_RANK_WINDOW]))
+    return queryset.annotate(Rank=rank)
+
+
+def estimated_count(queryset):
+    """
+    The planner's estimate of the rows in `queryset`, which costs no more
+    than planning the query. A few selective matches are quicker to find
+    through the GIN index and rank than the most recent matches are to walk.
+    """
+    plan = json.loads(queryset.explain(format='json'))
+    return plan[0]['Plan']['Plan Rows']
@@ -1,24 +1,134 @@
+from django.conf import settings
 from rest_framework import serializers
-from .models import User, Post, Prompt, Reply
+from .avatars import avatar_url, avatar_urls
+from .models import User, Post, Prompt, Reply, UserStats, Vote
+
+
+class AvatarField(serializers.CharField):
+    """
+    User.ProfilePicture, shown as the URL of its `size` thumbnail (see avatars.py).
+    """
+
+    def __init__(self, size, **kwargs):
+        self.size = size
+        super().__init__(max_length=200, allow_null=True, required=False, **kwargs)
+
+    def to_representation(self, value):
+        return avatar_url(value, self.size)
+
+
+class AvatarSizesField(serializers.ReadOnlyField):
+    """
+    User.ProfilePicture as the URL of every thumbnail size, keyed by size, or
+    null without an uploaded picture.
+    """
+
+    def __init__(self, **kwargs):
+        super().__init__(source='ProfilePicture', **kwargs)
+
+    def to_representation(self, value):
+        return avatar_urls(value)
+
+
+class ExpandableFieldsMixin:
+    """
+    Adds optional related fields to a serializer, chosen by the names in
+    `context['expand']` (see expand.py). `expandable_fields` maps each expand
+    name to the output field name and a factory for the field.
+    """
+    expandable_fields = {}
+
+    def get_fields(self):
+        fields = super().get_fields()
+        expand = self.context.get('expand', ())
+        for name, (field_name, make_field) in self.expandable_fields.items():
+            if name in expand:
+                fields[field_name] = make_field()
+        return fields
+
 
 class UserSerializer(serializers.ModelSerializer):
+    ProfilePicture = AvatarField(size=settings.AVATAR_SIZES[1])
+    ProfilePictureSizes = AvatarSizesField()
+
     class Meta:
         model = User
         fields = '__all__'
+        read_only_fields = ['FollowerCount', 'FollowingCount', 'ReplyPoints']
 
 
-class PostSerializer(serializers.ModelSerializer):
+class UserStatsSerializer(serializers.ModelSerializer):
     class Meta:
-        model = Post
+        model = UserStats
         fields = '__all__'
 
 
+class AuthorSerializer(serializers.ModelSerializer):
+    """
+    The public part of a user, embedded in posts and replies, with the
+    smallest thumbnail of their picture.
+    """
+    ProfilePicture = AvatarField(size=settings.AVATAR_SIZES[0])
+
+    class Meta:
+        model = User
+        fields = ['UserID', 'Username', 'ProfilePicture']
+
+
 class PromptSerializer(serializers.ModelSerializer):
     class Meta:
         model = Prompt
         fields = '__all__'
-        
-class ReplySerializer(serializers.ModelSerializer):
+
+
+class PostSerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'prompt': ('Prompt', lambda: PromptSerializer(source='PromptID', read_only=True)),
+        'author': ('Author', lambda: AuthorSerializer(source='UserID', read_only=True)),
+        'reply_count': ('ReplyCount', lambda: serializers.IntegerField(read_only=True)),
+    }
+
+    class Meta:
+        model = Post
+        exclude = ['Pulled']  # How timelines read the post; internal
+        read_only_fields = ['TrendingScore']
+
+
+class ReplySerializer(ExpandableFieldsMixin, serializers.ModelSerializer):
+    expandable_fields = {
+        'author': ('Author', lambda: AuthorSerializer(source='UserID', read_only=True)),
+    }
+
     class Meta:
         model = Reply
-        fields = '__all__'
\ No newline at end of file
+        fields = '__all__'
+
+
+# Items of a batch write (see batch.py). Posts and users are checked by the
+# batch with one query each rather than by a lookup per item.
+
+class VoteBatchItemSerializer(serializers.Serializer):
+    post_id = serializers.IntegerField()
+    vote_type = serializers.ChoiceField(choices=[vote_type for vote_type, _ in Vote.VOTE_TYPES])
+    user_id = serializers.IntegerField(required=False, allow_null=True)
+
+
+class ReplyBatchItemSerializer(serializers.ModelSerializer):
+    PostID = serializers.IntegerField(source='PostID_id')
+    UserID = serializers.IntegerField(source='UserID_id')
+
+    class Meta:
+        model = Reply
+        fields = ['PostID', 'UserID', 'ReplyText', 'isAgree']
+        extra_kwargs = {'isAgree': {'required': True}}
+
+
+class FollowBatchItemSerializer(serializers.Serializer):
+    op = serializers.ChoiceField(choices=['follow', 'unfollow'])
+    follower_id = serializers.IntegerField()
+    followee_id = serializers.IntegerField()
+
+    def validate(self, data):
+        if data['follower_id'] == data['followee_id']:
+            raise serializers.ValidationError("Users cannot follow themselves.")
+        return data
@@ -0,0 +1,139 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .analytics import adjust_rollups, delete_rollups, post_rollup_events, reply_rollup_events
+from .daily import add_daily_response
+from .events import publish_post, publish_replies
+from .models import DailyResponse, Post, Prompt, Reply, User
+from .response_cache import invalidate_on_commit
+from .user_stats import adjust_user_stats
+
+INVALIDATE_BATCH = 1000
+
+
+def invalidate_threads_on_commit(post_ids):
+    # A prompt has thousands of posts, so in batches
+    tags = [f'thread:{post_id}' for post_id in sorted(post_ids)]
+    for i in range(0, len(tags), INVALIDATE_BATCH):
+        invalidate_on_commit(*tags[i:i + INVALIDATE_BATCH])
+
+
+@receiver([post_save, post_delete], sender=Post)
+def post_changed(sender, instance, **kwargs):
+    invalidate_on_commit(f'post:{instance.PostID}')
+
+
+@receiver(post_save, sender=Post)
+def post_created_stats(sender, instance, created, **kwargs):
+    if created:
+        adjust_user_stats({instance.UserID_id: {
+            'PostCount': 1,
+            'TotalUpvotes': instance.UpvoteCount,
+            'TotalDownvotes': instance.DownvoteCount,
+        }})
+
+
+@receiver(post_save, sender=Post)
+def post_created_daily(sender, instance, created, **kwargs):
+    if created:
+        add_daily_response(instance)
+
+
+@receiver(post_save, sender=Post)
+def post_created_rollups(sender, instance, created, **kwargs):
+    if created:
+        adjust_rollups(post_rollup_events(instance, 1))
+
+
+@receiver(post_save, sender=Post)
+def post_created_event(sender, instance, created, **kwargs):
+    if created:
+        publish_post(instance)
+
+
+# Deletes only update existing rows: when a whole user is deleted, their
+# stats row may already be gone and must not be recreated
+@receiver(post_delete, sender=Post)
+def post_deleted_stats(sender, instance, **kwargs):
+    adjust_user_stats({instance.UserID_id: {
+        'PostCount': -1,
+        'TotalUpvotes': -instance.UpvoteCount,
+        'TotalDownvotes': -instance.DownvoteCount,
+    }}, create=False)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_rollups(sender, instance, **kwargs):
+    adjust_rollups(post_rollup_events(instance, -1), create=False)
+    delete_rollups('post', instance.PostID)
+
+
+def reply_post(reply):
+    # The post's author and prompt are read from the database rather than
+    # through reply.PostID, which may be a stale or already deleted instance
+    return Post.objects.filter(pk=reply.PostID_id).values_list('UserID', 'PromptID').first() or (None, None)
+
+
+def reply_stats_deltas(reply, sign, author_id):
+    deltas = {reply.UserID_id: {'ReplyCount': sign}}
+    if author_id is not None:
+        received = deltas.setdefault(author_id, {})
+        received['AgreeReceived' if reply.isAgree else 'DisagreeReceived'] = sign
+    return deltas
+
+
+@receiver([post_save, post_delete], sender=Reply)
+def reply_changed(sender, instance, **kwargs):
+    invalidate_on_commit(f'replies:{instance.PostID_id}')
+
+
+# The stats, rollups and event of a reply share one lookup of its post
+@receiver(post_save, sender=Reply)
+def reply_created(sender, instance, created, **kwargs):
+    if created:
+        author_id, prompt_id = reply_post(instance)
+        prompt_ids = {instance.PostID_id: prompt_id}
+        adjust_user_stats(reply_stats_deltas(instance, 1, author_id))
+        adjust_rollups(reply_rollup_events([instance], prompt_ids, 1))
+        publish_replies([instance], prompt_ids)
+
+
+@receiver(post_delete, sender=Reply)
+def reply_deleted(sender, instance, **kwargs):
+    author_id, prompt_id = reply_post(instance)
+    adjust_user_stats(reply_stats_deltas(instance, -1, author_id), create=False)
+    adjust_rollups(reply_rollup_events([instance], {instance.PostID_id: prompt_id}, -1), create=False)
+
+
+@receiver([post_save, post_delete], sender=Prompt)
+def prompt_changed(sender, instance, **kwargs):
+    invalidate_on_commit(f'prompt:{instance.PromptID}', 'prompts')
+
+
+# Posts embed their prompt. On delete, before the posts' PromptID is set to NULL
+@receiver([post_save, pre_delete], sender=Prompt)
+def prompt_threads_changed(sender, instance, created=False, **kwargs):
+    if not created:
+        invalidate_threads_on_commit(Post.objects.filter(PromptID=instance.PromptID).values_list('PostID', flat=True))
+
+
+@receiver(post_delete, sender=Prompt)
+def prompt_deleted_rollups(sender, instance, **kwargs):
+    delete_rollups('prompt', instance.PromptID)
+
+
+@receiver([post_save, post_delete], sender=User)
+def user_changed(sender, instance, **kwargs):
+    invalidate_on_commit(f'user:{instance.UserID}')
+
+
+# Posts and replies embed their author. On delete, before the cascade removes them
+@receiver([post_save, pre_delete], sender=User)
+def user_threads_changed(sender, instance, created=False, **kwargs):
+    if created:
+        return
+    post_ids = set(Post.objects.filter(UserID=instance.UserID).values_list('PostID', flat=True))
+    post_ids.update(Reply.objects.filter(UserID=instance.UserID).values_list('PostID', flat=True).distinct())
+    invalidate_threads_on_commit(post_ids)
+    if DailyResponse.objects.filter(PostID__UserID=instance.UserID).exists():
+        invalidate_on_commit('daily')
@@ -1,3 +1,432 @@
-from django.test import TestCase
+import base64
+import datetime
+import json
+from urllib.parse import parse_qs, urlsplit
+from unittest import mock
 
-# Create your tests here.
+from django.conf import settings
+from django.core.cache import cache
+from django.db import connection
+from django.test import RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
+from rest_framework.request import Request
+
+from . import throttling
+from .expand import expand_posts, expand_replies
+from .models import Post, Prompt, Reply, User
+from .pagination import KeysetPaginator, encode_cursor
+from .serializers import PostSerializer, PromptSerializer, ReplySerializer, UserSerializer
+
+
+class ExpandQueryCountTests(TestCase):
+    """
+    Expanded relations are loaded in the page's own query, so a list costs
+    the same number of queries however many rows it holds.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(Username='author', Email='author@example.com', Password='')
+        cls.prompt = Prompt.objects.create(PromptText='Is it?', Category='general')
+        cls.post = Post.objects.create(UserID=cls.author, PromptID=cls.prompt, PostText='first')
+
+    def add_posts(self, count):
+        for i in range(count):
+            post = Post.objects.create(UserID=self.author, PromptID=self.prompt, PostText=f'post {i}')
+            Reply.objects.create(PostID=post, UserID=self.author, ReplyText='reply', isAgree=True)
+
+    def add_replies(self, count):
+        for i in range(count):
+            Reply.objects.create(PostID=self.post, UserID=self.author, ReplyText=f'reply {i}', isAgree=i % 2 == 0)
+
+    def assertQueriesIndependentOfRows(self, url, add_rows, rows):
+        add_rows(1)
+        with CaptureQueriesContext(connection) as one_row:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+
+        add_rows(9)
+        with self.assertNumQueries(len(one_row)):
+            response = self.client.get(url)
+        self.assertEqual(len(rows(response.json())), 10)
+
+    def test_post_list(self):
+        self.post.delete()
+        self.assertQueriesIndependentOfRows('/api/posts/?expand=prompt,author,reply_count', self.add_posts, lambda data: data)
+
+    def test_trending_posts(self):
+        self.post.delete()
+        self.assertQueriesIndependentOfRows('/api/posts/trending/?expand=prompt,author,reply_count', self.add_posts, lambda data: data['posts'])
+
+    def test_user_posts(self):
+        self.post.delete()
+        url = f'/api/user/{self.author.UserID}/posts/?expand=prompt,author,reply_count'
+        self.assertQueriesIndependentOfRows(url, self.add_posts, lambda data: data['posts'])
+
+    def test_replies(self):
+        url = f'/api/posts/{self.post.PostID}/replies/?expand=author'
+        self.assertQueriesIndependentOfRows(url, self.add_replies, lambda data: data['replies'])
+
+
+class RowSerializerTests(TestCase):
+    """
+    The list views serialize values_list() rows with row_serializer(); their
+    output must be what the ModelSerializer makes of the same objects.
+    """
+    POST_EXPANDS = ['', 'prompt', 'author', 'reply_count', 'prompt,author,reply_count']
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.uploader = User.objects.create(Username='uploader', Email='uploader@example.com', Password='', ProfilePicture='ab' * 32, Bio='Uploads')
+        cls.linker = User.objects.create(Username='linker', Email='linker@example.com', Password='', ProfilePicture='https://example.com/me.png')
+        cls.plain = User.objects.create(Username='plain', Email='plain@example.com', Password='')
+        cls.prompt = Prompt.objects.create(PromptText='Is it?', Category='general')
+        Prompt.objects.create(PromptText='Is it not?', Category='general')
+        # A post with a prompt and replies, and one without either
+        cls.post = Post.objects.create(UserID=cls.uploader, PromptID=cls.prompt, PostText='It is', UpvoteCount=3)
+        cls.orphan = Post.objects.create(UserID=cls.plain, PromptID=None, PostText='No prompt')
+        for author, agree in ((cls.linker, True), (cls.plain, False), (cls.uploader, True)):
+            Reply.objects.create(PostID=cls.post, UserID=author, ReplyText=f'{author.Username} says', isAgree=agree)
+
+    def setUp(self):
+        cache.clear()
+
+    def assertMatchesModelSerializer(self, url, serializer_class, queryset, expand=(), key=None):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        rows = response.json()[key] if key else response.json()
+        self.assertTrue(rows)
+
+        pk = queryset.model._meta.pk.name
+        objects = queryset.in_bulk([row[pk] for row in rows])
+        expected = serializer_class([objects[row[pk]] for row in rows], many=True, context={'expand': set(expand)}).data
+        self.assertEqual(rows, json.loads(JSONRenderer().render(expected)))
+
+    def assertPostListMatches(self, url, key=None):
+        for expand in self.POST_EXPANDS:
+            with self.subTest(expand=expand):
+                names = set(filter(None, expand.split(',')))
+                self.assertMatchesModelSerializer(f'{url}?expand={expand}', PostSerializer, expand_posts(Post.objects.all(), names), names, key)
+
+    def test_users(self):
+        self.assertMatchesModelSerializer('/api/users/', UserSerializer, User.objects.all())
+
+    def test_posts(self):
+        self.assertPostListMatches('/api/posts/')
+
+    def test_trending_posts(self):
+        self.assertPostListMatches('/api/posts/trending/', key='posts')
+
+    def test_user_posts(self):
+        for user in (self.uploader, self.plain):
+            with self.subTest(user=user.Username):
+                self.assertPostListMatches(f'/api/user/{user.UserID}/posts/', key='posts')
+
+    def test_prompts(self):
+        self.assertMatchesModelSerializer('/api/prompts/', PromptSerializer, Prompt.objects.all())
+
+    def test_prompts_by_category(self):
+        self.assertMatchesModelSerializer('/api/prompts/category/general/', PromptSerializer, Prompt.objects.all())
+
+    def test_replies(self):
+        for expand in ('', 'author'):
+            with self.subTest(expand=expand):
+                names = set(filter(None, [expand]))
+                self.assertMatchesModelSerializer(
+                    f'/api/posts/{self.post.PostID}/replies/?expand={expand}',
+                    ReplySerializer, expand_replies(Reply.objects.all(), names), names, key='replies',
+                )
+
+    def test_thread_replies(self):
+        self.assertMatchesModelSerializer(
+            f'/api/posts/{self.post.PostID}/thread/',
+            ReplySerializer, expand_replies(Reply.objects.all(), {'author'}), {'author'}, key='replies',
+        )
+
+
+class ThrottleTests(TestCase):
+    """
+    Writes take tokens from a bucket per client IP and per user. A refused
+    write is answered before the view runs, without a query.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(Username='voter', Email='voter@example.com', Password='')
+        cls.post = Post.objects.create(UserID=cls.user, PostText='Vote on me')
+
+    def setUp(self):
+        rates = {**settings.THROTTLE_RATES, 'vote': ('5/min', '3/min'), 'write': ('1/min', None)}
+        limits = override_settings(THROTTLE_ENABLED=True, THROTTLE_BACKEND='local', THROTTLE_RATES=rates)
+        limits.enable()
+        self.addCleanup(limits.disable)
+        # Every test starts with full buckets
+        throttling.buckets = None
+        self.addCleanup(setattr, throttling, 'buckets', None)
+
+    def vote(self, **data):
+        return self.client.post(f'/api/posts/upvote/{self.post.PostID}/', data, content_type='application/json')
+
+    def test_flood_is_refused_with_retry_after(self):
+        self.assertEqual([self.vote().status_code for _ in range(5)], [200] * 5)
+        with self.assertNumQueries(0):
+            response = self.vote()
+        self.assertEqual(response.status_code, 429)
+        self.assertEqual(response['Retry-After'], '12')  # One token at 5/min
+
+    def test_user_bucket(self):
+        self.assertEqual([self.vote(user_id=self.user.UserID).status_code for _ in range(3)], [200] * 3)
+        self.assertEqual(self.vote(user_id=self.user.UserID).status_code, 429)
+        # The IP still has tokens for other users' votes
+        self.assertEqual(self.vote().status_code, 200)
+
+    def test_reads_are_not_throttled(self):
+        self.assertEqual(self.client.post('/api/posts/', {}, content_type='application/json').status_code, 400)
+        self.assertEqual(self.client.post('/api/posts/', {}, content_type='application/json').status_code, 429)
+        for _ in range(10):
+            self.assertEqual(self.client.get('/api/posts/').status_code, 200)
+
+    def test_bucket_refills(self):
+        with mock.patch('opinions_app.throttling.time.monotonic', return_value=1000.0) as clock:
+            self.assertEqual([self.vote().status_code for _ in range(5)], [200] * 5)
+            self.assertEqual(self.vote().status_code, 429)
+            clock.return_value = 1012.0  # One token back
+            self.assertEqual(self.vote().status_code, 200)
+            self.assertEqual(self.vote().status_code, 429)
+            clock.return_value = 1072.0  # Full again, and no fuller
+            self.assertEqual([self.vote().status_code for _ in range(6)], [200] * 5 + [429])
+
+    def test_batch_items_are_charged(self):
+        request = RequestFactory().post('/api/batch/')
+        self.assertEqual(throttling.take_item_tokens(request, 'vote', [1, 1, None]), 0)
+        # User 1 has one of three tokens left, the IP two of five
+        self.assertGreater(throttling.take_item_tokens(request, 'vote', [1, 1]), 0)
+        # The IP bucket, charged before user 1's fell short, kept the charge
+        self.assertEqual(self.vote().status_code, 429)
+
+    def test_batch_over_capacity(self):
+        request = RequestFactory().post('/api/batch/')
+        self.assertIsNone(throttling.take_item_tokens(request, 'vote', [None] * 6))  # The IP bucket holds 5
+        self.assertIsNone(throttling.take_item_tokens(request, 'vote', [1] * 4))  # A user bucket holds 3
+        # Nothing was charged
+        self.assertEqual(throttling.take_item_tokens(request, 'vote', [None] * 5), 0)
+
+
+@override_settings(RESPONSE_CACHE_ENABLED=True)
+class ResponseCacheTests(TestCase):
+    """
+    Writes to any row a cached response shows must invalidate it, including
+    writes that land while the response is being built.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = User.objects.create(Username='author', Email='author@example.com', Password='')
+        cls.replier = User.objects.create(Username='replier', Email='replier@example.com', Password='')
+        cls.prompt = Prompt.objects.create(PromptText='Is it?', Category='general')
+        cls.post = Post.objects.create(UserID=cls.author, PromptID=cls.prompt, PostText='It is')
+        cls.reply = Reply.objects.create(PostID=cls.post, UserID=cls.replier, ReplyText='It is not', isAgree=False)
+
+    def setUp(self):
+        cache.clear()
+        post_id = self.post.PostID
+        self.post_url = f'/api/posts/{post_id}/?expand=prompt,author,reply_count'
+        self.thread_url = f'/api/posts/{post_id}/thread/'
+
+    def get_cached(self, url):
+        # Builds the entry, then checks the next request is a hit
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).content, response.content)
+        return response
+
+    def assertInvalidatedBy(self, write, urls):
+        for url in urls:
+            self.get_cached(url)
+        with self.captureOnCommitCallbacks(execute=True):
+            write()
+        for url in urls:
+            with self.subTest(url=url), CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url)
+            self.assertTrue(queries.captured_queries, f'{url} was served from the cache')
+        return response
+
+    def test_post_save_and_delete(self):
+        def edit():
+            self.post.PostText = 'It is, mostly'
+            self.post.save()
+        self.assertInvalidatedBy(edit, [self.post_url, self.thread_url])
+        self.assertEqual(self.client.get(self.thread_url).json()['post']['PostText'], 'It is, mostly')
+        response = self.assertInvalidatedBy(self.post.delete, [self.post_url, self.thread_url])
+        self.assertEqual(response.status_code, 404)
+
+    def test_reply_save_and_delete(self):
+        create = lambda: Reply.objects.create(PostID=self.post, UserID=self.author, ReplyText='It is', isAgree=True)
+        self.assertInvalidatedBy(create, [self.post_url, self.thread_url])
+        self.assertEqual(self.client.get(self.post_url).json()['ReplyCount'], 2)
+        self.assertInvalidatedBy(self.reply.delete, [self.post_url, self.thread_url])
+        self.assertEqual([reply['ReplyText'] for reply in self.client.get(self.thread_url).json()['replies']], ['It is'])
+
+    def test_prompt_save_and_delete(self):
+        prompt_url = f'/api/prompt/{self.prompt.PromptID}/'
+        def edit():
+            self.prompt.PromptText = 'Is it really?'
+            self.prompt.save()
+        self.assertInvalidatedBy(edit, [self.post_url, self.thread_url, prompt_url])
+        self.assertEqual(self.client.get(self.thread_url).json()['prompt']['PromptText'], 'Is it really?')
+        self.assertInvalidatedBy(self.prompt.delete, [self.post_url, self.thread_url, prompt_url])
+        self.assertIsNone(self.client.get(self.thread_url).json()['prompt'])
+        self.assertIsNone(self.client.get(self.post_url).json()['Prompt'])
+
+    def test_user_save_and_delete(self):
+        user_url = f'/api/user/{self.replier.UserID}/'
+        def rename():
+            self.replier.Username = 'rebuttal'
+            self.replier.save()
+        self.assertInvalidatedBy(rename, [self.thread_url, user_url])
+        self.assertEqual(self.client.get(self.thread_url).json()['replies'][0]['Author']['Username'], 'rebuttal')
+        self.assertInvalidatedBy(self.replier.delete, [self.thread_url, user_url])
+        self.assertEqual(self.client.get(self.thread_url).json()['replies'], [])
+        response = self.assertInvalidatedBy(self.author.delete, [self.post_url])
+        self.assertEqual(response.status_code, 404)
+
+    def test_write_while_building(self):
+        # The prompt is renamed and committed after the view has read it, but
+        # before the response is cached: the entry must not outlive the rename
+        def rename_prompt(*args):
+            with self.captureOnCommitCallbacks(execute=True):
+                self.prompt.PromptText = 'Is it really?'
+                self.prompt.save()
+            return expand_replies(*args)
+        with mock.patch('opinions_app.views.expand_replies', side_effect=rename_prompt):
+            stale = self.client.get(self.thread_url)
+        self.assertEqual(stale.json()['prompt']['PromptText'], 'Is it?')
+        self.assertEqual(self.client.get(self.thread_url).json()['prompt']['PromptText'], 'Is it really?')
+
+    def test_if_none_match(self):
+        etag = self.get_cached(self.post_url)['ETag']
+        response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+        self.assertEqual(self.client.get(self.post_url, HTTP_IF_NONE_MATCH='"other"').status_code, 200)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.PostText = 'It is, mostly'
+            self.post.save()
+        response = self.client.get(self.post_url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+
+
+class KeysetPaginatorTests(TestCase):
+    """
+    Pages follow the ordering exactly, whatever is written between requests,
+    and every cursor a client can send is either a page or a 400.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(Username='pager', Email='pager@example.com', Password='')
+        cls.post = Post.objects.create(UserID=cls.user, PostText='Paged')
+        # Seven posts and replies over three timestamps, so pages split ties
+        cls.base = timezone.now() - datetime.timedelta(days=1)
+        for i in range(7):
+            moment = cls.base + datetime.timedelta(minutes=i // 3)
+            post = Post.objects.create(UserID=cls.user, PostText=f'Post {i}')
+            reply = Reply.objects.create(PostID=cls.post, UserID=cls.user, ReplyText=f'Reply {i}', isAgree=bool(i % 2))
+            Post.objects.filter(pk=post.pk).update(CreatedAt=moment)
+            Reply.objects.filter(pk=reply.pk).update(CreatedAt=moment)
+
+    def walk(self, url, rows, write=None):
+        # Every page's IDs, following the Link header, with a write between pages
+        pages = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200, response.content)
+            pages.append(rows(response.json()))
+            url = response.get('Link', '').removeprefix('<').partition('>')[0]
+            if write:
+                write(pages[-1])
+        return pages
+
+    def test_posts_are_stable_across_inserts(self):
+        expected = list(Post.objects.order_by('-CreatedAt', '-PostID').values_list('PostID', flat=True))
+        # A new post with the timestamp of the page's last one sorts before it by ID
+        def insert(page):
+            post = Post.objects.create(UserID=self.user, PostText='New')
+            Post.objects.filter(pk=post.pk).update(CreatedAt=Post.objects.get(pk=page[-1]).CreatedAt)
+        pages = self.walk('/api/posts/?limit=3', lambda data: [post['PostID'] for post in data], insert)
+        self.assertEqual([len(page) for page in pages], [3, 3, 2])
+        self.assertEqual([post_id for page in pages for post_id in page], expected)
+
+    def test_replies_are_stable_across_inserts(self):
+        expected = list(Reply.objects.order_by('CreatedAt', 'ReplyID').values_list('ReplyID', flat=True))
+        # Backdated replies sort before every cursor
+        def insert(page):
+            reply = Reply.objects.create(PostID=self.post, UserID=self.user, ReplyText='Late', isAgree=True)
+            Reply.objects.filter(pk=reply.pk).update(CreatedAt=self.base - datetime.timedelta(minutes=1))
+        pages = self.walk(f'/api/posts/{self.post.PostID}/replies/?limit=2', lambda data: [reply['ReplyID'] for reply in data['replies']], insert)
+        self.assertEqual([len(page) for page in pages], [2, 2, 2, 1])
+        self.assertEqual([reply_id for page in pages for reply_id in page], expected)
+
+    def assertNextLink(self, response, path, limit):
+        link = urlsplit(response['Link'].removesuffix('>; rel="next"').removeprefix('<'))
+        self.assertEqual((link.scheme, link.netloc, link.path), ('http', 'testserver', path))
+        self.assertEqual(parse_qs(link.query), {'limit': [limit], 'cursor': [response['X-Next-Cursor']]})
+
+    def test_next_cursor(self):
+        response = self.client.get(f'/api/posts/{self.post.PostID}/replies/?limit=5')
+        cursor = response.json()['next_cursor']
+        self.assertTrue(cursor)
+        self.assertEqual(response['X-Next-Cursor'], cursor)
+        self.assertNextLink(response, f'/api/posts/{self.post.PostID}/replies/', '5')
+
+        last = self.client.get(f'/api/posts/{self.post.PostID}/replies/?limit=5&cursor={cursor}')
+        self.assertEqual(len(last.json()['replies']), 2)
+        self.assertIsNone(last.json()['next_cursor'])
+        self.assertNotIn('X-Next-Cursor', last)
+        self.assertNotIn('Link', last)
+
+    def test_bare_list_next_cursor(self):
+        response = self.client.get('/api/posts/?limit=7')
+        self.assertEqual(len(response.json()), 7)
+        cursor = response['X-Next-Cursor']
+        self.assertNextLink(response, '/api/posts/', '7')
+        last = self.client.get(f'/api/posts/?limit=7&cursor={cursor}')
+        self.assertEqual(len(last.json()), 1)
+        self.assertNotIn('X-Next-Cursor', last)
+
+    def test_invalid_cursor(self):
+        moment = {"dt": self.base.isoformat()}
+        raw = lambda payload: base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+        cursors = {
+            'not base64': '%%%',
+            'not JSON': base64.urlsafe_b64encode(b'{').decode(),
+            'not a list': raw({"dt": self.base.isoformat()}),
+            'too short': encode_cursor([self.base]),
+            'too long': encode_cursor([self.base, 1, 2]),
+            'bad datetime': raw([{"dt": "yesterday"}, 1]),
+            'datetime as a number': raw([5, 1]),
+            'ID as a string': raw([moment, 'one']),
+            'ID as a boolean': raw([moment, True]),
+            'ID as a list': raw([moment, [1]]),
+            'ID not finite': base64.urlsafe_b64encode(b'[{"dt":"2026-01-01T00:00:00"},NaN]').decode(),
+        }
+        for name, cursor in cursors.items():
+            with self.subTest(name):
+                response = self.client.get('/api/posts/', {'cursor': cursor})
+                self.assertEqual(response.status_code, 400, response.content)
+                self.assertEqual(response.json(), {"error": "Invalid cursor."})
+
+    def test_limit(self):
+        paginator = KeysetPaginator(('PostID',), default_size=3, max_size=5)
+        sizes = {None: 3, '4': 4, '5': 5, '6': 5, '100000': 5, '1': 1, '0': 1, '-3': 1, 'many': 3, '2.5': 3}
+        for limit, size in sizes.items():
+            with self.subTest(limit=limit):
+                request = Request(RequestFactory().get('/', {} if limit is None else {'limit': limit}))
+                self.assertEqual(paginator.get_page_size(request), size)
+        self.assertEqual(len(self.client.get('/api/posts/?limit=0').json()), 1)
+        self.assertEqual(len(self.client.get('/api/posts/?limit=100000').json()), Post.objects.count())
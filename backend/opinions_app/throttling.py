@@ -0,0 +1,189 @@
+import hashlib
+import math
+import threading
+import time
+from collections import Counter
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+# Token buckets for the write endpoints. A view opts in with a
+# `throttle_scope`, whose rates are in settings.THROTTLE_RATES, and names the
+# request field holding the acting user in `throttle_user_field`. Buckets are
+# never kept in Postgres: a throttled request costs no query.
+
+PERIODS = {'s': 1, 'sec': 1, 'min': 60, 'hour': 3600, 'day': 86400}
+
+
+@lru_cache(maxsize=None)
+def parse_rate(rate):
+    """
+    '30/min' -> (30, 0.5): the bucket holds 30 tokens and refills 30 per minute.
+    None means no limit.
+    """
+    if rate is None:
+        return None
+    count, period = rate.split('/')
+    return int(count), int(count) / PERIODS[period]
+
+
+def refill(bucket, capacity, per_second, now):
+    # Tokens in a bucket stored as (tokens, updated at, ...); a missing bucket is full
+    if bucket is None:
+        return capacity
+    return min(capacity, bucket[0] + (now - bucket[1]) * per_second)
+
+
+class LocalBuckets:
+    """
+    Buckets in this process's memory. With several server processes each
+    has its own, so a client whose requests are spread over N processes gets
+    up to N times the rate.
+    """
+    # Full buckets are dropped once there are more than this many
+    max_buckets = 100000
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.buckets = {}
+
+    def take(self, key, capacity, per_second, count=1):
+        """
+        Take `count` tokens from the bucket at `key`. Returns 0 when they were
+        taken, otherwise the seconds until there are enough.
+        """
+        with self.lock:
+            now = time.monotonic()
+            tokens = refill(self.buckets.get(key), capacity, per_second, now)
+            if tokens < count:
+                return (count - tokens) / per_second
+            self.buckets[key] = (tokens - count, now, now + (capacity - tokens + count) / per_second)
+            if len(self.buckets) > self.max_buckets:
+                # A bucket that has refilled is the same as no bucket
+                self.buckets = {key: bucket for key, bucket in self.buckets.items() if bucket[2] > now}
+            return 0
+
+
+class CacheBuckets:
+    """
+    Buckets in the default cache, shared by every process when it is Redis
+    (see Caches in settings.py). Each check is a cache read and write, and
+    processes racing on one bucket can let a few extra requests through.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+
+    def take(self, key, capacity, per_second, count=1):
+        with self.lock:
+            now = time.time()
+            tokens = refill(cache.get(key), capacity, per_second, now)
+            if tokens < count:
+                return (count - tokens) / per_second
+            # Expires once it would have refilled anyway
+            cache.set(key, (tokens - count, now), timeout=math.ceil((capacity - tokens + count) / per_second))
+            return 0
+
+
+BUCKET_BACKENDS = {
+    'local': LocalBuckets,
+    'cache': CacheBuckets,
+}
+
+buckets = None
+buckets_lock = threading.Lock()
+
+
+def get_buckets():
+    global buckets
+    with buckets_lock:
+        if buckets is None:
+            buckets = BUCKET_BACKENDS[settings.THROTTLE_BACKEND]()
+    return buckets
+
+
+class ScopedTokenBucketThrottle(BaseThrottle):
+    """
+    Throttles the writes of views with a `throttle_scope` using that scope's
+    rate at `rate_index` in settings.THROTTLE_RATES. Reads are never throttled.
+    """
+    rate_index = None
+
+    def get_key(self, request, view):
+        raise NotImplementedError
+
+    def allow_request(self, request, view):
+        self.delay = 0
+        scope = getattr(view, 'throttle_scope', None)
+        if not settings.THROTTLE_ENABLED or scope is None or request.method in SAFE_METHODS:
+            return True
+        rate = parse_rate(settings.THROTTLE_RATES[scope][self.rate_index])
+        key = self.get_key(request, view)
+        if rate is None or key is None:
+            return True
+        self.delay = get_buckets().take(f'throttle:{scope}:{key}', *rate)
+        return not self.delay
+
+    def wait(self):
+        return self.delay
+
+
+class IPThrottle(ScopedTokenBucketThrottle):
+    """
+    One bucket per client IP (see NUM_PROXIES in DRF's settings when behind a proxy).
+    """
+    rate_index = 0
+
+    def get_key(self, request, view):
+        return f'ip:{self.get_ident(request)}'
+
+
+class UserThrottle(ScopedTokenBucketThrottle):
+    """
+    One bucket per user a request acts as, taken from the request field named
+    by the view's `throttle_user_field`. Requests without it are not limited
+    here, only by IPThrottle.
+    """
+    rate_index = 1
+
+    def get_key(self, request, view):
+        field = getattr(view, 'throttle_user_field', None)
+        return user_key(request.data.get(field) if field and isinstance(request.data, dict) else None)
+
+
+def user_key(user):
+    if user in (None, ''):
+        return None
+    # Usernames may hold characters that are not valid in cache keys
+    return f'user:{hashlib.md5(str(user).encode()).hexdigest()}'
+
+
+def take_item_tokens(request, scope, users):
+    """
+    Charge the items of a batch request to the `scope` buckets their
+    single-item requests would use: one token per item from the client IP's
+    bucket, and one per item from the bucket of the item's user (None for
+    items without one). Returns 0 when every token was taken, otherwise the
+    seconds until there are enough, or None when the items need more tokens
+    than a bucket holds and could never go through at once. Buckets charged
+    before one that falls short keep the charge.
+    """
+    if not settings.THROTTLE_ENABLED or not users:
+        return 0
+    ip_rate, user_rate = (parse_rate(rate) for rate in settings.THROTTLE_RATES[scope])
+    charges = [(f'ip:{IPThrottle().get_ident(request)}', len(users), ip_rate)]
+    per_user = Counter(user_key(user) for user in users)
+    per_user.pop(None, None)
+    charges += [(key, count, user_rate) for key, count in sorted(per_user.items())]
+    charges = [(key, count, rate) for key, count, rate in charges if rate is not None]
+
+    if any(count > rate[0] for _, count, rate in charges):
+        return None
+    for key, count, rate in charges:
+        delay = get_buckets().take(f'throttle:{scope}:{key}', *rate, count=count)
+        if delay:
+            return delay
+    return 0
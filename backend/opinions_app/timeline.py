@@ -0,0 +1,220 @@
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+
+from .expand import expand_posts
+from .models import Follow, Post, TimelineEntry
+from .pagination import KeysetPaginator
+
+logger = logging.getLogger(__name__)
+
+# A home timeline has two sources: the entries pushed into it when a post is
+# written, and the pulled posts (Post.Pulled) of the authors it follows,
+# merged in at read time. Posts of authors with more than
+# TIMELINE_FANOUT_LIMIT followers stay pulled; others are pulled only until
+# their fan-out, which runs after the commit on fan_out_executor. Both
+# sources are read newest first with the same
+# (CreatedAt, post ID) keyset, so one cursor pages through their merge.
+entry_seek = KeysetPaginator(('-CreatedAt', '-PostID_id'))
+post_seek = KeysetPaginator(('-CreatedAt', '-PostID'))
+
+FAN_OUT_POST = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT follower_id, %(post)s, %(created)s FROM follows WHERE followee_id = %(author)s
+UNION ALL
+SELECT %(author)s, %(post)s, %(created)s
+ON CONFLICT (owner_id, post_id) DO NOTHING;
+"""
+
+BACKFILL_AUTHOR = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT %(owner)s, postid, created_at
+FROM posts
+WHERE user_id = %(author)s
+ORDER BY created_at DESC, postid DESC
+LIMIT %(limit)s
+ON CONFLICT (owner_id, post_id) DO NOTHING;
+"""
+
+ADD_TO_OWN_TIMELINE = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+VALUES (%(author)s, %(post)s, %(created)s)
+ON CONFLICT (owner_id, post_id) DO NOTHING;
+"""
+
+# BACKFILL_AUTHOR for many (owner, author) pairs
+BACKFILL_AUTHORS = """
+INSERT INTO timelines (owner_id, post_id, created_at)
+SELECT pairs.owner_id, recent.postid, recent.created_at
+FROM (VALUES {values}) AS pairs (owner_id, author_id)
+CROSS JOIN LATERAL (
+    SELECT postid, created_at
+    FROM posts
+    WHERE posts.user_id = pairs.author_id
+    ORDER BY created_at DESC, postid DESC
+    LIMIT %s
+) AS recent
+ON CONFLICT (owner_id, post_id) DO NOTHING;
+"""
+
+REMOVE_AUTHOR = """
+DELETE FROM timelines
+USING posts
+WHERE timelines.owner_id = %(owner)s
+  AND timelines.post_id = posts.postid
+  AND posts.user_id = %(author)s;
+"""
+
+# REMOVE_AUTHOR for many (owner, author) pairs
+REMOVE_AUTHORS = """
+DELETE FROM timelines
+USING posts, (VALUES {values}) AS pairs (owner_id, author_id)
+WHERE timelines.owner_id = pairs.owner_id
+  AND timelines.post_id = posts.postid
+  AND posts.user_id = pairs.author_id;
+"""
+
+TRIM_TIMELINES = """
+DELETE FROM timelines
+WHERE entryid IN (
+    SELECT entryid
+    FROM (
+        SELECT entryid,
+               ROW_NUMBER() OVER (PARTITION BY owner_id ORDER BY created_at DESC, post_id DESC) AS position
+        FROM timelines
+    ) AS ranked
+    WHERE ranked.position > %s
+);
+"""
+
+
+fan_out_executor = ThreadPoolExecutor(max_workers=settings.TIMELINE_FANOUT_THREADS, thread_name_prefix='timeline-fan-out')
+
+
+def is_fan_out_author(follower_count):
+    """
+    Whether an author's posts are pushed into follower timelines on write.
+    Authors above TIMELINE_FANOUT_LIMIT are merged in at read time instead.
+    """
+    return follower_count <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def add_post(post):
+    """
+    Put a new post, saved with Pulled=True, into its author's own timeline,
+    and fan it out in the background once the transaction commits. Followers
+    read it as a pulled post until then, or for good if the fan-out fails.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(ADD_TO_OWN_TIMELINE, {"post": post.PostID, "created": post.CreatedAt, "author": post.UserID_id})
+    transaction.on_commit(lambda: fan_out_executor.submit(fan_out_in_background, post.PostID), robust=True)
+
+
+def fan_out_in_background(post_id):
+    # Each call is handled like a request, so pool threads honour CONN_MAX_AGE
+    # instead of holding a connection open between fan-outs
+    close_old_connections()
+    try:
+        post = Post.objects.select_related('UserID').filter(pk=post_id).first()
+        if post is not None:
+            fan_out_post(post)
+    except Exception:
+        logger.exception("Could not fan out post %s", post_id)
+    finally:
+        close_old_connections()
+
+
+def fan_out_post(post):
+    """
+    Push a post into the author's own timeline and, unless the author has too
+    many followers, into every follower's timeline with one INSERT ... SELECT.
+    Records in Post.Pulled whether followers must merge it in at read time.
+    """
+    params = {"post": post.PostID, "created": post.CreatedAt, "author": post.UserID_id}
+    pushed = is_fan_out_author(post.UserID.FollowerCount)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(FAN_OUT_POST if pushed else ADD_TO_OWN_TIMELINE, params)
+        Post.objects.filter(pk=post.PostID).update(Pulled=not pushed)
+
+
+def backfill_author(owner_id, author_id):
+    """
+    Add the author's most recent posts to a new follower's timeline.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(BACKFILL_AUTHOR, {"owner": owner_id, "author": author_id, "limit": settings.TIMELINE_BACKFILL})
+
+
+def remove_author(owner_id, author_id):
+    """
+    Drop an unfollowed author's posts from the owner's timeline.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(REMOVE_AUTHOR, {"owner": owner_id, "author": author_id})
+
+
+def backfill_authors(pairs):
+    """
+    backfill_author() for many (owner_id, author_id) pairs, in one statement.
+    """
+    if pairs:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                BACKFILL_AUTHORS.format(values=', '.join(['(%s, %s)'] * len(pairs))),
+                [value for pair in pairs for value in pair] + [settings.TIMELINE_BACKFILL],
+            )
+
+
+def remove_authors(pairs):
+    """
+    remove_author() for many (owner_id, author_id) pairs, in one statement.
+    """
+    if pairs:
+        with connection.cursor() as cursor:
+            cursor.execute(
+                REMOVE_AUTHORS.format(values=', '.join(['(%s, %s)'] * len(pairs))),
+                [value for pair in pairs for value in pair],
+            )
+
+
+def trim_timelines(max_length=None):
+    """
+    Delete the entries beyond the newest `max_length` of every timeline. Returns the number deleted.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(TRIM_TIMELINES, [max_length or settings.TIMELINE_MAX_LENGTH])
+        return cursor.rowcount
+
+
+def read_timeline(owner_id, size, after=None, expand=()):
+    """
+    Return (posts, last_values) for one page of a user's home timeline: the
+    pushed entries merged with the pulled posts of the authors they follow.
+    `after` is the (CreatedAt, PostID) of the previous page's last post.
+    last_values is None on the last page. Runs two indexed queries of at most
+    size + 1 rows each, with the `expand` relations joined in. Raises
+    InvalidCursor when `after` does not hold a datetime and a post ID.
+    """
+    entries = entry_seek.seek(TimelineEntry.objects.filter(OwnerID=owner_id), after).select_related('PostID')
+    pushed = []
+    for entry in expand_posts(entries, expand, prefix='PostID__')[:size + 1]:
+        if 'reply_count' in expand:
+            entry.PostID.ReplyCount = entry.ReplyCount
+        pushed.append(entry.PostID)
+
+    # Read by the post's own state, not the author's follower count, which
+    # may have crossed the limit since
+    followed = Follow.objects.filter(FollowerID=owner_id).values('FolloweeID')
+    pulled = post_seek.seek(Post.objects.filter(UserID__in=followed, Pulled=True), after)
+    pulled = list(expand_posts(pulled, expand)[:size + 1])
+
+    # A post being fanned out, or backfilled on follow, may be in both sources
+    merged = {post.PostID: post for post in pushed + pulled}
+    posts = sorted(merged.values(), key=lambda post: (post.CreatedAt, post.PostID), reverse=True)
+    if len(posts) <= size:
+        return posts, None
+
+    posts = posts[:size]
+    return posts, (posts[-1].CreatedAt, posts[-1].PostID)
@@ -0,0 +1,47 @@
+import math
+
+from django.db import connection
+
+# Scores are anchored at 2025-01-01 so they stay small. Every 45000 seconds
+# (12.5 hours) of recency is worth one order of magnitude of net votes, which
+# gives the feed its time decay without having to re-rank old posts.
+SCORE_EPOCH = 1735689600
+SCORE_DECAY_SECONDS = 45000
+
+REFRESH_TRENDING_SCORES = """
+UPDATE posts
+SET trending_score = scores.score
+FROM (
+    SELECT postid,
+           SIGN(upvote_count - downvote_count)
+               * LOG(GREATEST(ABS(upvote_count - downvote_count), 1))
+               + (EXTRACT(EPOCH FROM created_at) - %(epoch)s) / %(decay)s AS score
+    FROM posts
+    WHERE created_at >= %(since)s
+) AS scores
+WHERE posts.postid = scores.postid
+  AND posts.trending_score IS DISTINCT FROM scores.score;
+"""
+
+
+def hot_score(upvotes, downvotes, created_at):
+    """
+    Time-decayed score of a post: log10 of its net votes plus a recency bonus.
+    """
+    net = upvotes - downvotes
+    sign = (net > 0) - (net < 0)
+    return sign * math.log10(max(abs(net), 1)) + (created_at.timestamp() - SCORE_EPOCH) / SCORE_DECAY_SECONDS
+
+
+def refresh_trending_scores(since):
+    """
+    Recompute the stored trending score of every post created after `since`.
+    Only rows whose score actually changed are rewritten. Returns the number of updated posts.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(REFRESH_TRENDING_SCORES, {
+            "epoch": SCORE_EPOCH,
+            "decay": SCORE_DECAY_SECONDS,
+            "since": since,
+        })
+        return cursor.rowcount
@@ -2,20 +2,41 @@
 from django.urls import path
 from .views import UserListView, PostListView, FollowerListView, PromptListView, GetPromptView, GetUserByIdView, TotalVotesView
 from .views import UpdateVotesView, RegisterUserView, GetRepliesView, LoginUserView, GetUserPostsView, GetPromptsByCategoryView, GetPostView
+from .views import TrendingPostsView, TimelineView, FollowUserView, UnfollowUserView, GetFollowersView, GetFollowingView
+from .views import CacheStatsView, UserStatsView, PostThreadView, SearchView, DailyPromptView, BatchWriteView, MetricsView
+from .views import AvatarUploadView, RecommendationsView, PostStanceView, PromptStanceView, CategoryStanceView
 
 urlpatterns = [
     path('users/', UserListView.as_view(), name='user-list'),
     path('posts/', PostListView.as_view(), name='post-list'),
+    path('posts/trending/', TrendingPostsView.as_view(), name='trending-posts'),
     path('users/<int:userid>/followers/', FollowerListView.as_view(), name='follower-list'),
     path('prompts/', PromptListView.as_view(), name='prompt-list'),
     path('login/', LoginUserView.as_view(), name='login'),
     path('posts/<str:vote_type>/<int:post_id>/', UpdateVotesView.as_view(), name='update-votes'),
     path('register/', RegisterUserView.as_view(), name='register'),
     path('posts/<int:post_id>/replies/', GetRepliesView.as_view(), name='get_replies'),
+    path('posts/<int:post_id>/thread/', PostThreadView.as_view(), name='post-thread'),
+    path('posts/<int:post_id>/stance/', PostStanceView.as_view(), name='post-stance'),
     path('prompt/<int:prompt_id>/', GetPromptView.as_view(), name='get_prompt'),
+    path('prompt/<int:prompt_id>/stance/', PromptStanceView.as_view(), name='prompt-stance'),
     path('user/<int:user_id>/posts/', GetUserPostsView.as_view(), name='user-posts'),
     path('user/<int:user_id>/', GetUserByIdView.as_view(), name='get_user_by_id'),
+    path('user/<int:user_id>/follow/', FollowUserView.as_view(), name='follow-user'),
+    path('user/<int:user_id>/unfollow/', UnfollowUserView.as_view(), name='unfollow-user'),
+    path('user/<int:user_id>/avatar/', AvatarUploadView.as_view(), name='user-avatar'),
+    path('user/<int:user_id>/followers/', GetFollowersView.as_view(), name='user-followers'),
+    path('user/<int:user_id>/following/', GetFollowingView.as_view(), name='user-following'),
+    path('user/<int:user_id>/timeline/', TimelineView.as_view(), name='user-timeline'),
+    path('user/<int:user_id>/recommendations/', RecommendationsView.as_view(), name='user-recommendations'),
+    path('daily/', DailyPromptView.as_view(), name='daily-prompt'),
     path('prompts/category/<str:category>/', GetPromptsByCategoryView.as_view(), name='get-prompts-by-category'),
+    path('prompts/category/<str:category>/stance/', CategoryStanceView.as_view(), name='category-stance'),
     path('user/<int:user_id>/total-votes/', TotalVotesView.as_view(), name='get-user-total-votes'),
+    path('user/<int:user_id>/stats/', UserStatsView.as_view(), name='user-stats'),
     path('posts/<int:post_id>/', GetPostView.as_view(), name='get-post'),
+    path('batch/', BatchWriteView.as_view(), name='batch'),
+    path('search/', SearchView.as_view(), name='search'),
+    path('cache/stats/', CacheStatsView.as_view(), name='cache-stats'),
+    path('metrics/', MetricsView.as_view(), name='metrics'),
 ]
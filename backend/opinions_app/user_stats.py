@@ -0,0 +1,156 @@
+from collections import defaultdict
+
+from django.db import connection, transaction
+
+from .response_cache import invalidate, invalidate_on_commit
+
+# Model field -> user_stats column, in VALUES order
+STAT_COLUMNS = {
+    'TotalUpvotes': 'total_upvotes',
+    'TotalDownvotes': 'total_downvotes',
+    'PostCount': 'post_count',
+    'ReplyCount': 'reply_count',
+    'AgreeReceived': 'agree_received',
+    'DisagreeReceived': 'disagree_received',
+}
+
+# Creates the row on a user's first write, otherwise increments it in place
+ADJUST_USER_STATS = """
+INSERT INTO user_stats (user_id, {columns})
+VALUES {values}
+ON CONFLICT (user_id) DO UPDATE SET
+{increments};
+"""
+
+# User.ReplyPoints is a point per reply written, kept in step with ReplyCount
+ADJUST_REPLY_POINTS = """
+UPDATE users SET reply_points = users.reply_points + deltas.points
+FROM (VALUES {values}) AS deltas (user_id, points)
+WHERE users.userid = deltas.user_id;
+"""
+
+# For writes that must not create rows, e.g. deletes cascading from a deleted user
+UPDATE_USER_STATS = """
+UPDATE user_stats SET
+{increments}
+FROM (VALUES {values}) AS deltas (user_id, {columns})
+WHERE user_stats.user_id = deltas.user_id;
+"""
+
+REBUILD_USER_STATS = """
+INSERT INTO user_stats (user_id, total_upvotes, total_downvotes, post_count, reply_count, agree_received, disagree_received)
+SELECT users.userid,
+       COALESCE(posted.upvotes, 0),
+       COALESCE(posted.downvotes, 0),
+       COALESCE(posted.posts, 0),
+       COALESCE(written.replies, 0),
+       COALESCE(received.agree, 0),
+       COALESCE(received.disagree, 0)
+FROM users
+LEFT JOIN (
+    SELECT user_id, SUM(upvote_count) AS upvotes, SUM(downvote_count) AS downvotes, COUNT(*) AS posts
+    FROM posts GROUP BY user_id
+) AS posted ON posted.user_id = users.userid
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS replies
+    FROM replies GROUP BY user_id
+) AS written ON written.user_id = users.userid
+LEFT JOIN (
+    SELECT posts.user_id,
+           COUNT(*) FILTER (WHERE replies.isagree) AS agree,
+           COUNT(*) FILTER (WHERE NOT replies.isagree) AS disagree
+    FROM replies JOIN posts ON posts.postid = replies.post_id
+    GROUP BY posts.user_id
+) AS received ON received.user_id = users.userid
+ON CONFLICT (user_id) DO UPDATE SET
+    total_upvotes = EXCLUDED.total_upvotes,
+    total_downvotes = EXCLUDED.total_downvotes,
+    post_count = EXCLUDED.post_count,
+    reply_count = EXCLUDED.reply_count,
+    agree_received = EXCLUDED.agree_received,
+    disagree_received = EXCLUDED.disagree_received
+RETURNING user_id;
+"""
+
+REBUILD_REPLY_POINTS = """
+UPDATE users SET reply_points = COALESCE(written.replies, 0)
+FROM users AS counted
+LEFT JOIN (
+    SELECT user_id, COUNT(*) AS replies
+    FROM replies GROUP BY user_id
+) AS written ON written.user_id = counted.userid
+WHERE users.userid = counted.userid
+  AND users.reply_points IS DISTINCT FROM COALESCE(written.replies, 0)
+RETURNING users.userid;
+"""
+
+# Tags invalidated per cache round trip after a rebuild
+INVALIDATE_BATCH = 1000
+
+
+def adjust_user_stats(deltas, create=True):
+    """
+    Add {user_id: {'PostCount': 1, ...}} to the users' stats with a single
+    statement, and their ReplyCount changes to User.ReplyPoints with a
+    second. Missing fields count as 0. Rows are created on demand unless
+    `create` is False, in which case users without a row are skipped.
+    """
+    rows = sorted(
+        (user_id, [fields.get(field, 0) for field in STAT_COLUMNS])
+        for user_id, fields in deltas.items()
+        if any(fields.values())
+    )
+    if not rows:
+        return
+
+    columns = list(STAT_COLUMNS.values())
+    source = 'EXCLUDED' if create else 'deltas'
+    query = (ADJUST_USER_STATS if create else UPDATE_USER_STATS).format(
+        columns=', '.join(columns),
+        values=', '.join(['(%s' + ', %s' * len(columns) + ')'] * len(rows)),
+        increments=',\n'.join(f'    {column} = user_stats.{column} + {source}.{column}' for column in columns),
+    )
+    # Sorted so that concurrent writers lock rows in the same order
+    params = [value for user_id, values in rows for value in (user_id, *values)]
+    reply_index = list(STAT_COLUMNS).index('ReplyCount')
+    points = [(user_id, values[reply_index]) for user_id, values in rows if values[reply_index]]
+    with connection.cursor() as cursor:
+        cursor.execute(query, params)
+        if points:
+            # After user_stats, in the same user order, like every writer of both
+            cursor.execute(
+                ADJUST_REPLY_POINTS.format(values=', '.join(['(%s, %s)'] * len(points))),
+                [value for point in points for value in point],
+            )
+    invalidate_on_commit(*[f'user_stats:{user_id}' for user_id, _ in rows], *[f'user:{user_id}' for user_id, _ in points])
+
+
+def vote_stats_deltas(authored_deltas):
+    """
+    Sum [(author_id, (upvotes, downvotes)), ...] per author, as adjust_user_stats deltas.
+    """
+    deltas = defaultdict(lambda: {'TotalUpvotes': 0, 'TotalDownvotes': 0})
+    for author_id, (up, down) in authored_deltas:
+        deltas[author_id]['TotalUpvotes'] += up
+        deltas[author_id]['TotalDownvotes'] += down
+    return deltas
+
+
+def rebuild_user_stats():
+    """
+    Recompute every user's stats and ReplyPoints from the posts and replies
+    tables, and invalidate their cached responses. Returns the number of users.
+    """
+    with transaction.atomic(), connection.cursor() as cursor:
+        # Writers queue on the lock instead of having increments overwritten
+        # by totals computed before they committed. They write user_stats
+        # before users, so the lock covers ReplyPoints too.
+        cursor.execute('LOCK TABLE user_stats IN EXCLUSIVE MODE;')
+        cursor.execute(REBUILD_USER_STATS)
+        rebuilt = [user_id for user_id, in cursor.fetchall()]
+        cursor.execute(REBUILD_REPLY_POINTS)
+        repointed = [user_id for user_id, in cursor.fetchall()]
+    tags = [f'user_stats:{user_id}' for user_id in rebuilt] + [f'user:{user_id}' for user_id in repointed]
+    for i in range(0, len(tags), INVALIDATE_BATCH):
+        invalidate(*tags[i:i + INVALIDATE_BATCH])
+    return len(rebuilt)
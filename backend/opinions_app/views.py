@@ -1,10 +1,31 @@
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from .models import User, Post, Prompt, Reply
-from .serializers import UserSerializer, PostSerializer, PromptSerializer, ReplySerializer
+from rest_framework.parsers import MultiPartParser
+from .models import User, Post, Prompt, Reply, Follow, UserStats, DailyResponse, Recommendation
+from .serializers import UserSerializer, PostSerializer, PromptSerializer, ReplySerializer, UserStatsSerializer
+from .fast_serializers import row_serializer
+from .pagination import KeysetPaginator, InvalidCursor, encode_cursor, decode_cursor
+from .votes import VOTE_TYPES, record_vote
+from .follows import follow, unfollow
+from .timeline import add_post, read_timeline
+from .expand import POST_EXPANSIONS, REPLY_EXPANSIONS, parse_expand, expand_posts, expand_replies, reply_count
+from .response_cache import cached_response, get_stats as get_cache_stats
+from .search import SEARCH_MODELS, search_queryset
+from .daily import get_daily_prompt
+from .batch import apply_batch
+from .routers import replica_reads
+from .throttling import take_item_tokens
+from .metrics import PROMETHEUS_CONTENT_TYPE, format_metrics
+from .analytics import PERIODS, stance_tag, stance_trend
+from .avatars import AvatarUploadHandler, HashedUpload, avatar_urls, check_image, has_thumbnails, process_avatar, set_profile_picture
+from django.conf import settings
+from django.db import IntegrityError, transaction
+from django.http import HttpResponse
 from django.shortcuts import redirect
 from django.contrib.auth import logout
+from django.utils import timezone
+from django.utils.dateparse import parse_date
 from dotenv import load_dotenv
 import os
 import requests
@@ -14,13 +35,110 @@ logger = logging.getLogger(__name__)
 
 load_dotenv()
 
+trending_paginator = KeysetPaginator(('-TrendingScore', '-PostID'))
+user_paginator = KeysetPaginator(('UserID',))
+prompt_paginator = KeysetPaginator(('PromptID',))
+post_paginator = KeysetPaginator(('-CreatedAt', '-PostID'))  # Newest first
+reply_paginator = KeysetPaginator(('CreatedAt', 'ReplyID'))  # Oldest first, in conversation order
+daily_paginator = KeysetPaginator(('-Score', '-PostID_id'))  # Most net votes first
+follower_paginator = KeysetPaginator(('FollowerID_id',), default_size=100, max_size=1000)
+following_paginator = KeysetPaginator(('FolloweeID_id',), default_size=100, max_size=1000)
+# (type, sort) -> paginator of search results
+search_paginators = {
+    ('posts', 'rank'): KeysetPaginator(('-Rank', '-PostID')),
+    ('posts', 'recent'): post_paginator,
+    ('replies', 'rank'): KeysetPaginator(('-Rank', '-ReplyID')),
+    ('replies', 'recent'): KeysetPaginator(('-ReplyID',)),
+    ('prompts', 'rank'): KeysetPaginator(('-Rank', '-PromptID')),
+    ('prompts', 'recent'): KeysetPaginator(('-PromptID',)),
+}
+
+
+def post_cache_tags(kwargs):
+    # The post, its replies and stance counts, plus the prompt and authors
+    # shown with it: changes to those bump thread:<post_id> (see signals.py)
+    post_id = kwargs['post_id']
+    return [f"post:{post_id}", f"replies:{post_id}", f"thread:{post_id}"]
+
+
+def daily_cache_tags(kwargs):
+    # Rescheduling a date, or editing an author shown, invalidates every date;
+    # so does any prompt change. Votes and new posts do not: entries simply
+    # expire after DAILY_CACHE_TTL seconds.
+    return ["daily", "prompts"]
+
+
+def parse_id(value):
+    """
+    A user or post ID from a request body (a number or a string of digits) as
+    an int. Raises ValueError for anything else, which would otherwise only
+    fail in the database.
+    """
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(value)
+    value = int(value)
+    if not 1 <= value <= 2 ** 31 - 1:
+        raise ValueError(value)
+    return value
+
+
+def follow_list_response(request, user_id, key):
+    """
+    One page of the user IDs following `user_id` (key="followers") or followed
+    by it (key="following"), along with the maintained total count.
+    """
+    count_field = 'FollowerCount' if key == "followers" else 'FollowingCount'
+    try:
+        count = User.objects.values_list(count_field, flat=True).get(pk=user_id)
+    except User.DoesNotExist:
+        return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    if key == "followers":
+        paginator, edges, id_field = follower_paginator, Follow.objects.filter(FolloweeID=user_id), 'FollowerID_id'
+    else:
+        paginator, edges, id_field = following_paginator, Follow.objects.filter(FollowerID=user_id), 'FolloweeID_id'
+
+    try:
+        page, next_cursor = paginator.paginate(edges.only('FollowID', id_field), request)
+    except InvalidCursor:
+        return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = paginator.get_paginated_response([getattr(edge, id_field) for edge in page], next_cursor, request, key=key)
+    response.data["count"] = count
+    return response
+
+
+def stance_trend_response(request, scope, key):
+    """
+    The trend of a post, prompt or category over the last ?buckets= (default:
+    48 hours or 30 days) of ?period= hour or day (the default).
+    """
+    period = request.query_params.get('period', 'day')
+    if period not in PERIODS:
+        return Response({"error": "Invalid period. Use hour or day."}, status=status.HTTP_400_BAD_REQUEST)
+    try:
+        buckets = int(request.query_params.get('buckets', 48 if period == 'hour' else 30))
+    except ValueError:
+        buckets = 0
+    if not 1 <= buckets <= settings.ANALYTICS_MAX_BUCKETS:
+        return Response(
+            {"error": f"Invalid buckets. Use 1 to {settings.ANALYTICS_MAX_BUCKETS}."},
+            status=status.HTTP_400_BAD_REQUEST,
+        )
+    return Response(stance_trend(scope, key, period, buckets), status=status.HTTP_200_OK)
 
 
 class UserListView(APIView):
+    throttle_scope = 'register'
+
+    @replica_reads
     def get(self, request):
         users = User.objects.all()
-        serializer = UserSerializer(users, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            data, next_cursor = user_paginator.paginate_rows(users, request, row_serializer(UserSerializer))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return user_paginator.get_paginated_response(data, next_cursor, request)
 
     def post(self, request):
         serializer = UserSerializer(data=request.data)
@@ -31,48 +149,154 @@ class UserListView(APIView):
 
 
 class PostListView(APIView):
+    throttle_scope = 'write'
+    throttle_user_field = 'UserID'
+
+    @replica_reads
     def get(self, request):
-        posts = Post.objects.all()
-        serializer = PostSerializer(posts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        expand = parse_expand(request, POST_EXPANSIONS)
+        posts = expand_posts(Post.objects.all(), expand)
+        try:
+            data, next_cursor = post_paginator.paginate_rows(posts, request, row_serializer(PostSerializer, frozenset(expand)))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return post_paginator.get_paginated_response(data, next_cursor, request)
 
     def post(self, request):
         serializer = PostSerializer(data=request.data)
         if serializer.is_valid():
-            serializer.save()
+            post = serializer.save(Pulled=True)
+            add_post(post)
             return Response(serializer.data, status=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class TimelineView(APIView):
+    def get(self, request, user_id):
+        """
+        Get a page of the user's home timeline: posts by the users they follow, newest first.
+        """
+        if not User.objects.filter(pk=user_id).exists():
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        expand = parse_expand(request, POST_EXPANSIONS)
+        cursor = request.query_params.get('cursor')
+        try:
+            after = decode_cursor(cursor, 2) if cursor else None
+            posts, last = read_timeline(user_id, post_paginator.get_page_size(request), after, expand)
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        next_cursor = encode_cursor(last) if last else None
+
+        serializer = PostSerializer(posts, many=True, context={'expand': expand})
+        return post_paginator.get_paginated_response(serializer.data, next_cursor, request, key="posts")
+
+
+class RecommendationsView(APIView):
+    @replica_reads
+    def get(self, request, user_id):
+        """
+        The user's "for you" prompts and categories with a page of recommended
+        posts, best first, as precomputed by recommendations.py. Users with no
+        lists yet get the newest prompts and the trending posts, with
+        `personalized` false.
+        """
+        if not User.objects.filter(pk=user_id).exists():
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        cursor = request.query_params.get('cursor')
+        try:
+            offset = decode_cursor(cursor, 1)[0] if cursor else 0
+            if not isinstance(offset, int) or offset < 0:
+                raise InvalidCursor(cursor)
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        lists = Recommendation.objects.filter(pk=user_id).values_list('PostIDs', 'PromptIDs', 'Categories', 'ComputedAt').first()
+        if lists is not None:
+            post_ids, prompt_ids, categories, computed_at = lists
+        else:
+            post_ids = list(Post.objects.order_by('-TrendingScore', '-PostID').values_list('PostID', flat=True)[:settings.RECOMMEND_POSTS])
+            prompt_ids = list(Prompt.objects.order_by('-PromptID').values_list('PromptID', flat=True)[:settings.RECOMMEND_PROMPTS])
+            categories, computed_at = [], None
+
+        # The lists are fixed, so a cursor is a position in them; posts and prompts deleted since are skipped
+        size = post_paginator.get_page_size(request)
+        page_ids = post_ids[offset:offset + size]
+        expand = parse_expand(request, POST_EXPANSIONS)
+        posts = expand_posts(Post.objects.filter(pk__in=page_ids), expand).in_bulk()
+        prompts = Prompt.objects.in_bulk(prompt_ids)
+        next_cursor = encode_cursor([offset + size]) if offset + size < len(post_ids) else None
+
+        data = PostSerializer([posts[post_id] for post_id in page_ids if post_id in posts], many=True, context={'expand': expand}).data
+        response = post_paginator.get_paginated_response(data, next_cursor, request, key="posts")
+        response.data = {
+            "personalized": lists is not None,
+            "computed_at": computed_at.isoformat() if computed_at else None,
+            "categories": categories,
+            "prompts": PromptSerializer([prompts[prompt_id] for prompt_id in prompt_ids if prompt_id in prompts], many=True).data,
+            **response.data,
+        }
+        return response
+
+
+class TrendingPostsView(APIView):
+    @replica_reads
+    def get(self, request):
+        """
+        Get posts ranked by their precomputed trending score, optionally filtered by prompt category.
+        """
+        expand = parse_expand(request, POST_EXPANSIONS)
+        posts = expand_posts(Post.objects.all(), expand)
+        category = request.query_params.get('category')
+        if category:
+            posts = posts.filter(PromptID__Category=category)
+
+        try:
+            data, next_cursor = trending_paginator.paginate_rows(posts, request, row_serializer(PostSerializer, frozenset(expand)))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        return trending_paginator.get_paginated_response(data, next_cursor, request, key="posts")
+
+
 class FollowerListView(APIView):
+    throttle_scope = 'write'
+    throttle_user_field = 'follower_id'
+
+    @replica_reads
     def get(self, request, userid):
-        try:
-            user = User.objects.get(pk=userid)
-            followers = user.Followers or []
-            return Response({"followers": followers}, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
-            return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
+        return follow_list_response(request, userid, "followers")
 
     def post(self, request, userid):
+        follower_id = request.data.get("follower_id")
+        if not follower_id:
+            return Response({"error": "Follower ID is required"}, status=status.HTTP_400_BAD_REQUEST)
         try:
-            user = User.objects.get(pk=userid)
-            follower_id = request.data.get("follower_id")
-            if not follower_id:
-                return Response({"error": "Follower ID is required"}, status=status.HTTP_400_BAD_REQUEST)
-            user.Followers.append(follower_id)
-            user.save()
-            return Response({"message": "Follower added successfully"}, status=status.HTTP_200_OK)
-        except User.DoesNotExist:
+            follower_id = parse_id(follower_id)
+        except ValueError:
+            return Response({"error": "Invalid follower ID"}, status=status.HTTP_400_BAD_REQUEST)
+        if follower_id == userid:
+            return Response({"error": "Users cannot follow themselves"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            follow(follower_id, userid)
+        except IntegrityError:
             return Response({"error": "User not found"}, status=status.HTTP_404_NOT_FOUND)
-        except Exception as e:
-            return Response({"error": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        return Response({"message": "Follower added successfully"}, status=status.HTTP_200_OK)
 
 
 class PromptListView(APIView):
+    throttle_scope = 'write'
+
+    @replica_reads
     def get(self, request):
         prompts = Prompt.objects.all()
-        serializer = PromptSerializer(prompts, many=True)
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        try:
+            data, next_cursor = prompt_paginator.paginate_rows(prompts, request, row_serializer(PromptSerializer))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+        return prompt_paginator.get_paginated_response(data, next_cursor, request)
 
     def post(self, request):
         serializer = PromptSerializer(data=request.data)
@@ -82,6 +306,7 @@ class PromptListView(APIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 class GetPromptView(APIView):
+    @cached_response(ttl=300, tags=lambda kwargs: [f"prompt:{kwargs['prompt_id']}"])
     def get(self, request, prompt_id):
         """
         Retrieve a Prompt by its ID.
@@ -98,23 +323,28 @@ class GetPromptView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class GetPostView(APIView):
+    @cached_response(ttl=60, tags=post_cache_tags)
     def get(self, request, post_id):
         """
-        Retrieve a Prompt by its ID.
+        Retrieve a Post by its ID. Supports ?expand=prompt,author,reply_count.
         """
+        expand = parse_expand(request, POST_EXPANSIONS)
         try:
-            # Fetch the Prompt object by ID
-            post = Post.objects.get(pk=post_id)
-        except Prompt.DoesNotExist:
-            # Return a 404 error if the Prompt does not exist
+            # Fetch the Post object by ID, with any requested relations
+            post = expand_posts(Post.objects.all(), expand).get(pk=post_id)
+        except Post.DoesNotExist:
+            # Return a 404 error if the Post does not exist
             return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Serialize the Prompt object
-        serializer = PostSerializer(post)
+        # Serialize the Post object
+        serializer = PostSerializer(post, context={'expand': expand})
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 class LoginUserView(APIView):
+    throttle_scope = 'login'
+    throttle_user_field = 'Username'
+
     def post(self, request):
         username = request.data.get('Username')
         if username:
@@ -125,86 +355,158 @@ class LoginUserView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class UpdateVotesView(APIView):
+    throttle_scope = 'vote'
+    throttle_user_field = 'user_id'
+
     def post(self, request, post_id, vote_type):
+        """
+        Upvote or downvote a post. Passing `user_id` makes the vote idempotent:
+        repeating it is a no-op and voting the other way switches it.
+        """
+        if vote_type not in VOTE_TYPES:
+            return Response({"error": "Invalid vote type. Use 'upvote' or 'downvote'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        user_id = request.data.get('user_id')
+        try:
+            user_id = parse_id(user_id) if user_id not in (None, '') else None
+        except ValueError:
+            return Response({"error": "Invalid user_id."}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
-            post = Post.objects.get(pk=post_id)  
+            post = record_vote(post_id, vote_type, user_id=user_id)
         except Post.DoesNotExist:
             return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        if vote_type == 'upvote':
-            post.UpvoteCount += 1  
-        elif vote_type == 'downvote':
-            post.DownvoteCount += 1  
-        else:
-            return Response({"error": "Invalid vote type. Use 'upvote' or 'downvote'."}, status=status.HTTP_400_BAD_REQUEST)
-
-        post.save()  
+        except IntegrityError:
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
         serializer = PostSerializer(post)
         return Response(serializer.data, status=status.HTTP_200_OK)
     
+class BatchWriteView(APIView):
+    throttle_scope = 'batch'
+
+    def post(self, request):
+        """
+        Apply a client's queued writes in one transaction, e.g. when it comes
+        back online. Takes any of:
+
+            "votes": [{"post_id", "vote_type", "user_id"}, ...]
+            "replies": [{"PostID", "UserID", "ReplyText", "isAgree"}, ...]
+            "follows": [{"op": "follow" or "unfollow", "follower_id", "followee_id"}, ...]
+
+        and returns the same keys with a result per item, in order: the
+        `status` and body the single-item endpoint would have returned. Each
+        item counts against the rate limits of that endpoint.
+        """
+        if not isinstance(request.data, dict):
+            return Response({"error": "Expected an object of item lists."}, status=status.HTTP_400_BAD_REQUEST)
+        lists = {}
+        for key in ("votes", "replies", "follows"):
+            items = request.data.get(key, [])
+            if not isinstance(items, list):
+                return Response({"error": f"'{key}' must be a list."}, status=status.HTTP_400_BAD_REQUEST)
+            lists[key] = items
+        if sum(len(items) for items in lists.values()) > settings.BATCH_MAX_ITEMS:
+            return Response({"error": f"A batch holds at most {settings.BATCH_MAX_ITEMS} items."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Each item costs what its single-item request would: a batch is no
+        # way around the per-IP and per-user vote and write rates
+        item_users = {
+            'vote': [item.get('user_id') if isinstance(item, dict) else None for item in lists["votes"]],
+            'write': [item.get('UserID') if isinstance(item, dict) else None for item in lists["replies"]]
+            + [item.get('follower_id') if isinstance(item, dict) else None for item in lists["follows"]],
+        }
+        for scope, users in item_users.items():
+            delay = take_item_tokens(request, scope, users)
+            if delay is None:
+                return Response(
+                    {"error": f"Too many {scope} items for one batch at the current rate limits. Split it."},
+                    status=status.HTTP_400_BAD_REQUEST,
+                )
+            if delay:
+                self.throttled(request, delay)
+
+        try:
+            with transaction.atomic():
+                results = apply_batch(**lists)
+        except IntegrityError:
+            return Response({"error": "A post or user was deleted while the batch ran. Retry it."}, status=status.HTTP_409_CONFLICT)
+        return Response(results, status=status.HTTP_200_OK)
+
+
 class FollowUserView(APIView):
+    throttle_scope = 'write'
+    throttle_user_field = 'follower_user_id'
+
     def post(self, request, user_id):
         follower_user_id = request.data.get('follower_user_id')  
 
         if not follower_user_id:
             return Response({"error": "Follower user ID is required."}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            follower_user_id = parse_id(follower_user_id)
+        except ValueError:
+            return Response({"error": "Invalid follower user ID."}, status=status.HTTP_400_BAD_REQUEST)
+        if follower_user_id == user_id:
+            return Response({"error": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
+        # Insert the follow edge; the foreign keys reject unknown users
         try:
-            target_user = User.objects.get(pk=user_id)  # Get the target user by ID
-            follower_user = User.objects.get(pk=follower_user_id)  # Get the follower user by ID
-        except User.DoesNotExist:
+            created = follow(follower_user_id, user_id)
+        except IntegrityError:
             return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Check if the user is already following the target user
-        if follower_user_id in target_user.Followers:
+        # Check if the user was already following the target user
+        if not created:
             return Response({"message": "You are already following this user."}, status=status.HTTP_200_OK)
 
-        # Add the follower's user ID to the target user's followers list
-        target_user.Followers.append(follower_user_id)
-        target_user.save()
-
         return Response({"message": "User followed successfully."}, status=status.HTTP_200_OK)
 
 class UnfollowUserView(APIView):
+    throttle_scope = 'write'
+    throttle_user_field = 'follower_user_id'
+
     def post(self, request, user_id):
         """
-        Unfollow a user by removing the follower's user ID from the target user's followers list.
+        Unfollow a user by deleting the follow edge between the two users.
         """
         follower_user_id = request.data.get('follower_user_id')  # The ID of the user who wants to unfollow
 
         if not follower_user_id:
             return Response({"error": "Follower user ID is required."}, status=status.HTTP_400_BAD_REQUEST)
-
         try:
-            target_user = User.objects.get(pk=user_id)  # Get the target user by ID
-            follower_user = User.objects.get(pk=follower_user_id)  # Get the follower user by ID
-        except User.DoesNotExist:
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
-
-        # Check if the user is following the target user
-        if follower_user_id not in target_user.Followers:
+            follower_user_id = parse_id(follower_user_id)
+        except ValueError:
+            return Response({"error": "Invalid follower user ID."}, status=status.HTTP_400_BAD_REQUEST)
+
+        # Check if the user was following the target user
+        if not unfollow(follower_user_id, user_id):
+            # Only looked up when there was no edge to delete
+            if User.objects.filter(pk__in={follower_user_id, user_id}).count() < len({follower_user_id, user_id}):
+                return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
             return Response({"message": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Remove the follower's user ID from the target user's followers list
-        target_user.Followers.remove(follower_user_id)
-        target_user.save()
-
         return Response({"message": "User unfollowed successfully."}, status=status.HTTP_200_OK)
 
 class GetFollowersView(APIView):
+    @replica_reads
     def get(self, request, user_id):
         """
-        Get the list of followers for a specific user.
+        Get a page of the IDs of the users following a specific user.
         """
-        try:
-            user = User.objects.get(pk=user_id)
-        except User.DoesNotExist:
-            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        return follow_list_response(request, user_id, "followers")
 
-        return Response({"followers": user.Followers}, status=status.HTTP_200_OK)
+class GetFollowingView(APIView):
+    @replica_reads
+    def get(self, request, user_id):
+        """
+        Get a page of the IDs of the users a specific user follows.
+        """
+        return follow_list_response(request, user_id, "following")
 
 class RegisterUserView(APIView):
+    throttle_scope = 'register'
+
     def post(self, request):
         username = request.data.get('Username')
         if not username:
@@ -216,11 +518,46 @@ class RegisterUserView(APIView):
             ProfilePicture=None,  # Default profile picture
             Bio="",
             ReplyPoints=0,
-            Followers=[]  # Default empty followers list
         )
         user.save()
         serializer = UserSerializer(user, many=False)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+
+class AvatarUploadView(APIView):
+    throttle_scope = 'avatar'
+    parser_classes = [MultiPartParser]
+
+    def initialize_request(self, request, *args, **kwargs):
+        # Before anything reads the body, which would buffer small uploads in memory
+        request.upload_handlers = [AvatarUploadHandler(request)]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def post(self, request, user_id):
+        """
+        Upload a profile picture as the multipart field `file`. Thumbnails are
+        made in the background and the picture replaces the user's once they
+        exist (202); an image uploaded before is used at once (200).
+        """
+        if not User.objects.filter(pk=user_id).exists():
+            return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        upload = request.data.get('file')
+        if request.upload_handlers[0].too_large:
+            return Response({"error": f"The file is too large; at most {settings.AVATAR_MAX_BYTES} bytes."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if not isinstance(upload, HashedUpload):
+            return Response({"error": "Missing file."}, status=status.HTTP_400_BAD_REQUEST)
+
+        if has_thumbnails(upload.digest):
+            os.remove(upload.temporary_file_path())
+            set_profile_picture(user_id, upload.digest)
+            return Response({"ProfilePictureSizes": avatar_urls(upload.digest)}, status=status.HTTP_200_OK)
+
+        error = check_image(upload.temporary_file_path())
+        if error:
+            os.remove(upload.temporary_file_path())
+            return Response({"error": error}, status=status.HTTP_400_BAD_REQUEST)
+        process_avatar(user_id, upload)
+        return Response({"ProfilePictureSizes": avatar_urls(upload.digest)}, status=status.HTTP_202_ACCEPTED)
     
 from rest_framework.views import APIView
 from rest_framework.response import Response
@@ -229,22 +566,28 @@ from .models import Post, Reply
 from .serializers import ReplySerializer
 
 class GetRepliesView(APIView):
+    throttle_scope = 'write'
+    throttle_user_field = 'UserID'
+
+    @replica_reads
     def get(self, request, post_id):
         """
-        Get all replies for a specific post.
+        Get a page of replies for a specific post, oldest first.
         """
         try:
             post = Post.objects.get(pk=post_id)  # Get the post by ID
         except Post.DoesNotExist:
             return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Fetch all replies for the post
-        replies = Reply.objects.filter(PostID=post)
-
-        # Serialize the replies
-        reply_serializer = ReplySerializer(replies, many=True)
+        # Fetch one page of replies for the post
+        expand = parse_expand(request, REPLY_EXPANSIONS)
+        replies = expand_replies(Reply.objects.filter(PostID=post), expand)
+        try:
+            data, next_cursor = reply_paginator.paginate_rows(replies, request, row_serializer(ReplySerializer, frozenset(expand)))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
 
-        return Response({"replies": reply_serializer.data}, status=status.HTTP_200_OK)
+        return reply_paginator.get_paginated_response(data, next_cursor, request, key="replies")
 
     def post(self, request, post_id):
         """
@@ -268,24 +611,100 @@ class GetRepliesView(APIView):
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+class PostThreadView(APIView):
+    @cached_response(ttl=60, tags=post_cache_tags)
+    def get(self, request, post_id):
+        """
+        Everything the replies screen shows, in two queries: the post with its
+        prompt, author and agree/disagree counts, and the first page of replies
+        with their authors. Later pages come from `next_cursor`, as with
+        /posts/<id>/replies/.
+        """
+        posts = expand_posts(Post.objects.all(), {'prompt', 'author'}).annotate(
+            AgreeCount=reply_count(isAgree=True),
+            DisagreeCount=reply_count(isAgree=False),
+        )
+        try:
+            post = posts.get(pk=post_id)
+        except Post.DoesNotExist:
+            return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+
+        replies = expand_replies(Reply.objects.filter(PostID=post_id), {'author'})
+        try:
+            data, next_cursor = reply_paginator.paginate_rows(replies, request, row_serializer(ReplySerializer, frozenset({'author'})))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        response = reply_paginator.get_paginated_response(data, next_cursor, request, key="replies")
+        response.data = {
+            "post": PostSerializer(post, context={'expand': {'author'}}).data,
+            "prompt": PromptSerializer(post.PromptID).data if post.PromptID else None,
+            "stance": {"agree": post.AgreeCount, "disagree": post.DisagreeCount},
+            **response.data,
+        }
+        return response
+
+
+class DailyPromptView(APIView):
+    @cached_response(ttl=settings.DAILY_CACHE_TTL, tags=daily_cache_tags)
+    def get(self, request):
+        """
+        Today's prompt, or that of an earlier ?date=YYYY-MM-DD, with a page of
+        the posts answering it that day, most net votes first, each with its
+        author and `Score`. Read from the snapshot maintained by daily.py.
+        """
+        date = request.query_params.get('date')
+        if date:
+            try:
+                date = parse_date(date)
+            except ValueError:
+                date = None
+            if date is None:
+                return Response({"error": "Invalid date. Use YYYY-MM-DD."}, status=status.HTTP_400_BAD_REQUEST)
+            if date > timezone.localdate():
+                # Upcoming prompts stay a surprise
+                return Response({"error": "No daily prompt for this date."}, status=status.HTTP_404_NOT_FOUND)
+
+        daily = get_daily_prompt(date)
+        if daily is None:
+            return Response({"error": "No daily prompt for this date."}, status=status.HTTP_404_NOT_FOUND)
+
+        responses = DailyResponse.objects.filter(Date=daily.Date).select_related('PostID__UserID')
+        try:
+            page, next_cursor = daily_paginator.paginate(responses, request)
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = PostSerializer([row.PostID for row in page], many=True, context={'expand': {'author'}}).data
+        for item, row in zip(data, page):
+            item['Score'] = row.Score
+        response = daily_paginator.get_paginated_response(data, next_cursor, request, key="responses")
+        response.data = {
+            "date": daily.Date.isoformat(),
+            "prompt": PromptSerializer(daily.PromptID).data,
+            **response.data,
+        }
+        return response
+
 
 class GetUserPostsView(APIView):
+    @replica_reads
     def get(self, request, user_id):
         """
-        Get all posts for a specific user.
+        Get the posts of a specific user, newest first.
         """
+        # Fetch one page of posts by the user
+        expand = parse_expand(request, POST_EXPANSIONS)
+        posts = expand_posts(Post.objects.filter(UserID=user_id), expand)
         try:
-            # Fetch all posts by the user
-            posts = Post.objects.filter(UserID=user_id)
-        except Post.DoesNotExist:
-            return Response({"error": "No posts found for this user."}, status=status.HTTP_404_NOT_FOUND)
+            data, next_cursor = post_paginator.paginate_rows(posts, request, row_serializer(PostSerializer, frozenset(expand)))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
 
-        # Serialize the posts
-        post_serializer = PostSerializer(posts, many=True)
-
-        return Response({"posts": post_serializer.data}, status=status.HTTP_200_OK)
+        return post_paginator.get_paginated_response(data, next_cursor, request, key="posts")
     
 class GetUserByIdView(APIView):
+    @cached_response(ttl=60, tags=lambda kwargs: [f"user:{kwargs['user_id']}"])
     def get(self, request, user_id):
         """
         Retrieve a user by their ID.
@@ -302,46 +721,161 @@ class GetUserByIdView(APIView):
         return Response(serializer.data, status=status.HTTP_200_OK)
 
 class GetPromptsByCategoryView(APIView):
+    @cached_response(ttl=300, tags=lambda kwargs: ["prompts"])
     def get(self, request, category):
         """
-        Retrieve all prompts belonging to a specific category.
+        Retrieve a page of prompts belonging to a specific category.
         """
-        # Fetch prompts that match the given category
+        # Fetch one page of prompts that match the given category
         prompts = Prompt.objects.filter(Category=category)
+        try:
+            data, next_cursor = prompt_paginator.paginate_rows(prompts, request, row_serializer(PromptSerializer))
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
 
         # Check if any prompts exist for the given category
-        if not prompts.exists():
+        if not data and 'cursor' not in request.query_params:
             return Response({"error": "No prompts found for this category."}, status=status.HTTP_404_NOT_FOUND)
 
-        # Serialize the prompts
-        serializer = PromptSerializer(prompts, many=True)
-
-        return Response(serializer.data, status=status.HTTP_200_OK)
+        return prompt_paginator.get_paginated_response(data, next_cursor, request)
     
 class TotalVotesView(APIView):
+    @cached_response(ttl=60, tags=lambda kwargs: [f"user_stats:{kwargs['user_id']}"])
     def get(self, request, user_id):
         """
         Get the total number of upvotes and downvotes for all posts by a specific user.
         """
         try:
-            # Fetch all posts by the user
-            posts = Post.objects.filter(UserID=user_id)
-            
-            if not posts.exists():
-                return Response({"error": "No posts found for this user."}, status=status.HTTP_404_NOT_FOUND)
+            # Totals are maintained in user_stats, so this is a primary key lookup
+            stats = UserStats.objects.filter(UserID=user_id).first()
 
-            # Calculate total upvotes and downvotes
-            total_upvotes = sum(post.UpvoteCount for post in posts)
-            total_downvotes = sum(post.DownvoteCount for post in posts)
+            if stats is None or not stats.PostCount:
+                return Response({"error": "No posts found for this user."}, status=status.HTTP_404_NOT_FOUND)
 
             return Response(
                 {
                     "user_id": user_id,
-                    "total_upvotes": total_upvotes,
-                    "total_downvotes": total_downvotes,
+                    "total_upvotes": stats.TotalUpvotes,
+                    "total_downvotes": stats.TotalDownvotes,
                 },
                 status=status.HTTP_200_OK,
             )
         except Exception as e:
             return Response({"error": str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
- 
\ No newline at end of file
+
+
+class UserStatsView(APIView):
+    @cached_response(ttl=60, tags=lambda kwargs: [f"user_stats:{kwargs['user_id']}"])
+    def get(self, request, user_id):
+        """
+        Get a user's profile stats: vote totals, post and reply counts, and agree/disagree replies received.
+        """
+        stats = UserStats.objects.filter(UserID=user_id).first()
+        if stats is None:
+            # Users get a stats row on their first post or reply
+            if not User.objects.filter(UserID=user_id).exists():
+                return Response({"error": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+            stats = UserStats(UserID_id=user_id)
+        return Response(UserStatsSerializer(stats).data, status=status.HTTP_200_OK)
+
+
+class PostStanceView(APIView):
+    @cached_response(ttl=settings.ANALYTICS_CACHE_TTL, tags=lambda kwargs: [f"post:{kwargs['post_id']}", stance_tag('post', kwargs['post_id'])])
+    def get(self, request, post_id):
+        """
+        How the replies to a post and the votes on it moved over time: agree
+        and disagree replies, agree ratio and votes per hour of each hour or
+        day, read from the rollups kept by analytics.py.
+        """
+        if not Post.objects.filter(pk=post_id).exists():
+            return Response({"error": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+        return stance_trend_response(request, 'post', post_id)
+
+
+class PromptStanceView(APIView):
+    @cached_response(ttl=settings.ANALYTICS_CACHE_TTL, tags=lambda kwargs: [f"prompt:{kwargs['prompt_id']}", stance_tag('prompt', kwargs['prompt_id'])])
+    def get(self, request, prompt_id):
+        """
+        How a prompt's posts, the replies to them and their votes moved over
+        time, as for a post.
+        """
+        if not Prompt.objects.filter(pk=prompt_id).exists():
+            return Response({"error": "Prompt not found."}, status=status.HTTP_404_NOT_FOUND)
+        return stance_trend_response(request, 'prompt', prompt_id)
+
+
+class CategoryStanceView(APIView):
+    @cached_response(ttl=settings.ANALYTICS_CACHE_TTL, tags=lambda kwargs: ["prompts", stance_tag('category', kwargs['category'])])
+    def get(self, request, category):
+        """
+        How the posts on a category's prompts, the replies to them and their
+        votes moved over time, as for a post.
+        """
+        if not Prompt.objects.filter(Category=category).exists():
+            return Response({"error": "No prompts found for this category."}, status=status.HTTP_404_NOT_FOUND)
+        return stance_trend_response(request, 'category', category)
+
+
+class SearchView(APIView):
+    @replica_reads
+    def get(self, request):
+        """
+        Full-text search over posts, replies or prompts.
+
+        ?q= takes words, "quoted phrases", OR and -excluded words.
+        ?type= is posts (the default), replies or prompts. ?category= keeps
+        results whose prompt is in that category. ?sort= is rank (best match
+        first among the most recent matches, the default; see search.py) or
+        recent. Posts support ?expand= as on
+        /posts/, replies ?expand=author. Each result carries its `Rank`.
+        """
+        query = request.query_params.get('q', '').strip()
+        if not query:
+            return Response({"error": "Missing search query."}, status=status.HTTP_400_BAD_REQUEST)
+        category = request.query_params.get('category')
+        # Postgres text cannot hold NUL; it would fail in the query as a 500
+        if '\x00' in query or (category and '\x00' in category):
+            return Response({"error": "Search terms cannot contain NUL characters."}, status=status.HTTP_400_BAD_REQUEST)
+        kind = request.query_params.get('type', 'posts')
+        sort = request.query_params.get('sort', 'rank')
+        if kind not in SEARCH_MODELS:
+            return Response({"error": "Invalid type. Use 'posts', 'replies' or 'prompts'."}, status=status.HTTP_400_BAD_REQUEST)
+        if sort not in ('rank', 'recent'):
+            return Response({"error": "Invalid sort. Use 'rank' or 'recent'."}, status=status.HTTP_400_BAD_REQUEST)
+
+        results = search_queryset(SEARCH_MODELS[kind], query, category, ranked=sort == 'rank')
+        if kind == 'posts':
+            expand = parse_expand(request, POST_EXPANSIONS)
+            results, serializer_class = expand_posts(results, expand), PostSerializer
+        elif kind == 'replies':
+            expand = parse_expand(request, REPLY_EXPANSIONS)
+            results, serializer_class = expand_replies(results, expand), ReplySerializer
+        else:
+            expand, serializer_class = set(), PromptSerializer
+
+        paginator = search_paginators[(kind, sort)]
+        try:
+            page, next_cursor = paginator.paginate(results, request)
+        except InvalidCursor:
+            return Response({"error": "Invalid cursor."}, status=status.HTTP_400_BAD_REQUEST)
+
+        data = serializer_class(page, many=True, context={'expand': expand}).data
+        for item, row in zip(data, page):
+            item['Rank'] = row.Rank
+        return paginator.get_paginated_response(data, next_cursor, request, key="results")
+
+
+class CacheStatsView(APIView):
+    def get(self, request):
+        """
+        Response cache hit and miss counts of the serving process, per cached view.
+        """
+        return Response({"views": get_cache_stats()}, status=status.HTTP_200_OK)
+
+
+class MetricsView(APIView):
+    def get(self, request):
+        """
+        Request metrics of the serving process, per URL name, for Prometheus to scrape.
+        """
+        return HttpResponse(format_metrics(), content_type=PROMETHEUS_CONTENT_TYPE)
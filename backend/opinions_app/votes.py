@@ -0,0 +1,306 @@
+import atexit
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import close_old_connections, connection, transaction
+from django.utils import timezone
+
+from .analytics import adjust_rollups, vote_rollup_events
+from .daily import apply_daily_score_deltas
+from .events import publish_votes
+from .models import Post
+from .response_cache import invalidate_on_commit
+from .user_stats import adjust_user_stats, vote_stats_deltas
+
+logger = logging.getLogger(__name__)
+
+VOTE_TYPES = ('upvote', 'downvote')
+
+INSERT_VOTE = """
+INSERT INTO votes (post_id, user_id, vote_type, created_at)
+VALUES (%s, %s, %s, NOW())
+ON CONFLICT (user_id, post_id) DO NOTHING
+RETURNING voteid;
+"""
+
+SWITCH_VOTE = """
+UPDATE votes
+SET vote_type = %s
+WHERE post_id = %s AND user_id = %s AND vote_type <> %s;
+"""
+
+# Records many users' votes at once. Only new and switched votes are
+# returned; a new row is one whose xmax (deleting transaction) is still 0.
+UPSERT_VOTES = """
+INSERT INTO votes (post_id, user_id, vote_type, created_at)
+VALUES {values}
+ON CONFLICT (user_id, post_id) DO UPDATE
+SET vote_type = EXCLUDED.vote_type
+WHERE votes.vote_type <> EXCLUDED.vote_type
+RETURNING post_id, vote_type, xmax = 0 AS inserted;
+"""
+
+APPLY_VOTE_DELTAS = """
+UPDATE posts
+SET upvote_count = posts.upvote_count + deltas.up,
+    downvote_count = posts.downvote_count + deltas.down
+FROM (VALUES {values}) AS deltas (postid, up, down)
+WHERE posts.postid = deltas.postid
+RETURNING posts.postid, posts.user_id, deltas.up, deltas.down, posts.prompt_id, posts.upvote_count, posts.downvote_count;
+"""
+
+
+def _vote_delta(vote_type, switched=False):
+    """
+    (upvotes, downvotes) change caused by a vote. A switched vote also takes
+    back the user's previous vote of the other type.
+    """
+    if vote_type == 'upvote':
+        return (1, -1) if switched else (1, 0)
+    return (-1, 1) if switched else (0, 1)
+
+
+def _dedup_vote(post_id, user_id, vote_type):
+    """
+    Record the user's vote in the votes table and return the count change it
+    causes, or None when the user had already cast this exact vote.
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(INSERT_VOTE, [post_id, user_id, vote_type])
+        if cursor.fetchone():
+            return _vote_delta(vote_type)
+
+        # The user already voted on this post: switch their vote if it differs
+        cursor.execute(SWITCH_VOTE, [vote_type, post_id, user_id, vote_type])
+        if cursor.rowcount:
+            return _vote_delta(vote_type, switched=True)
+    return None
+
+
+def apply_vote_deltas(deltas, stats_deltas=None):
+    """
+    Add {post_id: (upvotes, downvotes)} to the post counters with a single
+    database-side UPDATE, so concurrent writers can never lose increments.
+    The post authors' vote totals in user_stats, the posts' daily response
+    scores and their stance rollups move by the same amounts, and subscribers
+    of the posts and their prompts are sent the new counts.
+
+    `stats_deltas` are further adjust_user_stats() deltas written by the same
+    statement as the vote totals, so that a transaction changing both locks
+    each user_stats row once and in order.
+    Returns the number of posts updated.
+    """
+    deltas = {post_id: delta for post_id, delta in deltas.items() if any(delta)}
+    if not deltas:
+        adjust_user_stats(stats_deltas or {})
+        return 0
+
+    # Sorted so that concurrent batches lock rows in the same order
+    rows = sorted(deltas.items())
+    values = ', '.join(['(%s, %s, %s)'] * len(rows))
+    params = [value for post_id, (up, down) in rows for value in (post_id, up, down)]
+    with connection.cursor() as cursor:
+        cursor.execute(APPLY_VOTE_DELTAS.format(values=values), params)
+        updated = cursor.fetchall()
+
+    stats = vote_stats_deltas((author_id, (up, down)) for _, author_id, up, down, _, _, _ in updated)
+    for user_id, fields in (stats_deltas or {}).items():
+        for field, delta in fields.items():
+            stats[user_id][field] = stats[user_id].get(field, 0) + delta
+    adjust_user_stats(stats)
+    # Posts without a prompt cannot be daily responses
+    apply_daily_score_deltas({post_id: up - down for post_id, _, up, down, prompt_id, _, _ in updated if prompt_id})
+    adjust_rollups(vote_rollup_events([(post_id, prompt_id, up, down) for post_id, _, up, down, prompt_id, _, _ in updated], timezone.now()))
+    # Counter updates bypass the model signals, so invalidate cached responses here
+    invalidate_on_commit(*[f'post:{post_id}' for post_id, *_ in updated])
+    for post_id, _, _, _, prompt_id, upvotes, downvotes in updated:
+        publish_votes(post_id, prompt_id, upvotes, downvotes)
+    return len(updated)
+
+
+def record_votes(votes, stats_deltas=None):
+    """
+    Count many votes at once, given as [(post_id, vote_type, user_id or None), ...]
+    in the order they were cast. The result is the same as calling record_vote()
+    for each in turn: a user's votes on one post collapse to the last. The
+    votes table is written with one INSERT ... ON CONFLICT and the counters
+    with one grouped UPDATE, bypassing the write-behind buffer. `stats_deltas`
+    are passed on to apply_vote_deltas().
+
+    Call it in a transaction. Raises IntegrityError when a post or user does not exist.
+    """
+    deltas = defaultdict(lambda: [0, 0])
+    last_votes = {}
+    for post_id, vote_type, user_id in votes:
+        if user_id:
+            last_votes[(user_id, post_id)] = vote_type
+        else:
+            up, down = _vote_delta(vote_type)
+            deltas[post_id][0] += up
+            deltas[post_id][1] += down
+
+    if last_votes:
+        # Sorted so that concurrent batches lock rows in the same order
+        rows = sorted(last_votes.items())
+        params = [value for (user_id, post_id), vote_type in rows for value in (post_id, user_id, vote_type)]
+        with connection.cursor() as cursor:
+            cursor.execute(UPSERT_VOTES.format(values=', '.join(['(%s, %s, %s, NOW())'] * len(rows))), params)
+            for post_id, vote_type, inserted in cursor.fetchall():
+                up, down = _vote_delta(vote_type, switched=not inserted)
+                deltas[post_id][0] += up
+                deltas[post_id][1] += down
+
+    return apply_vote_deltas({post_id: tuple(delta) for post_id, delta in deltas.items()}, stats_deltas)
+
+
+class VoteBuffer:
+    """
+    Write-behind buffer for the vote counters of hot posts.
+
+    Once a post receives more than `hot_threshold` votes within one flush
+    interval, further vote deltas for it are summed in memory and written by a
+    background thread with one batched UPDATE, instead of every voter queueing
+    on the post's row lock. Dedup rows in `votes` are still written
+    synchronously, so idempotency does not depend on the buffer.
+    """
+
+    def __init__(self, interval=None, hot_threshold=None, max_pending=None):
+        self.interval = interval if interval is not None else settings.VOTE_FLUSH_INTERVAL
+        self.hot_threshold = hot_threshold if hot_threshold is not None else settings.VOTE_HOT_THRESHOLD
+        self.max_pending = max_pending if max_pending is not None else settings.VOTE_FLUSH_MAX_PENDING
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.pending = defaultdict(lambda: [0, 0])
+        self.window = defaultdict(int)  # Votes per post seen in the current interval
+        self.window_started = time.monotonic()
+        self.thread = None
+        self.stopped = threading.Event()
+        self.wake = threading.Event()  # Set to flush before the interval is up
+
+    def is_hot(self, post_id):
+        with self.lock:
+            now = time.monotonic()
+            if now - self.window_started >= self.interval:
+                self.window.clear()
+                self.window_started = now
+            self.window[post_id] += 1
+            return post_id in self.pending or self.window[post_id] > self.hot_threshold
+
+    def add(self, post_id, delta):
+        with self.lock:
+            counts = self.pending[post_id]
+            counts[0] += delta[0]
+            counts[1] += delta[1]
+            full = len(self.pending) >= self.max_pending
+        self._ensure_started()
+        if full:
+            # Flushed by the background thread: the vote is already recorded,
+            # and a failed flush must not fail the request that added it
+            self.wake.set()
+
+    def pending_delta(self, post_id):
+        with self.lock:
+            counts = self.pending.get(post_id)
+            return tuple(counts) if counts else (0, 0)
+
+    def flush(self):
+        """
+        Write all buffered deltas to the database. Returns the number of posts updated.
+        """
+        with self.flush_lock:
+            with self.lock:
+                batch = {post_id: tuple(counts) for post_id, counts in self.pending.items()}
+                self.pending.clear()
+            if not batch:
+                return 0
+            try:
+                with transaction.atomic():
+                    return apply_vote_deltas(batch)
+            except Exception:
+                # Put the deltas back so the next flush retries them
+                logger.exception("Failed to flush %d buffered vote deltas", len(batch))
+                with self.lock:
+                    for post_id, (up, down) in batch.items():
+                        self.pending[post_id][0] += up
+                        self.pending[post_id][1] += down
+                raise
+
+    def stop(self):
+        self.stopped.set()
+        self.wake.set()
+        self.flush()
+
+    def _ensure_started(self):
+        if self.thread is not None:
+            return
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='vote-buffer', daemon=True)
+                self.thread.start()
+                atexit.register(self.stop)
+
+    def _run(self):
+        while True:
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            if self.stopped.is_set():
+                return
+            try:
+                self.flush()
+            except Exception:
+                pass  # Already logged; retried on the next tick
+            finally:
+                close_old_connections()
+
+
+vote_buffer = None
+vote_buffer_lock = threading.Lock()
+
+
+def get_vote_buffer():
+    global vote_buffer
+    with vote_buffer_lock:
+        if vote_buffer is None:
+            vote_buffer = VoteBuffer()
+    return vote_buffer
+
+
+def record_vote(post_id, vote_type, user_id=None, write_behind=None):
+    """
+    Count an upvote or downvote on a post and return the updated Post.
+
+    When `user_id` is given the vote is deduplicated through the votes table:
+    repeating a vote is a no-op and voting the other way switches the vote.
+    Counters are always changed with database-side increments. Hot posts go
+    through the write-behind buffer when VOTE_WRITE_BEHIND is enabled.
+
+    Raises Post.DoesNotExist, or IntegrityError when the user does not exist.
+    """
+    if write_behind is None:
+        write_behind = settings.VOTE_WRITE_BEHIND
+    buffer = get_vote_buffer() if write_behind else None
+
+    if buffer is not None and buffer.is_hot(post_id):
+        post = Post.objects.get(pk=post_id)
+        delta = _dedup_vote(post_id, user_id, vote_type) if user_id else _vote_delta(vote_type)
+        if delta:
+            buffer.add(post_id, delta)
+        # Show the voter the counts including votes that are not flushed yet
+        up, down = buffer.pending_delta(post_id)
+        post.UpvoteCount += up
+        post.DownvoteCount += down
+        return post
+
+    with transaction.atomic():
+        if user_id:
+            if not Post.objects.filter(pk=post_id).exists():
+                raise Post.DoesNotExist
+            delta = _dedup_vote(post_id, user_id, vote_type)
+        else:
+            delta = _vote_delta(vote_type)
+        if delta and not apply_vote_deltas({post_id: delta}):
+            raise Post.DoesNotExist
+    return Post.objects.get(pk=post_id)